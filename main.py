@@ -1,2142 +1,2976 @@
 import asyncio
+import contextvars
+import functools
 import os
 import json
 import datetime
 import logging
+import re
+import time
+import random
+import socket
+import struct
+import ipaddress
+import hashlib
+import heapq
+import io
+import unicodedata
 import aiohttp
 import urllib.parse
+from aiohttp import web
+from collections import deque, OrderedDict
 from astrbot.api.all import AstrMessageEvent, CommandResult, Context, Plain
+from astrbot.api import AstrBotConfig
 import astrbot.api.event.filter as filter
 from astrbot.api.star import register, Star
 
+# Pillow为可选依赖，未安装时卡片统一走html_render
+try:
+    from PIL import Image as PILImage, ImageDraw, ImageFont
+except ImportError:
+    PILImage = None
+
 logger = logging.getLogger("astrbot")
 
+# 内容审核使用的AI接口与提示词
+MODERATION_API_URL = "https://api.jkyai.top/API/depsek3.2.php"
+MODERATION_SYSTEM_PROMPT = "你是一个专业的合规内容审核助手，请严格检测以下文本中是否包含违规内容。\n\n违规词范围包括但不限于：\n\n暴力、血腥、恐怖内容\n\n仇恨、歧视、人身攻击言论\n\n违法、违禁品或行为引导\n\n政治敏感、不当言论\n\n色情、低俗、性暗示内容\n\n虚假信息、不实谣言\n\n诈骗、广告、恶意推广\n\n泄露隐私、他人信息\n\n链接一概不允许\n\n其他违反公序良俗的内容\n\n请按以下步骤处理：\n\n1. 逐句或分段分析文本内容；\n2. 如发现疑似违规词或内容则输出：false\n3. 如果内容安全则输出：true\n4. 并且给出拦截原因，比如如果是链接就输出：包含链接！！\n   如果是骂人则输出：不当言论！！\n   如果是骂人和链接一起就输出：包含链接和不当言论！！\n5. 并且按照恶劣程度给出违规分数，1-10分\n\n输出格式要求：\n<安全状态>\n<拦截原因（如果安全则为空）>\n<违规分数（如果安全则为0）>\n\n例如：\nfalse\n不当言论！！\n8\n\n或：\ntrue\n\n0"
 
-@register("D-G-N-C-J", "Tinyxi", "早晚安记录+王者战力查询+城际路线查询+AI绘画", "1.0.0", "")
-class Main(Star):
-    def __init__(self, context: Context) -> None:
-        super().__init__(context)
-        self.PLUGIN_NAME = "astrbot_plugin_essential"
-        PLUGIN_NAME = self.PLUGIN_NAME
+MODERATION_BATCH_PROMPT = "你是一个专业的合规内容审核助手，请严格检测以下多段文本中是否包含违规内容。\n\n违规词范围包括但不限于：\n\n暴力、血腥、恐怖内容\n\n仇恨、歧视、人身攻击言论\n\n违法、违禁品或行为引导\n\n政治敏感、不当言论\n\n色情、低俗、性暗示内容\n\n虚假信息、不实谣言\n\n诈骗、广告、恶意推广\n\n泄露隐私、他人信息\n\n链接一概不允许\n\n其他违反公序良俗的内容\n\n每段文本以【序号】开头，请逐段独立审核，每段只输出一行，格式为：\n<序号>|<安全状态true或false>|<拦截原因（如果安全则为空）>|<违规分数1-10（如果安全则为0）>\n\n例如：\n1|false|不当言论！！|8\n2|true||0"
 
-        if not os.path.exists(f"data/{PLUGIN_NAME}_data.json"):
-            with open(f"data/{PLUGIN_NAME}_data.json", "w", encoding="utf-8") as f:
-                f.write(json.dumps({}, ensure_ascii=False, indent=2))
-        with open(f"data/{PLUGIN_NAME}_data.json", "r", encoding="utf-8") as f:
-            self.data = json.loads(f.read())
-        self.good_morning_data = self.data.get("good_morning", {})
+# 批量审核结果行：序号|安全状态|拦截原因|违规分数
+MODERATION_BATCH_LINE_PATTERN = re.compile(r"^\s*(\d+)\s*[|｜]\s*(true|false)\s*[|｜]\s*(.*?)\s*[|｜]\s*(\d+)\s*$", re.IGNORECASE)
 
-        self.daily_sleep_cache = {}
-        self.good_morning_cd = {} 
+# 本地预审核内置违规词库，配置项 moderation_block_words 中的词会追加到这里
+DEFAULT_MODERATION_BLOCK_WORDS = [
+    "傻逼", "傻b", "煞笔", "nmsl", "cnm", "tmd", "操你", "草泥马", "你妈死",
+    "去死", "滚你妈", "狗日", "杂种", "贱人", "婊子",
+    "约炮", "裸聊", "色情", "黄片", "援交",
+    "赌博", "博彩", "网赌", "代开发票", "刷单", "兼职日结", "加微信", "vx号",
+    "冰毒", "大麻", "海洛因", "枪支", "炸药",
+]
 
-    def get_cached_sleep_count(self, umo_id: str, date_str: str) -> int:
-        """获取缓存的睡觉人数"""
-        if umo_id not in self.daily_sleep_cache:
-            self.daily_sleep_cache[umo_id] = {}
-        return self.daily_sleep_cache[umo_id].get(date_str, -1)
+# 链接检测：协议链接、www开头以及常见顶级域名结尾的裸域名
+URL_PATTERN = re.compile(
+    r"(?:https?|ftp)://\S+"
+    r"|www\.\S+"
+    r"|[a-z0-9][a-z0-9\-]*(?:\.[a-z0-9\-]+)*\.(?:com|cn|net|org|top|xyz|cc|me|io|info|vip|shop|club|site|online|icu|ink|fun|tk|ml|ga|cf|gq)\b",
+    re.IGNORECASE,
+)
 
-    def update_sleep_cache(self, umo_id: str, date_str: str, count: int):
-        """更新睡觉人数缓存"""
-        if umo_id not in self.daily_sleep_cache:
-            self.daily_sleep_cache[umo_id] = {}
-        self.daily_sleep_cache[umo_id][date_str] = count
+# 连续5位以上数字视为可能的QQ号/手机号等隐私信息
+PRIVATE_NUMBER_PATTERN = re.compile(r"\d{5,}")
 
-    def invalidate_sleep_cache(self, umo_id: str, date_str: str):
-        """使缓存失效"""
-        if umo_id in self.daily_sleep_cache and date_str in self.daily_sleep_cache[umo_id]:
-            del self.daily_sleep_cache[umo_id][date_str]
+# 中日韩文字，以及与其相邻的空白（匹配违规词前去掉，防止用空格拆开中文违规词）
+CJK_PATTERN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+CJK_SPACING_PATTERN = re.compile(r"\s+(?=[\u3400-\u9fff\uf900-\ufaff])|(?<=[\u3400-\u9fff\uf900-\ufaff])\s+")
 
-    def check_good_morning_cd(self, user_id: str, current_time: datetime.datetime) -> bool:
-        """检查用户是否在CD中，返回True表示在CD中"""
-        if user_id not in self.good_morning_cd:
+
+class AhoCorasickMatcher:
+    """Aho-Corasick多模式匹配自动机，一次扫描找出文本中命中的所有词"""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for word in words:
+            word = word.strip().casefold()
+            if word:
+                self.add_word(word)
+        self.build()
+
+    def add_word(self, word: str):
+        """将词插入字典树"""
+        state = 0
+        for ch in word:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][ch] = next_state
+            state = next_state
+        self.output[state].append(word)
+
+    def build(self):
+        """广度优先构建失败指针，并合并后缀节点的输出"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and ch not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(ch, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> set:
+        """返回文本中命中的所有词"""
+        hits = set()
+        state = 0
+        for ch in text.casefold():
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            if self.output[state]:
+                hits.update(self.output[state])
+        return hits
+
+
+class ModerationPreFilter:
+    """本地内容预审核，明显违规或明显安全的文本直接给出结论，其余返回None交给AI审核"""
+
+    def __init__(self, block_words, safe_max_length: int = 0):
+        words = [word.strip().casefold() for word in block_words if word.strip()]
+        # 纯英文数字的词（如tmd）按单词边界匹配，避免命中tmdb这类正常单词
+        ascii_words = [word for word in words if word.isascii()]
+        self.matcher = AhoCorasickMatcher([word for word in words if not word.isascii()])
+        self.ascii_pattern = None
+        if ascii_words:
+            self.ascii_pattern = re.compile(
+                r"(?<![a-z0-9])(?:" + "|".join(map(re.escape, ascii_words)) + r")(?![a-z0-9])")
+        self.safe_max_length = safe_max_length
+
+    def check(self, text: str):
+        """返回审核结论字典 {"safe", "reason", "score", "source"}，无法判断时返回None"""
+        # 只去掉中文旁边的空白，防止用空格拆开中文违规词，英文单词之间的空格保留
+        compact = CJK_SPACING_PATTERN.sub("", text)
+        has_link = bool(URL_PATTERN.search(text))
+        hit_words = self.matcher.find_all(compact)
+        if self.ascii_pattern is not None:
+            hit_words.update(self.ascii_pattern.findall(compact.casefold()))
+
+        if has_link or hit_words:
+            if has_link and hit_words:
+                reason = "包含链接和不当言论！！"
+            elif has_link:
+                reason = "包含链接！！"
+            else:
+                reason = "不当言论！！"
+            score = min(10, (5 if has_link else 0) + (5 + len(hit_words) if hit_words else 0))
+            return {"safe": False, "reason": reason, "score": score, "source": "local"}
+
+        # 不含中文的短文本且不含疑似隐私数字时视为明显安全，中文短句也可能是词库外的辱骂，仍交给AI审核
+        if (len(compact) <= self.safe_max_length and not CJK_PATTERN.search(compact)
+                and not PRIVATE_NUMBER_PATTERN.search(compact)):
+            return {"safe": True, "reason": "", "score": 0, "source": "local"}
+
+        return None
+
+
+class TTLCache:
+    """带过期时间和容量上限的LRU缓存"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """读取缓存，过期的条目会被删除"""
+        item = self.data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self.data[key]
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self.data[key] = (expires_at, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self.data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+def normalize_text_key(text: str) -> str:
+    """文本归一化（全半角、大小写、空白）后取哈希，作为缓存键"""
+    normalized = " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def moderation_severity(score: int) -> str:
+    """根据违规分数计算违规程度"""
+    if score >= 7:
+        return "非常恶劣"
+    elif score >= 4:
+        return "中度恶劣"
+    elif score >= 1:
+        return "轻度恶劣"
+    return "无"
+
+
+# 耗时直方图的分桶上限（秒），对应Prometheus的le标签
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 指令各阶段在状态报告中的名称
+METRICS_PHASES = {"parse": "解析", "upstream": "上游", "moderation": "审核", "render": "渲染", "send": "发送"}
+
+
+def format_metric_line(name: str, labels, value) -> str:
+    """按Prometheus文本格式输出一行指标"""
+    labels = dict(labels)
+    if not labels:
+        return f"{name} {value}"
+    escaped = ",".join(
+        '{}="{}"'.format(key, str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, label in labels.items()
+    )
+    return f"{name}{{{escaped}}} {value}"
+
+
+class Histogram:
+    """累计分桶直方图，另保留最近的样本用于计算分位数"""
+
+    def __init__(self):
+        self.buckets = [0] * len(METRICS_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=200)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.samples.append(seconds)
+        for index, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+    def percentile(self, p: float) -> int:
+        """最近样本的分位数（毫秒）"""
+        samples = sorted(self.samples)
+        if not samples:
+            return 0
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000)
+
+
+class MetricsRegistry:
+    """进程内指标：带标签的耗时直方图和计数器，可导出为Prometheus文本格式"""
+
+    def __init__(self, max_series: int = 2000):
+        # (指标名, 标签元组) -> Histogram / 计数
+        self.histograms = {}
+        self.counters = {}
+        # 标签组合数上限，防止异常输入让指标无限增长
+        self.max_series = max_series
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            if len(self.histograms) >= self.max_series:
+                return
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+    def inc(self, name: str, amount: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.counters and len(self.counters) >= self.max_series:
+            return
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def merged(self, name: str, **match) -> Histogram:
+        """合并标签匹配的所有序列，用于按指令或按域名汇总"""
+        merged = Histogram()
+        merged.samples = deque(maxlen=None)
+        for (metric, labels), histogram in self.histograms.items():
+            labels = dict(labels)
+            if metric == name and all(labels.get(key) == value for key, value in match.items()):
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+                merged.samples.extend(histogram.samples)
+                merged.buckets = [a + b for a, b in zip(merged.buckets, histogram.buckets)]
+        return merged
+
+    def label_values(self, name: str, label: str) -> list:
+        """指标中出现过的某个标签的所有取值，按首次出现顺序"""
+        values = {}
+        for metric, labels in list(self.histograms) + list(self.counters):
+            labels = dict(labels)
+            if metric == name and label in labels:
+                values.setdefault(labels[label], None)
+        return list(values)
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        lines = []
+        for name in sorted({metric for metric, _ in self.counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in self.counters.items():
+                if metric == name:
+                    lines.append(format_metric_line(name, labels, value))
+        for name in sorted({metric for metric, _ in self.histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in self.histograms.items():
+                if metric != name:
+                    continue
+                for bound, count in zip(METRICS_BUCKETS, histogram.buckets):
+                    lines.append(format_metric_line(f"{name}_bucket", labels + (("le", str(bound)),), count))
+                lines.append(format_metric_line(f"{name}_bucket", labels + (("le", "+Inf"),), histogram.count))
+                lines.append(format_metric_line(f"{name}_sum", labels, round(histogram.sum, 6)))
+                lines.append(format_metric_line(f"{name}_count", labels, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+# 当前正在处理的指令，上游请求、内容审核和渲染通过它记录各阶段耗时
+CURRENT_COMMAND = contextvars.ContextVar("toolbox_current_command", default=None)
+
+
+class CommandTrace:
+    """单条指令的耗时记录：第一个阶段开始前的时间计为解析阶段"""
+
+    def __init__(self, metrics: MetricsRegistry, command: str):
+        self.metrics = metrics
+        self.command = command
+        self.started = time.monotonic()
+        self.parsed = False
+
+    def record(self, phase: str, started: float, **labels):
+        if not self.parsed:
+            self.parsed = True
+            self.metrics.observe("toolbox_phase_seconds", max(0, started - self.started),
+                                 command=self.command, phase="parse")
+        self.metrics.observe("toolbox_phase_seconds", time.monotonic() - started,
+                             command=self.command, phase=phase, **labels)
+
+    def error(self, source: str, error: Exception):
+        self.metrics.inc("toolbox_errors_total", command=self.command, source=source, type=type(error).__name__)
+
+
+def record_phase(phase: str, started: float, **labels):
+    """把从started到现在的耗时记入当前指令的阶段直方图，不在指令处理中时忽略"""
+    trace = CURRENT_COMMAND.get()
+    if trace is not None:
+        trace.record(phase, started, **labels)
+
+
+def record_error(source: str, error: Exception):
+    """按来源和异常类型计入当前指令的错误数，不在指令处理中时忽略"""
+    trace = CURRENT_COMMAND.get()
+    if trace is not None:
+        trace.error(source, error)
+
+
+def instrumented(command: str):
+    """指令耗时埋点：处理函数执行期间设置CURRENT_COMMAND，并记录发送阶段、总耗时和处理函数抛出的异常"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(self, message, *args, **kwargs):
+            trace = CommandTrace(self.metrics, command)
+            replies = handler(self, message, *args, **kwargs)
+            try:
+                while True:
+                    token = CURRENT_COMMAND.set(trace)
+                    try:
+                        result = await replies.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        trace.error("指令", e)
+                        raise
+                    finally:
+                        CURRENT_COMMAND.reset(token)
+                    # 框架发送完这条回复后才会继续执行处理函数
+                    sent = time.monotonic()
+                    yield result
+                    trace.record("send", sent)
+            finally:
+                await replies.aclose()
+                self.metrics.observe("toolbox_command_seconds", time.monotonic() - trace.started, command=command)
+        return wrapper
+    return decorator
+
+
+class ModerationService:
+    """统一内容审核服务：本地预审核、结论缓存、同文本请求合并、批量审核与并发限制"""
+
+    def __init__(self, prefilter: ModerationPreFilter, cache: TTLCache, fetch,
+                 max_concurrency: int = 4, batch_size: int = 8, batch_window: float = 0.05):
+        self.prefilter = prefilter
+        self.cache = cache
+        # 提交审核提示词的请求函数：fetch(表单) -> 文本
+        self.fetch = fetch
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        # 等待合并发送的审核条目：[缓存键, 文本, future, 入队时间]
+        self.pending = []
+        self.inflight = {}
+        self.flush_handle = None
+        self.tasks = set()
+
+    async def close(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def moderate(self, text: str, timeout: float = None):
+        """审核入口：本地预审核 -> 结论缓存 -> AI审核，审核失败或超过timeout秒时返回None；耗时计入当前指令的审核阶段"""
+        start = time.monotonic()
+        try:
+            verdict = self.prefilter.check(text)
+            if verdict is not None:
+                return {**verdict, "latency_ms": round((time.monotonic() - start) * 1000, 2)}
+
+            cache_key = normalize_text_key(text)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "source": "cache", "latency_ms": round((time.monotonic() - start) * 1000, 2)}
+
+            # 相同内容正在审核时直接等待同一个结果
+            future = self.inflight.get(cache_key)
+            if future is None:
+                future = asyncio.get_running_loop().create_future()
+                self.inflight[cache_key] = future
+                self.pending.append([cache_key, text, future, start])
+                if len(self.pending) >= self.batch_size:
+                    self.flush()
+                elif self.flush_handle is None:
+                    self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+
+            try:
+                verdict = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                # 审核仍在后台进行，结论会写入缓存
+                logger.warning("内容审核超出指令时间预算")
+                return None
+            if verdict is None:
+                return None
+            return {**verdict, "latency_ms": round((time.monotonic() - start) * 1000, 2)}
+        finally:
+            record_phase("moderation", start)
+
+    def flush(self):
+        """把等待中的条目按批次大小拆分后发出"""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            # 一批审核由多条指令共享，在空白上下文中运行，上游耗时和错误不计入触发发送的那条指令
+            task = contextvars.Context().run(asyncio.create_task, self.run_batch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, batch):
+        try:
+            if len(batch) == 1:
+                verdicts = [await self.request_single(batch[0][1])]
+            else:
+                verdicts = await self.request_batch([item[1] for item in batch])
+                # 批量结果中缺失或格式异常的条目单独重审
+                retry_indexes = [i for i, verdict in enumerate(verdicts) if verdict is None]
+                if retry_indexes:
+                    retried = await asyncio.gather(*(self.request_single(batch[i][1]) for i in retry_indexes))
+                    for i, verdict in zip(retry_indexes, retried):
+                        verdicts[i] = verdict
+        except Exception as e:
+            logger.error(f"AI审核过程中发生错误：{e}")
+            verdicts = [None] * len(batch)
+
+        for (cache_key, _, future, start), verdict in zip(batch, verdicts):
+            self.inflight.pop(cache_key, None)
+            if verdict is not None:
+                self.cache.set(cache_key, verdict)
+                logger.debug(f"AI审核完成，结论：{verdict['safe']}，批量大小：{len(batch)}，耗时：{(time.monotonic() - start) * 1000:.0f}ms")
+            if not future.done():
+                future.set_result(verdict)
+
+    async def post_question(self, question: str):
+        """以请求体方式提交审核提示词，失败时返回None"""
+        async with self.semaphore:
+            try:
+                return (await self.fetch({"question": question, "type": "text"})).strip()
+            except UpstreamError as ai_e:
+                logger.warning(f"AI审核失败：{ai_e}")
+                return None
+            except Exception as ai_e:
+                logger.error(f"AI审核过程中发生错误：{ai_e}")
+                return None
+
+    async def request_single(self, text: str):
+        ai_result = await self.post_question(f"{MODERATION_SYSTEM_PROMPT}\n\n需要审核的文本：\n{text}")
+        if ai_result is None:
+            return None
+        return self.parse_verdict(ai_result)
+
+    async def request_batch(self, texts: list) -> list:
+        """多段文本合并为一次AI请求，返回与输入顺序一致的结论列表；
+        同一序号出现相互矛盾的结论时整批作废，由调用方逐条重审"""
+        segments = "\n\n".join(f"【{i}】\n{self.neutralize(text)}" for i, text in enumerate(texts, 1))
+        ai_result = await self.post_question(f"{MODERATION_BATCH_PROMPT}\n\n需要审核的文本：\n{segments}")
+        verdicts = [None] * len(texts)
+        if ai_result is None:
+            return verdicts
+
+        for line in ai_result.split('\n'):
+            match = MODERATION_BATCH_LINE_PATTERN.match(line)
+            if not match:
+                continue
+            index = int(match.group(1)) - 1
+            if not 0 <= index < len(texts):
+                continue
+            verdict = {
+                "safe": match.group(2).lower() == "true",
+                "reason": match.group(3),
+                "score": int(match.group(4)),
+                "source": "llm",
+            }
+            # 每个序号只采用第一行结论，出现矛盾说明提交的文本可能在伪造其他序号的结论
+            if verdicts[index] is None:
+                verdicts[index] = verdict
+            elif verdicts[index]["safe"] != verdict["safe"]:
+                logger.warning(f"批量审核结果中序号 {index + 1} 的结论相互矛盾，整批改为逐条审核")
+                return [None] * len(texts)
+        return verdicts
+
+    @staticmethod
+    def neutralize(text: str) -> str:
+        """替换待审核文本中的分段标记和结论分隔符，防止一段文本伪造其他段落的审核结论"""
+        return text.replace("【", "[").replace("】", "]").replace("|", "/").replace("｜", "/")
+
+    @staticmethod
+    def parse_verdict(ai_result: str):
+        """解析单条审核结果，格式异常时返回None"""
+        ai_lines = ai_result.split('\n')
+        # 提取安全状态
+        safety_status = ai_lines[0].strip().lower()
+        if safety_status not in ("true", "false"):
+            logger.warning(f"AI审核结果格式异常：{ai_result}")
+            return None
+
+        # 提取拦截原因（如果存在）
+        intercept_reason = ai_lines[1].strip() if len(ai_lines) > 1 else ""
+
+        # 提取违规分数（如果存在）
+        violation_score = 0
+        if len(ai_lines) > 2:
+            try:
+                violation_score = int(ai_lines[2].strip())
+            except ValueError:
+                violation_score = 0
+
+        return {
+            "safe": safety_status == "true",
+            "reason": intercept_reason,
+            "score": violation_score,
+            "source": "llm",
+        }
+
+
+MC_DEFAULT_PORT = 25565
+# 现代握手协议版本号，-1 表示由服务器返回自身支持的版本
+MC_PROTOCOL_VERSION = -1
+
+
+def parse_server_address(address: str):
+    """解析服务器地址，返回 (主机, 端口)，未指定端口时端口为None"""
+    address = address.strip()
+    if not address:
+        raise ValueError("服务器地址为空")
+    if address.startswith("["):
+        # IPv6格式：[::1]:25565
+        host, _, rest = address[1:].partition("]")
+        port_text = rest[1:] if rest.startswith(":") else ""
+    elif address.count(":") == 1:
+        host, port_text = address.split(":")
+    else:
+        host, port_text = address, ""
+    if not host:
+        raise ValueError("服务器地址为空")
+    if port_text:
+        if not port_text.isdigit() or not 0 < int(port_text) < 65536:
+            raise ValueError(f"端口格式错误：{port_text}")
+        return host, int(port_text)
+    return host, None
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def encode_varint(value: int) -> bytes:
+    """编码Minecraft协议的VarInt"""
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def pack_mc_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return encode_varint(len(data)) + data
+
+
+def pack_mc_packet(packet_id: int, payload: bytes) -> bytes:
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_varint(reader: asyncio.StreamReader) -> int:
+    value = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt过长")
+
+
+def decode_varint(data: bytes, offset: int = 0):
+    """从字节串中解码VarInt，返回 (值, 新偏移)"""
+    value = 0
+    for i in range(5):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, offset
+    raise ValueError("VarInt过长")
+
+
+def flatten_mc_text(component) -> str:
+    """把聊天组件格式的MOTD展平为纯文本"""
+    if isinstance(component, str):
+        return re.sub(r"§.", "", component)
+    if isinstance(component, list):
+        return "".join(flatten_mc_text(part) for part in component)
+    if isinstance(component, dict):
+        return flatten_mc_text(component.get("text", "")) + "".join(
+            flatten_mc_text(part) for part in component.get("extra", [])
+        )
+    return ""
+
+
+def build_dns_query(name: str, qtype: int = 33):
+    """构造DNS查询报文，返回 (事务ID, 报文)，qtype=33 为SRV记录"""
+    txid = random.randint(0, 0xFFFF)
+    header = struct.pack(">HHHHHH", txid, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(
+        len(label).to_bytes(1, "big") + label
+        for label in name.rstrip(".").encode("idna").split(b".")
+    ) + b"\x00"
+    return txid, header + qname + struct.pack(">HH", qtype, 1)
+
+
+def read_dns_name(data: bytes, offset: int):
+    """读取DNS报文中的域名（支持压缩指针），返回 (域名, 新偏移)"""
+    labels = []
+    end_offset = None
+    for _ in range(128):
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end_offset is None:
+                end_offset = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    return ".".join(labels), (end_offset if end_offset is not None else offset)
+
+
+def parse_srv_response(data: bytes, txid: int) -> list:
+    """解析SRV查询响应，返回 [(优先级, 权重, 端口, 目标主机, TTL)]"""
+    resp_id, flags, qdcount, ancount, _, _ = struct.unpack(">HHHHHH", data[:12])
+    if resp_id != txid or flags & 0x000F:
+        return []
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = read_dns_name(data, offset)
+        offset += 4
+    records = []
+    for _ in range(ancount):
+        _, offset = read_dns_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack(">HHIH", data[offset:offset + 10])
+        offset += 10
+        if rtype == 33:
+            priority, weight, port = struct.unpack(">HHH", data[offset:offset + 6])
+            target, _ = read_dns_name(data, offset + 6)
+            records.append((priority, weight, port, target, ttl))
+        offset += rdlength
+    return records
+
+
+class DnsQueryProtocol(asyncio.DatagramProtocol):
+    """单次UDP DNS查询"""
+
+    def __init__(self, payload: bytes, future: asyncio.Future):
+        self.payload = payload
+        self.future = future
+
+    def connection_made(self, transport):
+        transport.sendto(self.payload)
+
+    def datagram_received(self, data, addr):
+        if not self.future.done():
+            self.future.set_result(data)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+def system_nameserver() -> str:
+    """读取系统DNS服务器地址，读取失败时使用公共DNS"""
+    try:
+        with open("/etc/resolv.conf", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parts[1]
+    except OSError:
+        pass
+    return "223.5.5.5"
+
+
+class MinecraftStatusClient:
+    """原生Minecraft服务器列表Ping客户端，支持SRV解析和旧版Ping回退"""
+
+    def __init__(self, timeout: float = 5, dns_server: str = ""):
+        self.timeout = timeout
+        self.dns_server = dns_server or system_nameserver()
+        self.srv_cache = TTLCache(maxsize=512, ttl=300)
+
+    async def resolve_srv(self, host: str, timeout: float):
+        """查询 _minecraft._tcp SRV记录，返回 (目标主机, 端口)，无记录时返回None"""
+        cached = self.srv_cache.get(host)
+        if cached is not None:
+            return cached or None
+
+        txid, payload = build_dns_query(f"_minecraft._tcp.{host}")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        transport = None
+        result = ()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: DnsQueryProtocol(payload, future), remote_addr=(self.dns_server, 53)
+            )
+            records = parse_srv_response(await asyncio.wait_for(future, timeout), txid)
+            if records:
+                priority, weight, port, target, ttl = sorted(records, key=lambda r: (r[0], -r[1]))[0]
+                result = (target.rstrip("."), port)
+                self.srv_cache.set(host, result, ttl=max(ttl, 30))
+            else:
+                self.srv_cache.set(host, ())
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError, struct.error) as e:
+            logger.debug(f"SRV记录查询失败：{host}，{e}")
+        finally:
+            if transport is not None:
+                transport.close()
+        return result or None
+
+    async def ping_modern(self, host: str, port: int, timeout: float, server_host: str = "") -> dict:
+        """1.7+ 状态协议：握手和状态请求一次发出，读取一个状态响应包"""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            handshake = pack_mc_packet(
+                0x00,
+                encode_varint(MC_PROTOCOL_VERSION) + pack_mc_string(server_host or host) + struct.pack(">H", port) + encode_varint(1),
+            )
+            writer.write(handshake + pack_mc_packet(0x00, b""))
+            await writer.drain()
+
+            async def read_response():
+                length = await read_varint(reader)
+                packet = await reader.readexactly(length)
+                packet_id, offset = decode_varint(packet)
+                if packet_id != 0x00:
+                    raise ValueError(f"意外的数据包ID：{packet_id}")
+                text_length, offset = decode_varint(packet, offset)
+                return json.loads(packet[offset:offset + text_length].decode("utf-8"))
+
+            data = await asyncio.wait_for(read_response(), timeout)
+        finally:
+            writer.close()
+
+        players = data.get("players") or {}
+        version = data.get("version") or {}
+        return {
+            "online": True,
+            "players": players.get("online", 0),
+            "max_players": players.get("max", 0),
+            "version": version.get("name", "未知"),
+            "protocol": version.get("protocol"),
+            "motd": flatten_mc_text(data.get("description", "")),
+        }
+
+    async def ping_legacy(self, host: str, port: int, timeout: float, server_host: str = "") -> dict:
+        """1.4-1.6 旧版Ping（0xFE 0x01），同时兼容更老服务器的响应格式"""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            writer.write(b"\xfe\x01")
+            await writer.drain()
+
+            async def read_response():
+                header = await reader.readexactly(3)
+                if header[0] != 0xFF:
+                    raise ValueError("旧版Ping响应格式错误")
+                length = struct.unpack(">H", header[1:])[0]
+                return (await reader.readexactly(length * 2)).decode("utf-16-be")
+
+            text = await asyncio.wait_for(read_response(), timeout)
+        finally:
+            writer.close()
+
+        if text.startswith("§1\x00"):
+            _, protocol, version, motd, online, max_players = text.split("\x00")[:6]
+        else:
+            motd, online, max_players = text.rsplit("§", 2)
+            protocol, version = None, "1.3及更早"
+        return {
+            "online": True,
+            "players": int(online),
+            "max_players": int(max_players),
+            "version": version,
+            "protocol": protocol,
+            "motd": re.sub(r"§.", "", motd),
+        }
+
+    async def status(self, address: str, timeout: float = None) -> dict:
+        """查询服务器状态，超时或无法连接时返回离线结果，地址格式错误时抛出ValueError；
+        SRV解析、地址解析、新版和旧版Ping共用同一个截止时间，总耗时不超过timeout"""
+        timeout = timeout or self.timeout
+        host, port = parse_server_address(address)
+        deadline = time.monotonic() + timeout
+        result = {
+            "online": False,
+            "ip": host,
+            "port": port or MC_DEFAULT_PORT,
+            "players": 0,
+            "max_players": 0,
+            "version": "未知",
+            "motd": "",
+            "latency_ms": None,
+        }
+
+        # 未指定端口的域名先查SRV记录
+        target_host, target_port = host, port or MC_DEFAULT_PORT
+        if port is None and not is_ip_address(host):
+            srv = await self.resolve_srv(host, min(2.0, timeout / 2))
+            if srv:
+                target_host, target_port = srv
+
+        try:
+            loop = asyncio.get_running_loop()
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(target_host, target_port, type=socket.SOCK_STREAM),
+                deadline - time.monotonic(),
+            )
+            ip = infos[0][4][0]
+        except (OSError, asyncio.TimeoutError) as e:
+            logger.debug(f"Minecraft服务器地址解析失败：{target_host}，{e}")
+            return result
+        result["ip"], result["port"] = ip, target_port
+
+        start = time.monotonic()
+        for ping in (self.ping_modern, self.ping_legacy):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # 握手中携带原始域名，兼容按域名分流的代理端；连接和读取分别计时，外层再限制总时间
+                result.update(await asyncio.wait_for(ping(ip, target_port, remaining, target_host), remaining))
+                result["latency_ms"] = round((time.monotonic() - start) * 1000)
+                return result
+            except ConnectionRefusedError:
+                # 端口未开放时旧版Ping同样无法连接
+                break
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, UnicodeDecodeError) as e:
+                logger.debug(f"Minecraft服务器{ping.__name__}失败：{address}，{e}")
+        return result
+
+
+class ProxyPool:
+    """socks5代理池：后台预取代理、并发健康检查并按延迟排序"""
+
+    def __init__(self, fetcher, size: int = 10, check_target: str = "www.baidu.com:80",
+                 check_timeout: float = 5, fetch_concurrency: int = 5):
+        # 从上游获取一个代理的请求函数：fetcher() -> 接口返回的字典
+        self.fetcher = fetcher
+        self.size = size
+        self.check_host, _, check_port = check_target.rpartition(":")
+        self.check_port = int(check_port) if check_port.isdigit() else 80
+        if not self.check_host:
+            self.check_host = check_target
+        self.check_timeout = check_timeout
+        self.fetch_concurrency = fetch_concurrency
+        # 代理地址 -> {"proxy", "type", "time", "latency_ms", "checked_at"}
+        self.entries = {}
+        self.lock = asyncio.Lock()
+
+    def live_entries(self) -> list:
+        """按延迟从低到高返回存活的代理"""
+        return sorted(self.entries.values(), key=lambda entry: entry["latency_ms"])
+
+    def pick(self, top: int = 3):
+        """从延迟最低的几个代理中随机取一个，避免所有人拿到同一个代理"""
+        entries = self.live_entries()[:max(1, top)]
+        return random.choice(entries) if entries else None
+
+    async def fetch_one(self):
+        """从上游接口获取一个代理，失败时返回None"""
+        try:
+            result = await self.fetcher()
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError, ValueError) as e:
+            logger.debug(f"预取代理IP失败：{e}")
+            return None
+        if not result.get("proxy"):
+            return None
+        return {
+            "proxy": result.get("proxy"),
+            "type": result.get("type", "socks5"),
+            "time": result.get("time", "未知"),
+        }
+
+    async def check(self, proxy: str):
+        """socks5握手并通过代理连接检查目标，返回延迟毫秒数，不可用时返回None"""
+        host, _, port = proxy.rpartition(":")
+        if not host or not port.isdigit():
+            return None
+        start = time.monotonic()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.check_timeout)
+
+            async def handshake():
+                # 无认证方式协商
+                writer.write(b"\x05\x01\x00")
+                await writer.drain()
+                if await reader.readexactly(2) != b"\x05\x00":
+                    raise ValueError("socks5协商失败")
+                # 通过代理连接检查目标
+                target = self.check_host.encode("idna")
+                writer.write(b"\x05\x01\x00\x03" + bytes([len(target)]) + target + struct.pack(">H", self.check_port))
+                await writer.drain()
+                reply = await reader.readexactly(4)
+                if reply[1] != 0x00:
+                    raise ValueError(f"socks5连接目标失败：{reply[1]}")
+
+            await asyncio.wait_for(handshake(), max(0.1, self.check_timeout - (time.monotonic() - start)))
+            return round((time.monotonic() - start) * 1000)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.debug(f"代理 {proxy} 健康检查失败：{e}")
+            return None
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def check_entries(self, entries: list):
+        """并发检查代理，存活的写入代理池，失效的移出代理池"""
+        latencies = await asyncio.gather(*(self.check(entry["proxy"]) for entry in entries))
+        checked_at = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+        for entry, latency in zip(entries, latencies):
+            if latency is None:
+                self.entries.pop(entry["proxy"], None)
+            else:
+                self.entries[entry["proxy"]] = {**entry, "latency_ms": latency, "checked_at": checked_at}
+
+    async def refresh(self):
+        """复查池内代理并补充新代理到目标数量"""
+        async with self.lock:
+            await self.check_entries(list(self.entries.values()))
+            missing = self.size - len(self.entries)
+            if missing <= 0:
+                return
+            # 上游每次只返回一个代理，并发多取一些以抵消不可用的代理
+            fetched = await asyncio.gather(
+                *(self.fetch_one() for _ in range(min(missing * 2, self.fetch_concurrency * 2)))
+            )
+            candidates = {}
+            for entry in fetched:
+                if entry is not None and entry["proxy"] not in self.entries:
+                    candidates[entry["proxy"]] = entry
+            await self.check_entries(list(candidates.values()))
+            # 超出目标数量时只保留延迟最低的代理
+            for entry in self.live_entries()[self.size:]:
+                self.entries.pop(entry["proxy"], None)
+
+
+# 油价按省级行政区调整，定时任务拉取这些地区的油价
+OIL_PRICE_REGIONS = [
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江",
+    "安徽", "福建", "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州",
+    "云南", "陕西", "甘肃", "青海", "内蒙古", "广西", "西藏", "宁夏", "新疆",
+]
+
+# 地名归一化时去掉的行政区划后缀，长的放前面
+REGION_SUFFIXES = (
+    "维吾尔自治区", "壮族自治区", "回族自治区", "特别行政区", "自治区", "自治州", "地区", "省", "市", "县", "区", "盟",
+)
+
+
+def normalize_region_name(name: str) -> str:
+    """去掉空白和行政区划后缀，使“广州市”和“广州”得到同一个名字"""
+    name = re.sub(r"\s+", "", name)
+    for suffix in REGION_SUFFIXES:
+        if name.endswith(suffix) and len(name) > len(suffix) + 1:
+            return name[:-len(suffix)]
+    return name
+
+
+def parse_oil_prices(data: list) -> dict:
+    """从油价接口的data列表中提取各型号油价"""
+    oil_prices = {}
+    for item in data:
+        oil_type = item.get("type", "")
+        price = item.get("price", 0)
+        # 提取油价类型，如"92#汽油"、"95#汽油"等
+        if "92#" in oil_type:
+            oil_prices["92"] = price
+        elif "95#" in oil_type:
+            oil_prices["95"] = price
+        elif "98#" in oil_type:
+            oil_prices["98"] = price
+        elif "0#" in oil_type:
+            oil_prices["0"] = price
+    return oil_prices
+
+
+def oil_prices_from_tianapi(result: dict) -> dict:
+    """把天行数据油价接口的返回转换为parse_oil_prices的格式"""
+    data = result.get("result", {})
+    return {oil_type: data[f"p{oil_type}"] for oil_type in ("92", "95", "98", "0") if data.get(f"p{oil_type}")}
+
+
+def weather_from_wttr(result: dict, city: str) -> dict:
+    """把wttr.in的j1格式转换为天气卡片使用的字段（该接口没有空气质量和生活指数）"""
+    current = (result.get("current_condition") or [{}])[0]
+    descriptions = current.get("lang_zh") or current.get("weatherDesc") or [{}]
+    # 观测时间形如 2024-05-01 09:00 AM，转换为与默认接口一致的24小时制
+    report_time = current.get("localObsDateTime", "")
+    try:
+        report_time = datetime.datetime.strptime(report_time, "%Y-%m-%d %I:%M %p").strftime("%Y-%m-%d %H:%M")
+    except ValueError:
+        pass
+    return {
+        "city": city,
+        "report_time": report_time,
+        "weather": descriptions[0].get("value", ""),
+        "temperature": current.get("temp_C", 0),
+        "wind_direction": current.get("winddir16Point", ""),
+        "wind_power": f"{current.get('windspeedKmph', 0)}km/h",
+        "humidity": current.get("humidity", 0),
+        "feels_like": current.get("FeelsLikeC", 0),
+        "visibility": current.get("visibility", 0),
+        "pressure": current.get("pressure", 0),
+        "uv": current.get("uvIndex", 0),
+        "aqi": "-",
+        "precipitation": current.get("precipMM", 0),
+        "cloud": current.get("cloudcover", 0),
+        "life_indices": {},
+    }
+
+
+def mc_status_from_uapis(result: dict, address: str) -> dict:
+    """把uapis服务器状态接口的返回转换为MinecraftStatusClient.status的格式"""
+    host, port = parse_server_address(address)
+    return {
+        "online": bool(result.get("online")),
+        "ip": result.get("ip", host),
+        "port": result.get("port", port or MC_DEFAULT_PORT),
+        "players": result.get("players", 0),
+        "max_players": result.get("max_players", 0),
+        "version": result.get("version", "未知"),
+        "motd": result.get("motd", ""),
+        "latency_ms": None,
+    }
+
+
+class OilPriceTable:
+    """全国油价内存表：地区名别名索引 + 调价历史，并保存磁盘快照"""
+
+    HISTORY_LIMIT = 10
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        # 地区名 -> {"prices": {...}, "updated": "..."}
+        self.rows = {}
+        # 地区名 -> [{"date": "...", "prices": {...}}]，只记录价格变化的快照
+        self.history = {}
+        self.refreshed_date = ""
+        self.aliases = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.loads(f.read())
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"读取油价快照失败：{e}")
+            return
+        self.rows = snapshot.get("rows", {})
+        self.history = snapshot.get("history", {})
+        self.refreshed_date = snapshot.get("refreshed_date", "")
+        for city in self.rows:
+            self.aliases[normalize_region_name(city)] = city
+
+    def save(self):
+        snapshot = {"refreshed_date": self.refreshed_date, "rows": self.rows, "history": self.history}
+        with open(self.snapshot_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False))
+
+    def lookup(self, name: str):
+        """按地区名或别名查找，返回 (地区名, 行数据)，找不到时返回None"""
+        city = self.aliases.get(normalize_region_name(name))
+        if city is None:
+            return None
+        return city, self.rows[city]
+
+    def update(self, city: str, prices: dict, date_str: str):
+        """写入一个地区的油价，价格与上一次不同时追加到历史"""
+        city = normalize_region_name(city)
+        self.rows[city] = {"prices": prices, "updated": date_str}
+        self.aliases[city] = city
+        history = self.history.setdefault(city, [])
+        if not history or history[-1]["prices"] != prices:
+            history.append({"date": date_str, "prices": prices})
+            del history[:-self.HISTORY_LIMIT]
+
+    def trend(self, city: str) -> str:
+        """根据最近两次调价计算92#汽油的涨跌"""
+        history = self.history.get(city, [])
+        if len(history) < 2:
+            return "暂无调价记录"
+        try:
+            current = float(history[-1]["prices"].get("92", 0))
+            previous = float(history[-2]["prices"].get("92", 0))
+        except (TypeError, ValueError):
+            return "暂无调价记录"
+        diff = round(current - previous, 2)
+        if diff > 0:
+            return f"{history[-1]['date']} 调价，92#汽油上涨 {diff} 元/升"
+        elif diff < 0:
+            return f"{history[-1]['date']} 调价，92#汽油下跌 {-diff} 元/升"
+        return f"{history[-1]['date']} 调价，92#汽油价格持平"
+
+
+class LazyPayload:
+    """延迟格式化的日志内容，只有日志真正输出时才序列化并截断"""
+
+    __slots__ = ("payload", "max_length")
+
+    def __init__(self, payload, max_length: int):
+        self.payload = payload
+        self.max_length = max_length
+
+    def __str__(self):
+        payload = self.payload
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", "replace")
+        elif not isinstance(payload, str):
+            try:
+                payload = json.dumps(payload, ensure_ascii=False, default=str)
+            except (TypeError, ValueError):
+                payload = repr(payload)
+        if len(payload) > self.max_length:
+            return f"{payload[:self.max_length]}...(共{len(payload)}字符)"
+        return payload
+
+
+class UpstreamPayloadLogger:
+    """上游原始数据调试日志：仅DEBUG级别生效，按采样率记录并截断过长内容"""
+
+    def __init__(self, sample_rate: float = 1.0, max_length: int = 500):
+        self.sample_rate = sample_rate
+        self.max_length = max_length
+
+    def log(self, tag: str, payload, **fields):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        logger.debug(
+            "上游数据[%s] %s：%s",
+            tag,
+            LazyPayload(fields, self.max_length),
+            LazyPayload(payload, self.max_length),
+        )
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+
+class JobQueueTimeout(Exception):
+    """任务排队超时被取消"""
+
+
+class FairJobQueue:
+    """限制全局并发的任务队列，按 群 -> 用户 两级轮转调度，保证各群、各用户公平"""
+
+    def __init__(self, concurrency: int = 2, max_wait: float = 300, max_queue: int = 50, per_user_max: int = 2):
+        self.concurrency = max(1, concurrency)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.per_user_max = per_user_max
+        # 群 -> 用户 -> 排队中的任务
+        self.groups = OrderedDict()
+        self.queued = 0
+        self.running = 0
+        self.tasks = set()
+
+    def iter_order(self):
+        """按调度顺序遍历排队中的任务（不修改队列）"""
+        groups = [(group, [list(jobs) for jobs in users.values()]) for group, users in self.groups.items()]
+        while groups:
+            group, users = groups.pop(0)
+            jobs = users.pop(0)
+            yield jobs.pop(0)
+            if jobs:
+                users.append(jobs)
+            if users:
+                groups.append((group, users))
+
+    def position(self, job: dict):
+        """任务在队列中的位置（从0开始），已开始执行时返回None"""
+        for index, queued_job in enumerate(self.iter_order()):
+            if queued_job is job:
+                return index
+        return None
+
+    def submit(self, group_key: str, user_key: str, factory):
+        """提交任务，返回 (future, 排队位置)，立即开始执行时位置为None；队列已满时抛出JobQueueFull"""
+        if self.queued >= self.max_queue:
+            raise JobQueueFull(f"当前排队任务已达上限 {self.max_queue} 个，请稍后再试")
+        pending = len(self.groups.get(group_key, {}).get(user_key, ()))
+        if pending >= self.per_user_max:
+            raise JobQueueFull(f"你已有 {pending} 个任务在排队，请等待完成后再提交")
+        users = self.groups.setdefault(group_key, OrderedDict())
+        jobs = users.setdefault(user_key, deque())
+
+        loop = asyncio.get_running_loop()
+        job = {"factory": factory, "future": loop.create_future(), "group": group_key, "user": user_key}
+        jobs.append(job)
+        self.queued += 1
+        job["timer"] = loop.call_later(self.max_wait, self.expire, job)
+        self.pump()
+        return job["future"], self.position(job)
+
+    def remove(self, job: dict) -> bool:
+        users = self.groups.get(job["group"])
+        jobs = users.get(job["user"]) if users else None
+        if not jobs or job not in jobs:
             return False
-        
-        last_time = self.good_morning_cd[user_id]
-        time_diff = (current_time - last_time).total_seconds()
-        return time_diff < 1800
+        jobs.remove(job)
+        if not jobs:
+            del users[job["user"]]
+        if not users:
+            del self.groups[job["group"]]
+        self.queued -= 1
+        return True
 
-    def update_good_morning_cd(self, user_id: str, current_time: datetime.datetime):
-        """更新用户的CD时间"""
-        self.good_morning_cd[user_id] = current_time
-        
-    # 菜单样式的HTML模板
-    MENU_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>工具箱菜单</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background-color: #f5f5f5;
-                margin: 0;
-                padding: 20px;
-                line-height: 2.0;
-            }
-            .container {
-                max-width: 950px;
-                margin: 0 auto;
-                background-color: white;
-                padding: 40px;
-                border-radius: 12px;
-                box-shadow: 0 4px 15px rgba(0,0,0,0.15);
-            }
-            .menu-title {
-                font-size: 32px;
-                font-weight: bold;
-                color: #28a745;
-                text-align: center;
-                margin-bottom: 40px;
-                padding: 15px;
-                background-color: #e8f5e8;
-                border-radius: 8px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .category-title {
-                font-size: 24px;
-                font-weight: bold;
-                color: #17a2b8;
-                margin: 30px 0 20px 0;
-                padding: 10px 0;
-                border-bottom: 3px solid #17a2b8;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .menu-item {
-                font-size: 18px;
-                line-height: 2.2;
-                margin: 15px 0;
-                padding: 10px;
-                background-color: #f8f9fa;
-                border-radius: 8px;
-                border-left: 4px solid #ffc107;
-            }
-            .command-name {
-                font-weight: bold;
-                color: #dc3545;
-                font-size: 24px;
-            }
-            .command-format {
-                color: #dc3545;
-                font-weight: bold;
-                font-size: 20px;
-            }
-            .command-desc {
-                color: #495057;
-                font-weight: bold;
-            }
-            .example-section {
-                margin-top: 40px;
-                padding-top: 20px;
-                border-top: 2px solid #e9ecef;
-            }
-            .example-title {
-                font-size: 22px;
-                font-weight: bold;
-                color: #6f42c1;
-                margin-bottom: 20px;
-            }
-            .example-item {
-                font-size: 16px;
-                line-height: 1.8;
-                margin: 10px 0;
-                padding: 10px;
-                background-color: #e7f5ff;
-                border-radius: 6px;
-                border-left: 4px solid #007bff;
-            }
-            .note-section {
-                margin-top: 30px;
-                padding: 15px;
-                background-color: #fff3cd;
-                border: 1px solid #ffeeba;
-                border-radius: 6px;
-                color: #856404;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="menu-title">🔧 工具箱插件菜单 🔧</h1>
-            {{content}}
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 战力查询结果的HTML模板（支持四个战区）
-    HERO_POWER_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>王者荣耀战力查询</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 32px;
-                font-weight: bold;
-                text-align: center;
-                color: #e74c3c;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .hero-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #ecf0f1;
-                border-radius: 10px;
-            }
-            .hero-name {
-                font-size: 36px;
-                font-weight: bold;
-                color: #3498db;
-                margin-bottom: 10px;
-            }
-            .update-time {
-                font-size: 14px;
-                color: #7f8c8d;
-            }
-            .platforms-grid {
-                display: grid;
-                grid-template-columns: 1fr;
-                gap: 30px;
-                margin: 30px 0;
-            }
-            .platform-card {
-                background-color: #f8f9fa;
-                border-radius: 12px;
-                padding: 30px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-                border-top: 5px solid #3498db;
-            }
-            .platform-name {
-                font-size: 24px;
-                font-weight: bold;
-                color: #2c3e50;
-                text-align: center;
-                margin-bottom: 25px;
-                padding-bottom: 15px;
-                border-bottom: 2px solid #ecf0f1;
-            }
-            .power-list {
-                display: flex;
-                flex-direction: column;
-                gap: 15px;
-            }
-            .power-item {
-                background-color: white;
-                border-radius: 10px;
-                padding: 18px 25px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                border-left: 5px solid #e67e22;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                font-size: 18px;
-                font-weight: bold;
-            }
-            .power-section {
-                color: #e74c3c;
-                font-size: 20px;
-                font-weight: bold;
-            }
-            .power-region {
-                color: #3498db;
-                font-size: 18px;
-                font-weight: bold;
-            }
-            .power-num {
-                color: #27ae60;
-                font-size: 22px;
-                font-weight: bold;
-            }
-            .footer {
-                margin-top: 30px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">🏆 王者荣耀战力查询 🏆</h1>
-            <div class="hero-header">
-                <div class="hero-name">{{hero_name}}</div>
-                <div class="update-time">数据更新时间：{{updatetime}}</div>
-            </div>
-            <div class="platforms-grid">
-                <!-- Android QQ区 -->
-                <div class="platform-card">
-                    <div class="platform-name">📱 Android QQ</div>
-                    <div class="power-list">
-                        <div class="power-item">
-                            <span><span class="power-section">【国服】</span><span class="power-region">[全服]</span></span>
-                            <span class="power-num">{{aqq_guobiao}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【省】</span><span class="power-region">[{{aqq_province}}]</span></span>
-                            <span class="power-num">{{aqq_provincePower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【市】</span><span class="power-region">[{{aqq_city}}]</span></span>
-                            <span class="power-num">{{aqq_cityPower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【区】</span><span class="power-region">[{{aqq_area}}]</span></span>
-                            <span class="power-num">{{aqq_areaPower}}</span>
-                        </div>
-                    </div>
-                </div>
-                <!-- Android 微信区 -->
-                <div class="platform-card">
-                    <div class="platform-name">📱 Android 微信</div>
-                    <div class="power-list">
-                        <div class="power-item">
-                            <span><span class="power-section">【国服】</span><span class="power-region">[全服]</span></span>
-                            <span class="power-num">{{awx_guobiao}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【省】</span><span class="power-region">[{{awx_province}}]</span></span>
-                            <span class="power-num">{{awx_provincePower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【市】</span><span class="power-region">[{{awx_city}}]</span></span>
-                            <span class="power-num">{{awx_cityPower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【区】</span><span class="power-region">[{{awx_area}}]</span></span>
-                            <span class="power-num">{{awx_areaPower}}</span>
-                        </div>
-                    </div>
-                </div>
-                <!-- iOS QQ区 -->
-                <div class="platform-card">
-                    <div class="platform-name">🍎 iOS QQ</div>
-                    <div class="power-list">
-                        <div class="power-item">
-                            <span><span class="power-section">【国服】</span><span class="power-region">[全服]</span></span>
-                            <span class="power-num">{{iqq_guobiao}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【省】</span><span class="power-region">[{{iqq_province}}]</span></span>
-                            <span class="power-num">{{iqq_provincePower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【市】</span><span class="power-region">[{{iqq_city}}]</span></span>
-                            <span class="power-num">{{iqq_cityPower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【区】</span><span class="power-region">[{{iqq_area}}]</span></span>
-                            <span class="power-num">{{iqq_areaPower}}</span>
-                        </div>
-                    </div>
-                </div>
-                <!-- iOS 微信区 -->
-                <div class="platform-card">
-                    <div class="platform-name">🍎 iOS 微信</div>
-                    <div class="power-list">
-                        <div class="power-item">
-                            <span><span class="power-section">【国服】</span><span class="power-region">[全服]</span></span>
-                            <span class="power-num">{{iwx_guobiao}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【省】</span><span class="power-region">[{{iwx_province}}]</span></span>
-                            <span class="power-num">{{iwx_provincePower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【市】</span><span class="power-region">[{{iwx_city}}]</span></span>
-                            <span class="power-num">{{iwx_cityPower}}</span>
-                        </div>
-                        <div class="power-item">
-                            <span><span class="power-section">【区】</span><span class="power-region">[{{iwx_area}}]</span></span>
-                            <span class="power-num">{{iwx_areaPower}}</span>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：王者荣耀官方
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 路线查询结果的HTML模板
-    ROUTE_QUERY_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>城际路线查询</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 600px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 28px;
-                font-weight: bold;
-                text-align: center;
-                color: #3498db;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .route-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #e3f2fd;
-                border-radius: 10px;
-            }
-            .route-title {
-                font-size: 32px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 10px;
-            }
-            .route-desc {
-                font-size: 16px;
-                color: #666;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 15px;
-                margin: 30px 0;
-            }
-            .info-item {
-                background-color: #f8f9fa;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 5px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .info-value {
-                font-size: 22px;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .route-info {
-                margin-top: 20px;
-                padding: 20px;
-                background-color: #e8f5e8;
-                border-radius: 8px;
-                border-left: 5px solid #4caf50;
-            }
-            .route-info-label {
-                font-size: 16px;
-                font-weight: bold;
-                color: #2e7d32;
-                margin-bottom: 10px;
-            }
-            .route-info-content {
-                font-size: 18px;
-                color: #388e3c;
-            }
-            .road-conditions {
-                margin-top: 20px;
-                padding: 15px;
-                background-color: #fff3cd;
-                border: 1px solid #ffeeba;
-                border-radius: 6px;
-                color: #856404;
-            }
-            .footer {
-                margin-top: 30px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">🗺️ 城际路线查询 🗺️</h1>
-            <div class="route-header">
-                <div class="route-title">{{from_city}} → {{to_city}}</div>
-                <div class="route-desc">为您提供详细的城际出行信息</div>
-            </div>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">总距离</div>
-                    <div class="info-value">{{distance}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">总耗时</div>
-                    <div class="info-value">{{time}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">油费</div>
-                    <div class="info-value">{{fuelcosts}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">过桥费</div>
-                    <div class="info-value">{{bridgetoll}}</div>
-                </div>
-                <div class="info-item" style="grid-column: 1 / -1;">
-                    <div class="info-label">总费用</div>
-                    <div class="info-value">{{totalcost}}</div>
-                </div>
-            </div>
-            <div class="route-info">
-                <div class="route-info-label">推荐路线</div>
-                <div class="route-info-content">{{corese}}</div>
-            </div>
-            <div class="road-conditions">
-                <strong>路况信息：</strong>{{roadconditions}}
-            </div>
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业地图服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # Minecraft服务器查询结果的HTML模板
-    MC_SERVER_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Minecraft服务器状态</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #1e3c72 0%, #2a5298 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 600px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 28px;
-                font-weight: bold;
-                text-align: center;
-                color: #2196f3;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .server-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #e3f2fd;
-                border-radius: 10px;
-            }
-            .server-title {
-                font-size: 32px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 10px;
-            }
-            .server-desc {
-                font-size: 16px;
-                color: #666;
-            }
-            .status-indicator {
-                text-align: center;
-                margin-bottom: 30px;
-            }
-            .status-badge {
-                display: inline-block;
-                padding: 10px 20px;
-                border-radius: 25px;
-                font-size: 20px;
-                font-weight: bold;
-            }
-            .status-online {
-                background-color: #4caf50;
-                color: white;
-            }
-            .status-offline {
-                background-color: #f44336;
-                color: white;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 15px;
-                margin: 30px 0;
-            }
-            .info-item {
-                background-color: #f8f9fa;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 5px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .info-value {
-                font-size: 22px;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .footer {
-                margin-top: 30px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">🎮 Minecraft服务器状态 🎮</h1>
-            <div class="server-header">
-                <div class="server-title">{{server_addr}}</div>
-                <div class="server-desc">Minecraft服务器详细状态信息</div>
-            </div>
-            <div class="status-indicator">
-                <div class="status-badge status-{{online_status}}">{{online_text}}</div>
-            </div>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">IP地址</div>
-                    <div class="info-value">{{ip}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">端口</div>
-                    <div class="info-value">{{port}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">当前玩家</div>
-                    <div class="info-value">{{players}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">最大玩家</div>
-                    <div class="info-value">{{max_players}}</div>
-                </div>
-                <div class="info-item" style="grid-column: 1 / -1;">
-                    <div class="info-label">服务器版本</div>
-                    <div class="info-value">{{version}}</div>
-                </div>
-            </div>
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业游戏服务器监控服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 油价查询结果的HTML模板
-    OIL_PRICE_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>油价查询结果</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #ff6b6b 0%, #ee5a24 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 600px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 28px;
-                font-weight: bold;
-                text-align: center;
-                color: #c0392b;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .city-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #ffeaa7;
-                border-radius: 10px;
-            }
-            .city-name {
-                font-size: 32px;
-                font-weight: bold;
-                color: #d35400;
-                margin-bottom: 10px;
-            }
-            .city-desc {
-                font-size: 16px;
-                color: #666;
-            }
-            .trend-info {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 15px;
-                background-color: #e8f5e8;
-                border-radius: 8px;
-                border-left: 5px solid #4caf50;
-            }
-            .trend-label {
-                font-size: 18px;
-                font-weight: bold;
-                color: #2e7d32;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 15px;
-                margin: 30px 0;
-            }
-            .info-item {
-                background-color: #f8f9fa;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 5px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .info-value {
-                font-size: 22px;
-                font-weight: bold;
-                color: #e67e22;
-            }
-            .footer {
-                margin-top: 30px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">⛽ 油价查询结果 ⛽</h1>
-            <div class="city-header">
-                <div class="city-name">{{city_name}}</div>
-                <div class="city-desc">最新油价信息</div>
-            </div>
-            <div class="trend-info">
-                <div class="trend-label">趋势：前{{trend}}</div>
-            </div>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">92号汽油</div>
-                    <div class="info-value">{{oil_92}}元/升</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">95号汽油</div>
-                    <div class="info-value">{{oil_95}}元/升</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">98号汽油</div>
-                    <div class="info-value">{{oil_98}}元/升</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">0号柴油</div>
-                    <div class="info-value">{{oil_0}}元/升</div>
-                </div>
-            </div>
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业油价查询服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # QQ估价结果的HTML模板
-    QQ_VALUATION_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>QQ估价结果</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 700px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 28px;
-                font-weight: bold;
-                text-align: center;
-                color: #667eea;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .qq-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #e8f5e8;
-                border-radius: 10px;
-            }
-            .qq-number {
-                font-size: 32px;
-                font-weight: bold;
-                color: #2e7d32;
-                margin-bottom: 10px;
-            }
-            .qq-desc {
-                font-size: 16px;
-                color: #666;
-            }
-            .valuation-info {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #fff3cd;
-                border-radius: 10px;
-                border: 2px solid #ffc107;
-            }
-            .valuation-label {
-                font-size: 18px;
-                color: #856404;
-                margin-bottom: 10px;
-            }
-            .valuation-value {
-                font-size: 48px;
-                font-weight: bold;
-                color: #d35400;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: 1fr;
-                gap: 15px;
-                margin: 30px 0;
-            }
-            .info-item {
-                background-color: #f8f9fa;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 16px;
-                color: #7f8c8d;
-                margin-bottom: 10px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-                font-weight: bold;
-            }
-            .info-value {
-                font-size: 18px;
-                color: #2c3e50;
-                line-height: 1.8;
-            }
-            .jixiong-section {
-                margin: 30px 0;
-                padding: 20px;
-                background-color: #e3f2fd;
-                border-radius: 10px;
-                border-left: 5px solid #2196f3;
-            }
-            .jixiong-title {
-                font-size: 20px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 15px;
-            }
-            .jixiong-content {
-                font-size: 16px;
-                line-height: 1.8;
-                color: #333;
-            }
-            .analysis-section {
-                margin: 30px 0;
-                padding: 25px;
-                background-color: #f3e5f5;
-                border-radius: 10px;
-                border-left: 5px solid #9c27b0;
-            }
-            .analysis-title {
-                font-size: 20px;
-                font-weight: bold;
-                color: #7b1fa2;
-                margin-bottom: 20px;
-            }
-            .analysis-item {
-                margin: 15px 0;
-                padding: 15px;
-                background-color: white;
-                border-radius: 8px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            .analysis-label {
-                font-size: 16px;
-                font-weight: bold;
-                color: #6a1b9a;
-                margin-bottom: 8px;
-            }
-            .analysis-content {
-                font-size: 16px;
-                line-height: 1.8;
-                color: #333;
-            }
-            .footer {
-                margin-top: 30px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">💰 QQ估价结果 💰</h1>
-            <div class="qq-header">
-                <div class="qq-number">{{qq_number}}</div>
-                <div class="qq-desc">QQ号码详细估价信息</div>
-            </div>
-            <div class="valuation-info">
-                <div class="valuation-label">评估价值</div>
-                <div class="valuation-value">{{valuation}}元</div>
-            </div>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">特点</div>
-                    <div class="info-value">{{law}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">数字特征</div>
-                    <div class="info-value">{{digit}}</div>
-                </div>
-            </div>
-            
-            <!-- QQ测吉凶结果 -->
-            <div class="jixiong-section">
-                <div class="jixiong-title">📊 QQ号码吉凶分析</div>
-                <div class="jixiong-content">
-                    <div style="margin-bottom: 10px;"><strong>吉凶：</strong>{{jixiong_nature}}</div>
-                    <div style="margin-bottom: 10px;"><strong>数理：</strong>{{jixiong_number}}</div>
-                    <div style="margin-bottom: 10px;"><strong>名称：</strong>{{jixiong_title}}</div>
-                    <div><strong>含义：</strong>{{jixiong_meaning}}</div>
-                </div>
-            </div>
-            
-            <!-- AI综合分析 -->
-            <div class="analysis-section">
-                <div class="analysis-title">🤖 AI综合评估</div>
-                <div class="analysis-item">
-                    <div class="analysis-label">特点评估</div>
-                    <div class="analysis-content">{{analysis_features}}</div>
-                </div>
-                <div class="analysis-item">
-                    <div class="analysis-label">吉凶评估</div>
-                    <div class="analysis-content">{{analysis_jixiong}}</div>
-                </div>
-                <div class="analysis-item">
-                    <div class="analysis-label">总评估</div>
-                    <div class="analysis-content">{{analysis_total}}</div>
-                </div>
-            </div>
-            
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业QQ估价服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 天气查询结果的HTML模板
-    WEATHER_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>天气查询结果</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #87CEEB 0%, #4682B4 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 32px;
-                font-weight: bold;
-                text-align: center;
-                color: #4682B4;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .weather-header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #e3f2fd;
-                border-radius: 10px;
-            }
-            .city-name {
-                font-size: 36px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 10px;
-            }
-            .update-time {
-                font-size: 14px;
-                color: #7f8c8d;
-            }
-            .basic-info {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 20px;
-                margin: 30px 0;
-                text-align: center;
-            }
-            .weather-main {
-                grid-column: 1 / -1;
-                background-color: #f0f8ff;
-                padding: 30px;
-                border-radius: 10px;
-                border: 2px solid #87CEEB;
-            }
-            .weather-status {
-                font-size: 24px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 10px;
-            }
-            .temperature {
-                font-size: 64px;
-                font-weight: bold;
-                color: #ff5722;
-                margin: 20px 0;
-            }
-            .basic-details {
-                display: flex;
-                justify-content: space-around;
-                flex-wrap: wrap;
-                gap: 20px;
-                margin-top: 20px;
-            }
-            .detail-item {
-                font-size: 18px;
-                color: #666;
-            }
-            .detail-label {
-                font-weight: bold;
-                color: #4682B4;
-            }
-            .section-title {
-                font-size: 24px;
-                font-weight: bold;
-                color: #4682B4;
-                margin: 30px 0 20px 0;
-                padding-bottom: 10px;
-                border-bottom: 2px solid #87CEEB;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                gap: 15px;
-                margin: 20px 0;
-            }
-            .info-item {
-                background-color: #f8f9fa;
-                padding: 20px;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 10px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .info-value {
-                font-size: 20px;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .life-indices {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .index-item {
-                background-color: #f0f8ff;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                border-left: 5px solid #87CEEB;
-            }
-            .index-label {
-                font-size: 16px;
-                font-weight: bold;
-                color: #1976d2;
-                margin-bottom: 10px;
-            }
-            .index-level {
-                font-size: 18px;
-                font-weight: bold;
-                color: #ff5722;
-                margin-bottom: 5px;
-            }
-            .index-brief {
-                font-size: 16px;
-                color: #666;
-                margin-bottom: 10px;
-            }
-            .index-advice {
-                font-size: 14px;
-                color: #444;
-                line-height: 1.5;
-            }
-            .footer {
-                margin-top: 40px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">🌤️ 天气查询结果 🌤️</h1>
-            <div class="weather-header">
-                <div class="city-name">{{city}}</div>
-                <div class="update-time">数据更新时间：{{report_time}}</div>
-            </div>
-            
-            <div class="basic-info">
-                <div class="weather-main">
-                    <div class="weather-status">{{weather}}</div>
-                    <div class="temperature">{{temperature}}°C</div>
-                    <div class="basic-details">
-                        <div class="detail-item"><span class="detail-label">风向：</span>{{wind_direction}}</div>
-                        <div class="detail-item"><span class="detail-label">风力：</span>{{wind_power}}</div>
-                        <div class="detail-item"><span class="detail-label">湿度：</span>{{humidity}}%</div>
-                    </div>
-                </div>
-            </div>
-            
-            <h3 class="section-title">📊 扩展气象信息</h3>
-            <div class="info-grid">
-                <div class="info-item">
-                    <div class="info-label">体感温度</div>
-                    <div class="info-value">{{feels_like}}°C</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">能见度</div>
-                    <div class="info-value">{{visibility}} km</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">气压</div>
-                    <div class="info-value">{{pressure}} hPa</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">紫外线指数</div>
-                    <div class="info-value">{{uv}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">空气质量</div>
-                    <div class="info-value">{{aqi}}</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">降水量</div>
-                    <div class="info-value">{{precipitation}} mm</div>
-                </div>
-                <div class="info-item">
-                    <div class="info-label">云量</div>
-                    <div class="info-value">{{cloud}}%</div>
-                </div>
-            </div>
-            
-            <h3 class="section-title">📋 生活指数</h3>
-            <div class="life-indices">
-                <div class="index-item">
-                    <div class="index-label">穿衣指数</div>
-                    <div class="index-level">{{clothing_level}}</div>
-                    <div class="index-brief">{{clothing_brief}}</div>
-                    <div class="index-advice">{{clothing_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">紫外线指数</div>
-                    <div class="index-level">{{uv_level}}</div>
-                    <div class="index-brief">{{uv_brief}}</div>
-                    <div class="index-advice">{{uv_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">洗车指数</div>
-                    <div class="index-level">{{car_wash_level}}</div>
-                    <div class="index-brief">{{car_wash_brief}}</div>
-                    <div class="index-advice">{{car_wash_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">晾晒指数</div>
-                    <div class="index-level">{{drying_level}}</div>
-                    <div class="index-brief">{{drying_brief}}</div>
-                    <div class="index-advice">{{drying_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">空调指数</div>
-                    <div class="index-level">{{air_conditioner_level}}</div>
-                    <div class="index-brief">{{air_conditioner_brief}}</div>
-                    <div class="index-advice">{{air_conditioner_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">感冒指数</div>
-                    <div class="index-level">{{cold_risk_level}}</div>
-                    <div class="index-brief">{{cold_risk_brief}}</div>
-                    <div class="index-advice">{{cold_risk_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">运动指数</div>
-                    <div class="index-level">{{exercise_level}}</div>
-                    <div class="index-brief">{{exercise_brief}}</div>
-                    <div class="index-advice">{{exercise_advice}}</div>
-                </div>
-                <div class="index-item">
-                    <div class="index-label">舒适度指数</div>
-                    <div class="index-level">{{comfort_level}}</div>
-                    <div class="index-brief">{{comfort_brief}}</div>
-                    <div class="index-advice">{{comfort_advice}}</div>
-                </div>
-            </div>
-            
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业天气服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 实时科技资讯的HTML模板
-    TECH_NEWS_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>实时科技资讯</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 32px;
-                font-weight: bold;
-                text-align: center;
-                color: #667eea;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .header-info {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #f0f8ff;
-                border-radius: 10px;
-            }
-            .update-time {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 10px;
-            }
-            .news-count {
-                font-size: 18px;
-                font-weight: bold;
-                color: #667eea;
-            }
-            .news-list {
-                margin: 20px 0;
-            }
-            .news-item {
-                font-size: 16px;
-                line-height: 1.8;
-                margin: 15px 0;
-                padding: 15px;
-                background-color: #f8f9fa;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                border-left: 4px solid #667eea;
-            }
-            .news-time {
-                font-weight: bold;
-                color: #667eea;
-                margin-right: 15px;
-            }
-            .news-title {
-                color: #333;
-            }
-            .footer {
-                margin-top: 40px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">📱 实时科技资讯 📱</h1>
-            <div class="header-info">
-                <div class="update-time">更新时间：{{update_time}}</div>
-                <div class="news-count">共 {{news_count}} 条资讯</div>
-            </div>
-            <div class="news-list">
-                {% for news in news_list %}
-                <div class="news-item">
-                    <span class="news-time">{{news.time}}</span>
-                    <span class="news-title">{{news.title}}</span>
-                </div>
-                {% endfor %}
-            </div>
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业科技资讯服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 万年历和黄历结合的HTML模板
-    CALENDAR_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>万年历</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #ffecd2 0%, #fcb69f 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.8;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 36px;
-                font-weight: bold;
-                text-align: center;
-                color: #e67e22;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .header-section {
-                text-align: center;
-                margin-bottom: 40px;
-                padding: 25px;
-                background-color: #fff3cd;
-                border-radius: 12px;
-                border: 2px solid #ffeaa7;
-            }
-            .date-info {
-                display: flex;
-                justify-content: space-around;
-                align-items: center;
-                margin: 20px 0;
-                flex-wrap: wrap;
-                gap: 15px;
-            }
-            .date-main {
-                font-size: 48px;
-                font-weight: bold;
-                color: #e67e22;
-            }
-            .date-lunar {
-                font-size: 24px;
-                color: #8e44ad;
-                font-weight: bold;
-            }
-            .date-year {
-                font-size: 20px;
-                color: #27ae60;
-            }
-            .date-week {
-                font-size: 20px;
-                color: #3498db;
-            }
-            .date-animal {
-                font-size: 20px;
-                color: #e74c3c;
-            }
-            .festival {
-                font-size: 28px;
-                font-weight: bold;
-                color: #d35400;
-                margin: 15px 0;
-                text-align: center;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(350px, 1fr));
-                gap: 25px;
-                margin: 30px 0;
-            }
-            .info-card {
-                background-color: #f8f9fa;
-                border-radius: 12px;
-                padding: 25px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-                border-left: 5px solid #3498db;
-            }
-            .info-title {
-                font-size: 20px;
-                font-weight: bold;
-                color: #2c3e50;
-                margin-bottom: 20px;
-                padding-bottom: 10px;
-                border-bottom: 2px solid #3498db;
-            }
-            .info-item {
-                margin: 15px 0;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-            }
-            .info-label {
-                font-weight: bold;
-                color: #7f8c8d;
-                font-size: 16px;
-            }
-            .info-value {
-                color: #2c3e50;
-                font-size: 16px;
-                text-align: right;
-                flex: 1;
-                margin-left: 20px;
-            }
-            .yellow-info {
-                background-color: #fff9c4;
-                border-left-color: #ffc107;
-            }
-            .yellow-info .info-title {
-                border-bottom-color: #ffc107;
-            }
-            .suit-avoid {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 20px;
-                margin: 30px 0;
-            }
-            .suit, .avoid {
-                background-color: #e8f5e8;
-                border-radius: 12px;
-                padding: 20px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-            }
-            .avoid {
-                background-color: #ffebee;
-            }
-            .suit-title, .avoid-title {
-                font-size: 20px;
-                font-weight: bold;
-                color: #2e7d32;
-                margin-bottom: 15px;
-                text-align: center;
-            }
-            .avoid-title {
-                color: #c62828;
-            }
-            .suit-content, .avoid-content {
-                font-size: 16px;
-                line-height: 2.0;
-                color: #333;
-                text-align: center;
-            }
-            .huangli-info {
-                margin: 30px 0;
-                padding: 25px;
-                background-color: #f3e5f5;
-                border-radius: 12px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-                border: 2px solid #e1bee7;
-            }
-            .huangli-title {
-                font-size: 24px;
-                font-weight: bold;
-                color: #6a1b9a;
-                margin-bottom: 20px;
-                text-align: center;
-            }
-            .huangli-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-                gap: 20px;
-            }
-            .huangli-item {
-                text-align: center;
-                padding: 15px;
-                background-color: white;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .huangli-item-name {
-                font-weight: bold;
-                color: #7b1fa2;
-                margin-bottom: 8px;
-                font-size: 16px;
-            }
-            .huangli-item-value {
-                color: #2c3e50;
-                font-size: 15px;
-            }
-            .footer {
-                margin-top: 40px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">📅 万年历 📅</h1>
-            <div class="header-section">
-                <div class="festival">{{festival}}</div>
-                <div class="date-info">
-                    <div class="date-main">{{year}}年{{month}}月{{day}}日</div>
-                    <div class="date-lunar">{{lunarYear}}年{{lMonth}}{{lDate}}</div>
-                </div>
-                <div class="date-info">
-                    <div class="date-week">星期{{cnDay}}</div>
-                    <div class="date-animal">生肖：{{animal}}</div>
-                    <div class="date-year">干支：{{gzYear}}年{{gzMonth}}月{{gzDate}}日</div>
-                </div>
-            </div>
-            
-            <div class="suit-avoid">
-                <div class="suit">
-                    <div class="suit-title">宜</div>
-                    <div class="suit-content">{{suit}}</div>
-                </div>
-                <div class="avoid">
-                    <div class="avoid-title">忌</div>
-                    <div class="avoid-content">{{avoid}}</div>
-                </div>
-            </div>
-            
-            <div class="huangli-info">
-                <div class="huangli-title">黄历详情</div>
-                <div class="huangli-grid">
-                    {% for item in huangli_info %}
-                    <div class="huangli-item">
-                        <div class="huangli-item-name">{{item.name}}</div>
-                        <div class="huangli-item-value">{{item.index}}</div>
-                    </div>
-                    {% endfor %}
-                </div>
-            </div>
-            
-            <div class="info-grid">
-                <div class="info-card">
-                    <div class="info-title">基本信息</div>
-                    <div class="info-item">
-                        <div class="info-label">阳历日期</div>
-                        <div class="info-value">{{year}}年{{month}}月{{day}}日</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">农历日期</div>
-                        <div class="info-value">{{lunarYear}}年{{lunarMonth}}月{{lunarDate}}日</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">星期</div>
-                        <div class="info-value">星期{{cnDay}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">生肖</div>
-                        <div class="info-value">{{animal}}</div>
-                    </div>
-                </div>
-                
-                <div class="info-card yellow-info">
-                    <div class="info-title">干支信息</div>
-                    <div class="info-item">
-                        <div class="info-label">干支年</div>
-                        <div class="info-value">{{gzYear}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">干支月</div>
-                        <div class="info-value">{{gzMonth}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">干支日</div>
-                        <div class="info-value">{{gzDate}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">节气</div>
-                        <div class="info-value">{{term if term else '无'}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="footer">
-                数据来源：专业万年历服务 | 查询时间：{{current_time}}
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 历史上的今天结果的HTML模板
-    HISTORICAL_EVENTS_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>历史上的今天</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #FFD700 0%, #FFA500 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.8;
-                color: #333;
-            }
-            .container {
-                max-width: 900px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 15px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 36px;
-                font-weight: bold;
-                text-align: center;
-                color: #8B0000;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .header-info {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #FFF8DC;
-                border-radius: 10px;
-                border: 2px solid #FFD700;
-            }
-            .current-date {
-                font-size: 24px;
-                font-weight: bold;
-                color: #8B0000;
-                margin-bottom: 10px;
-            }
-            .events-count {
-                font-size: 18px;
-                color: #666;
-            }
-            .events-list {
-                margin: 30px 0;
-            }
-            .event-item {
-                font-size: 16px;
-                line-height: 1.8;
-                margin: 15px 0;
-                padding: 15px;
-                background-color: #F5F5F5;
-                border-radius: 8px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-                border-left: 4px solid #FFD700;
-            }
-            .footer {
-                margin-top: 40px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">📜 历史上的今天 📜</h1>
-            <div class="header-info">
-                <div class="current-date">{{current_date}}</div>
-                <div class="events-count">共 {{events_count}} 条历史事件</div>
-            </div>
-            
-            <div class="events-list">
-                {{events_html}}
-            </div>
-            
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业历史事件服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
-    
-    # 星座运势结果的HTML模板
-    CONSTELLATION_FORTUNE_TEMPLATE = '''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>星座运势</title>
-        <style>
-            body {
-                font-family: 'Microsoft YaHei', Arial, sans-serif;
-                background: linear-gradient(135deg, #ff9a9e 0%, #fecfef 50%, #fecfef 100%);
-                margin: 0;
-                padding: 30px;
-                line-height: 1.6;
-                color: #333;
-            }
-            .container {
-                max-width: 800px;
-                margin: 0 auto;
-                background-color: white;
-                border-radius: 20px;
-                padding: 40px;
-                box-shadow: 0 8px 32px rgba(0,0,0,0.15);
-            }
-            .title {
-                font-size: 36px;
-                font-weight: bold;
-                text-align: center;
-                color: #e74c3c;
-                margin-bottom: 30px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.1);
-            }
-            .header {
-                text-align: center;
-                margin-bottom: 30px;
-                padding: 20px;
-                background-color: #f8f9fa;
-                border-radius: 10px;
-            }
-            .constellation-name {
-                font-size: 42px;
-                font-weight: bold;
-                color: #3498db;
-                margin-bottom: 10px;
-            }
-            .constellation-info {
-                font-size: 18px;
-                color: #666;
-            }
-            .section {
-                margin: 30px 0;
-                padding: 25px;
-                background-color: #f8f9fa;
-                border-radius: 15px;
-                box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-            }
-            .section-title {
-                font-size: 24px;
-                font-weight: bold;
-                color: #2c3e50;
-                margin-bottom: 15px;
-                border-bottom: 2px solid #3498db;
-                padding-bottom: 10px;
-            }
-            .info-grid {
-                display: grid;
-                grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .info-item {
-                background-color: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .info-label {
-                font-size: 14px;
-                color: #7f8c8d;
-                margin-bottom: 10px;
-                text-transform: uppercase;
-                letter-spacing: 1px;
-            }
-            .info-value {
-                font-size: 18px;
-                font-weight: bold;
-                color: #2c3e50;
-            }
-            .fortune-grid {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .fortune-item {
-                background-color: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .fortune-label {
-                font-size: 16px;
-                font-weight: bold;
-                color: #3498db;
-                margin-bottom: 10px;
-            }
-            .fortune-value {
-                font-size: 18px;
-                color: #2c3e50;
-            }
-            .traits {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .trait-item {
-                background-color: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .trait-label {
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 10px;
-            }
-            .strengths {
-                color: #27ae60;
-            }
-            .weaknesses {
-                color: #e74c3c;
-            }
-            .matches {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .match-item {
-                background-color: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .match-label {
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 10px;
-            }
-            .best-match {
-                color: #d35400;
-            }
-            .good-match {
-                color: #27ae60;
-            }
-            .fair-match {
-                color: #f39c12;
-            }
-            .poor-match {
-                color: #e74c3c;
-            }
-            .lucky-info {
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 20px;
-                margin: 20px 0;
-            }
-            .lucky-item {
-                background-color: white;
-                padding: 20px;
-                border-radius: 10px;
-                box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            }
-            .lucky-label {
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 10px;
-            }
-            .advice {
-                background-color: #e8f5e8;
-                padding: 20px;
-                border-radius: 10px;
-                border-left: 5px solid #4caf50;
-                margin: 20px 0;
-            }
-            .advice-label {
-                font-size: 18px;
-                font-weight: bold;
-                color: #2e7d32;
-                margin-bottom: 10px;
-            }
-            .advice-content {
-                font-size: 18px;
-                color: #388e3c;
-            }
-            .footer {
-                margin-top: 40px;
-                text-align: center;
-                color: #95a5a6;
-                font-size: 14px;
-                padding-top: 20px;
-                border-top: 1px solid #ecf0f1;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1 class="title">✨ 星座运势 ✨</h1>
-            <div class="header">
-                <div class="constellation-name">{{constellation_name}}</div>
-                <div class="constellation-info">{{constellation_en}} | {{date_range}} | {{element}}元素 | 守护行星：{{ruling_planet}}</div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">基本信息</div>
-                <div class="info-grid">
-                    <div class="info-item">
-                        <div class="info-label">英文名称</div>
-                        <div class="info-value">{{constellation_en}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">日期范围</div>
-                        <div class="info-value">{{date_range}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">元素属性</div>
-                        <div class="info-value">{{element}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">守护行星</div>
-                        <div class="info-value">{{ruling_planet}}</div>
-                    </div>
-                    <div class="info-item">
-                        <div class="info-label">运势周期</div>
-                        <div class="info-value">{{time_period}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">个性特征</div>
-                <div class="traits">
-                    <div class="trait-item">
-                        <div class="trait-label strengths">优点</div>
-                        <div class="info-value">{{strengths}}</div>
-                    </div>
-                    <div class="trait-item">
-                        <div class="trait-label weaknesses">缺点</div>
-                        <div class="info-value">{{weaknesses}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">配对建议</div>
-                <div class="matches">
-                    <div class="match-item">
-                        <div class="match-label best-match">最佳配对</div>
-                        <div class="info-value">{{best_match}}</div>
-                    </div>
-                    <div class="match-item">
-                        <div class="match-label good-match">较好配对</div>
-                        <div class="info-value">{{good_matches}}</div>
-                    </div>
-                    <div class="match-item">
-                        <div class="match-label fair-match">一般配对</div>
-                        <div class="info-value">{{fair_matches}}</div>
-                    </div>
-                    <div class="match-item">
-                        <div class="match-label poor-match">较差配对</div>
-                        <div class="info-value">{{poor_matches}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">运势详情</div>
-                <div class="fortune-grid">
-                    <div class="fortune-item">
-                        <div class="fortune-label">综合运势</div>
-                        <div class="fortune-value">{{general_fortune}}</div>
-                    </div>
-                    <div class="fortune-item">
-                        <div class="fortune-label">爱情运势</div>
-                        <div class="fortune-value">{{love_fortune}}</div>
-                    </div>
-                    <div class="fortune-item">
-                        <div class="fortune-label">事业运势</div>
-                        <div class="fortune-value">{{work_fortune}}</div>
-                    </div>
-                    <div class="fortune-item">
-                        <div class="fortune-label">财富运势</div>
-                        <div class="fortune-value">{{wealth_fortune}}</div>
-                    </div>
-                    <div class="fortune-item">
-                        <div class="fortune-label">健康运势</div>
-                        <div class="fortune-value">{{health_fortune}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">幸运指南</div>
-                <div class="lucky-info">
-                    <div class="lucky-item">
-                        <div class="lucky-label">幸运颜色</div>
-                        <div class="info-value">{{lucky_colors}}</div>
-                    </div>
-                    <div class="lucky-item">
-                        <div class="lucky-label">幸运数字</div>
-                        <div class="info-value">{{lucky_numbers}}</div>
-                    </div>
-                    <div class="lucky-item">
-                        <div class="lucky-label">幸运方向</div>
-                        <div class="info-value">{{lucky_direction}}</div>
-                    </div>
-                    <div class="lucky-item">
-                        <div class="lucky-label">幸运时间</div>
-                        <div class="info-value">{{lucky_time}}</div>
-                    </div>
-                </div>
-            </div>
-            
-            <div class="section">
-                <div class="section-title">今日建议</div>
-                <div class="advice">
-                    <div class="advice-content">{{love_advice}}</div>
-                </div>
-                <div class="advice">
-                    <div class="advice-label">欲望分析</div>
-                    <div class="advice-content">{{desire_analysis}}</div>
-                </div>
-            </div>
-            
-            <div class="footer">
-                查询时间：{{current_time}} | 数据来源：专业星座运势服务
-            </div>
-        </div>
-    </body>
-    </html>
-    '''
+    def expire(self, job: dict):
+        """排队超时的任务移出队列并通知等待方"""
+        if self.remove(job) and not job["future"].done():
+            job["future"].set_exception(JobQueueTimeout(f"排队超过 {self.max_wait:.0f} 秒，任务已取消"))
+
+    def pump(self):
+        """有空闲名额时按轮转顺序启动排队任务"""
+        while self.running < self.concurrency and self.groups:
+            group_key, users = next(iter(self.groups.items()))
+            user_key, jobs = next(iter(users.items()))
+            job = jobs.popleft()
+            self.queued -= 1
+            # 轮转：本用户、本群移到队尾
+            if jobs:
+                users.move_to_end(user_key)
+            else:
+                del users[user_key]
+            if users:
+                self.groups.move_to_end(group_key)
+            else:
+                del self.groups[group_key]
+
+            job["timer"].cancel()
+            if job["future"].done():
+                continue
+            self.running += 1
+            task = asyncio.create_task(self.run(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self, job: dict):
+        try:
+            result = await job["factory"]()
+            if not job["future"].done():
+                job["future"].set_result(result)
+        except Exception as e:
+            if not job["future"].done():
+                job["future"].set_exception(e)
+        finally:
+            self.running -= 1
+            self.pump()
+
+
+# AI绘画固定使用的尺寸和guidance值，同时作为绘画缓存键的一部分
+PAINTING_SIZE = "1024x1024"
+PAINTING_GUIDANCE = 10
+
+
+class PromptImageCache:
+    """AI绘画提示词缓存：归一化提示词+尺寸+guidance 映射到已生成的本地图片"""
+
+    def __init__(self, index_path: str, ttl: float = 7 * 86400, max_prompts: int = 200,
+                 max_variants: int = 3, reuse_probability: float = 0.8):
+        self.index_path = index_path
+        self.ttl = ttl
+        self.max_prompts = max_prompts
+        self.max_variants = max(1, max_variants)
+        self.reuse_probability = reuse_probability
+        # 缓存键 -> {"files": [{"path", "created"}], "last_used"}
+        self.index = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    self.index = json.loads(f.read())
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"读取绘画缓存索引失败：{e}")
+
+    @staticmethod
+    def key(prompt: str, size: str, guidance) -> str:
+        return normalize_text_key(f"{prompt}\n{size}\n{guidance}")
+
+    def save(self):
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.index, ensure_ascii=False))
+
+    def get(self, prompt: str, size: str, guidance):
+        """按复用概率返回已缓存的图片路径；未命中或决定重新生成时返回None"""
+        cache_key = self.key(prompt, size, guidance)
+        entry = self.index.get(cache_key)
+        if entry is None:
+            return None
+        now = time.time()
+        files = [item for item in entry["files"] if now - item["created"] < self.ttl and os.path.exists(item["path"])]
+        for item in entry["files"]:
+            if item not in files:
+                self.remove_file(item["path"])
+        if not files:
+            del self.index[cache_key]
+            self.save()
+            return None
+        entry["files"] = files
+        # 变体已满时总是复用，否则按概率复用或重新生成一张新变体
+        if len(files) < self.max_variants and random.random() >= self.reuse_probability:
+            return None
+        entry["last_used"] = now
+        self.save()
+        return random.choice(files)["path"]
+
+    def add(self, prompt: str, size: str, guidance, path: str):
+        """记录新生成的图片，超出提示词数量上限时淘汰最久未使用的提示词及其图片"""
+        cache_key = self.key(prompt, size, guidance)
+        now = time.time()
+        entry = self.index.setdefault(cache_key, {"files": [], "last_used": now})
+        entry["files"].append({"path": path, "created": now})
+        entry["last_used"] = now
+        while len(entry["files"]) > self.max_variants:
+            self.remove_file(entry["files"].pop(0)["path"])
+        while len(self.index) > self.max_prompts:
+            oldest_key = min(self.index, key=lambda k: self.index[k]["last_used"])
+            for item in self.index.pop(oldest_key)["files"]:
+                self.remove_file(item["path"])
+        self.save()
+
+    @staticmethod
+    def remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# 渲染优先级：数值越小越先执行
+RENDER_PRIORITY_HIGH = 0        # 菜单、由缓存数据生成的卡片
+RENDER_PRIORITY_NORMAL = 1      # 普通查询卡片
+RENDER_PRIORITY_BACKGROUND = 2  # 后台预渲染
+
+
+class RenderQueueFull(Exception):
+    """渲染排队任务过多"""
+
+
+class RenderScheduler:
+    """html_render 全局调度器：限制同时进行的浏览器渲染数量，按优先级排队并统计排队耗时"""
+
+    def __init__(self, concurrency: int = 2, max_queue: int = 20, slow_wait: float = 5):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max_queue
+        self.slow_wait = slow_wait
+        self.running = 0
+        self.seq = 0
+        # 等待中的渲染：(优先级, 序号, future)
+        self.waiters = []
+        self.waits = deque(maxlen=500)
+        self.rendered = 0
+        self.rejected = 0
+        self.max_depth = 0
+
+    async def acquire(self, priority: int):
+        if self.running < self.concurrency and not self.waiters:
+            self.running += 1
+            return
+        # 高优先级请求不受排队上限限制
+        if priority > RENDER_PRIORITY_HIGH and len(self.waiters) >= self.max_queue:
+            self.rejected += 1
+            raise RenderQueueFull(f"当前图片渲染排队已达 {self.max_queue} 个，请稍后再试")
+        future = asyncio.get_running_loop().create_future()
+        self.seq += 1
+        entry = (priority, self.seq, future)
+        heapq.heappush(self.waiters, entry)
+        self.max_depth = max(self.max_depth, len(self.waiters))
+        try:
+            # 名额由 release 直接移交，不再重新计数
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                # 已被release弹出并跳过的条目不在队列中
+                try:
+                    self.waiters.remove(entry)
+                except ValueError:
+                    pass
+                else:
+                    heapq.heapify(self.waiters)
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+    async def run(self, factory, priority: int = RENDER_PRIORITY_NORMAL):
+        """排队执行一次渲染，返回渲染结果；队列过深时抛出RenderQueueFull"""
+        queued_at = time.monotonic()
+        await self.acquire(priority)
+        wait = time.monotonic() - queued_at
+        self.waits.append(wait)
+        if wait >= self.slow_wait:
+            logger.warning(f"图片渲染排队 {wait:.1f} 秒，当前排队 {len(self.waiters)} 个")
+        try:
+            return await factory()
+        finally:
+            self.rendered += 1
+            self.release()
+
+    def stats(self) -> dict:
+        """排队耗时与队列深度统计"""
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            if not waits:
+                return 0
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000)
+
+        return {
+            "running": self.running,
+            "queued": len(self.waiters),
+            "max_depth": self.max_depth,
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+        }
+
+
+# 原先所有卡片统一使用的输出参数
+RENDER_LEGACY_OPTIONS = {"full_page": True, "type": "jpeg", "quality": 95}
+
+# 按可见文字数选择输出档位：(文字数上限, 图片格式, 质量)，内容越多质量越低
+RENDER_OUTPUT_TIERS = [
+    (600, "jpeg", 82),
+    (2500, "jpeg", 75),
+    (None, "jpeg", 68),
+]
+
+# 各模板的页面宽度（容器max-width + 容器内边距 + 页面边距），可用tiers覆盖默认档位
+RENDER_PROFILES = {
+    "default": {"width": 940},
+    "menu": {"width": 1070, "tiers": [(None, "jpeg", 80)]},
+    "hero_power": {"width": 940},
+    "route_query": {"width": 740},
+    "mc_server": {"width": 740},
+    "mc_board": {"width": 1040},
+    "oil_price": {"width": 740},
+    "qq_valuation": {"width": 840},
+    "weather": {"width": 940},
+    "tech_news": {"width": 940},
+    "historical_events": {"width": 1040},
+    "constellation": {"width": 940},
+}
+
+# 裁剪高度上限，整页截图时会被截到实际页面高度
+RENDER_CLIP_MAX_HEIGHT = 20000
+
+HTML_STYLE_PATTERN = re.compile(r"<style.*?</style>", re.S)
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>|\s+")
+
+
+def render_output_options(profile_name: str, html: str):
+    """按模板档位和内容多少决定截图参数，并把页面宽度固定为模板实际宽度，返回 (html, options)"""
+    profile = RENDER_PROFILES.get(profile_name, RENDER_PROFILES["default"])
+    text_length = len(HTML_TAG_PATTERN.sub("", HTML_STYLE_PATTERN.sub("", html)))
+    for limit, image_type, quality in profile.get("tiers", RENDER_OUTPUT_TIERS):
+        if limit is None or text_length <= limit:
+            break
     
+    # 页面宽度固定后只截取卡片所在区域，不再输出整个浏览器视口宽度的背景
+    width = profile["width"]
+    html = html.replace("</head>", f"<style>body{{width:{width}px;box-sizing:border-box;}}</style></head>", 1)
+    options = {
+        "full_page": True,
+        "type": image_type,
+        "clip": {"x": 0, "y": 0, "width": width, "height": RENDER_CLIP_MAX_HEIGHT},
+    }
+    if image_type == "jpeg":
+        options["quality"] = quality
+    return html, options
+
+
+# 本地卡片绘制常见的中文字体位置，依次尝试
+CARD_FONT_CANDIDATES = [
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+]
+
+
+def mc_server_card(data: dict) -> dict:
+    """Minecraft服务器状态卡片的版式（对应templates/mc_server.html）"""
+    online = data["online_status"] == "online"
+    return {
+        "width": 680,
+        "background": ("#1e3c72", "#2a5298"),
+        "title": "Minecraft服务器状态",
+        "title_color": "#2196f3",
+        "header": data["server_addr"],
+        "header_color": "#1976d2",
+        "header_background": "#e3f2fd",
+        "subtitle": "Minecraft服务器详细状态信息",
+        "badge": (data["online_text"], "#4caf50" if online else "#f44336"),
+        "sections": [{
+            "value_color": "#2c3e50",
+            "fields": [
+                ("IP地址", data["ip"]),
+                ("端口", data["port"]),
+                ("当前玩家", data["players"]),
+                ("最大玩家", data["max_players"]),
+                ("服务器版本", data["version"], True),
+            ],
+        }],
+        "footer": f"查询时间：{data['current_time']} | 数据来源：服务器直连查询",
+    }
+
+
+def oil_price_card(data: dict) -> dict:
+    """油价卡片的版式（对应templates/oil_price.html）"""
+    return {
+        "width": 680,
+        "background": ("#ff6b6b", "#ee5a24"),
+        "title": "油价查询结果",
+        "title_color": "#c0392b",
+        "header": data["city_name"],
+        "header_color": "#d35400",
+        "header_background": "#ffeaa7",
+        "subtitle": "最新油价信息",
+        "badge": (f"趋势：{data['trend']}", "#4caf50"),
+        "sections": [{
+            "value_color": "#e67e22",
+            "fields": [
+                ("92号汽油", f"{data['oil_92']}元/升"),
+                ("95号汽油", f"{data['oil_95']}元/升"),
+                ("98号汽油", f"{data['oil_98']}元/升"),
+                ("0号柴油", f"{data['oil_0']}元/升"),
+            ],
+        }],
+        "footer": f"查询时间：{data['current_time']} | 数据来源：专业油价查询服务",
+    }
+
+
+def constellation_card(data: dict) -> dict:
+    """星座运势卡片的版式（对应templates/constellation_fortune.html）"""
+    return {
+        "width": 880,
+        "background": ("#ff9a9e", "#fecfef"),
+        "title": "星座运势",
+        "title_color": "#e74c3c",
+        "header": data["constellation_name"],
+        "header_color": "#3498db",
+        "header_background": "#f8f9fa",
+        "subtitle": f"{data['constellation_en']} | {data['date_range']} | {data['element']}元素 | 守护行星：{data['ruling_planet']}",
+        "badge": None,
+        "sections": [
+            {"title": "基本信息", "value_color": "#2c3e50", "fields": [
+                ("英文名称", data["constellation_en"]),
+                ("日期范围", data["date_range"]),
+                ("元素属性", data["element"]),
+                ("守护行星", data["ruling_planet"]),
+                ("运势周期", data["time_period"], True),
+            ]},
+            {"title": "个性特征", "value_color": "#2c3e50", "fields": [
+                ("优点", data["strengths"]),
+                ("缺点", data["weaknesses"]),
+            ]},
+            {"title": "配对建议", "value_color": "#2c3e50", "fields": [
+                ("最佳配对", data["best_match"]),
+                ("较好配对", data["good_matches"]),
+                ("一般配对", data["fair_matches"]),
+                ("较差配对", data["poor_matches"]),
+            ]},
+            {"title": "运势详情", "value_color": "#2c3e50", "fields": [
+                ("综合运势", data["general_fortune"], True),
+                ("爱情运势", data["love_fortune"], True),
+                ("事业运势", data["work_fortune"], True),
+                ("财富运势", data["wealth_fortune"], True),
+                ("健康运势", data["health_fortune"], True),
+            ]},
+            {"title": "幸运指南", "value_color": "#2c3e50", "fields": [
+                ("幸运颜色", data["lucky_colors"]),
+                ("幸运数字", data["lucky_numbers"]),
+                ("幸运方向", data["lucky_direction"]),
+                ("幸运时间", data["lucky_time"]),
+            ]},
+            {"title": "今日建议", "value_color": "#388e3c", "fields": [
+                ("爱情建议", data["love_advice"], True),
+                ("欲望分析", data["desire_analysis"], True),
+            ]},
+        ],
+        "footer": f"查询时间：{data['current_time']} | 数据来源：专业星座运势服务",
+    }
+
+
+# 指令 -> 本地绘制版式
+CARD_LAYOUTS = {
+    "mcs": mc_server_card,
+    "油价查询": oil_price_card,
+    "星座运势": constellation_card,
+}
+
+# 渲染基准测试使用的示例数据
+CARD_BENCHMARK_SAMPLES = {
+    "mcs": {
+        "server_addr": "mc.example.com", "online_text": "在线", "online_status": "online",
+        "ip": "203.0.113.10", "port": 25565, "players": 37, "max_players": 200,
+        "version": "Paper 1.20.4", "current_time": "2024-01-01 12:00:00",
+    },
+    "油价查询": {
+        "city_name": "上海", "trend": "上涨", "oil_92": "7.85", "oil_95": "8.35",
+        "oil_98": "9.85", "oil_0": "7.52", "current_time": "2024-01-01 12:00:00",
+    },
+    "星座运势": {
+        "constellation_name": "白羊座", "constellation_en": "Aries", "date_range": "3.21-4.19",
+        "element": "火", "ruling_planet": "火星", "strengths": "热情、勇敢、行动力强",
+        "weaknesses": "冲动、缺乏耐心", "best_match": "狮子座", "best_match_en": "Leo",
+        "good_matches": "射手座, 双子座", "fair_matches": "水瓶座, 天秤座", "poor_matches": "巨蟹座, 摩羯座",
+        "lucky_colors": "红色, 金色", "lucky_numbers": "1, 9", "time_period": "today",
+        "love_advice": "主动表达心意，会有意想不到的收获。" * 2,
+        "general_fortune": "整体运势平稳上升，适合开展新的计划，注意劳逸结合。" * 3,
+        "love_fortune": "单身者有机会结识志同道合的朋友，有伴者感情稳定。" * 2,
+        "work_fortune": "工作效率较高，容易得到上司赏识，但要注意与同事的沟通方式。" * 2,
+        "wealth_fortune": "正财运不错，偏财运一般，不宜进行高风险投资。" * 2,
+        "health_fortune": "精力充沛，注意饮食规律，避免熬夜。" * 2,
+        "desire_analysis": "今天渴望得到认可，适合在团队中展现自己的能力。" * 2,
+        "lucky_direction": "东南", "lucky_time": "上午9点-11点", "current_time": "2024-01-01 12:00:00",
+    },
+}
+
+
+def fill_template(template: str, template_data: dict) -> str:
+    """将模板中的 {{key}} 占位符替换为对应的值"""
+    for key, value in template_data.items():
+        template = template.replace("{{" + key + "}}", str(value))
+    return template
+
+
+class UpstreamError(ValueError):
+    """上游返回了错误状态码或业务失败"""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class UpstreamUnavailable(UpstreamError):
+    """上游域名处于熔断状态，请求未发出"""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """网络错误、超时、5xx、熔断和响应不是合法JSON说明上游不健康；4xx和业务失败是请求本身的问题"""
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, UpstreamUnavailable, json.JSONDecodeError)):
+        return True
+    return isinstance(error, UpstreamError) and (error.status or 0) >= 500
+
+
+async def hedged_call(factory, delay: float, allow_hedge, accept=None):
+    """先发出一个请求，delay秒内未完成且allow_hedge()放行时再发出一个相同的请求，返回先完成的可用结果。
+    accept判定结果是否可用，不可用的结果只在另一个请求也失败时返回；全部失败时抛出第一个异常"""
+    tasks = [asyncio.ensure_future(factory())]
+    fallback = None
+    error = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and allow_hedge():
+            tasks.append(asyncio.ensure_future(factory()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                if accept is None or accept(task.result()):
+                    return task.result()
+                if fallback is None:
+                    fallback = task.result()
+        if fallback is not None:
+            return fallback
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class HedgePolicy:
+    """对冲请求策略：按各键的历史p90决定何时补发第二个请求，并限制对冲比例保护上游配额"""
+
+    def __init__(self, max_ratio: float = 0.1, min_samples: int = 20, window: float = 300, max_keys: int = 256):
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self.max_keys = max_keys
+        # 键 -> 最近的成功耗时（秒）
+        self.latencies = OrderedDict()
+        # 统计窗口内的请求时间和对冲时间
+        self.requests = deque()
+        self.hedges = deque()
+        self.total_hedges = 0
+
+    def record(self, key: str, seconds: float):
+        samples = self.latencies.get(key)
+        if samples is None:
+            samples = self.latencies[key] = deque(maxlen=100)
+            while len(self.latencies) > self.max_keys:
+                self.latencies.popitem(last=False)
+        self.latencies.move_to_end(key)
+        samples.append(seconds)
+
+    def delay(self, key: str):
+        """历史p90耗时，样本不足时返回None（不对冲）"""
+        samples = self.latencies.get(key)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def prune(self, now: float):
+        for timestamps in (self.requests, self.hedges):
+            while timestamps and now - timestamps[0] > self.window:
+                timestamps.popleft()
+
+    def allow_hedge(self) -> bool:
+        """统计窗口内对冲请求数不超过总请求数的max_ratio"""
+        now = time.monotonic()
+        self.prune(now)
+        if len(self.hedges) + 1 > self.max_ratio * len(self.requests):
+            return False
+        self.hedges.append(now)
+        self.total_hedges += 1
+        return True
+
+    async def run(self, key: str, factory, accept=None):
+        """执行一次请求，超过该键的历史p90仍未完成时按配额补发一次"""
+        started = time.monotonic()
+        # 每次都清理窗口外的记录，未触发对冲判断的请求也不会让队列无限增长
+        self.prune(started)
+        self.requests.append(started)
+        delay = self.delay(key)
+        if delay is None:
+            result = await factory()
+        else:
+            result = await hedged_call(factory, delay, self.allow_hedge, accept)
+        if accept is None or accept(result):
+            self.record(key, time.monotonic() - started)
+        return result
+
+    def stats(self) -> dict:
+        self.prune(time.monotonic())
+        return {
+            "requests": len(self.requests),
+            "hedges": len(self.hedges),
+            "total_hedges": self.total_hedges,
+        }
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """指令的时间预算已用完"""
+
+
+class Deadline:
+    """单条指令的端到端时间预算：依次传给各个子请求和渲染步骤，剩余时间随步骤推进而减少"""
+
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """为后续步骤预留时间，返回提前到期的子预算；预留最多占剩余预算的一半，预算很小时子预算不会一开始就到期"""
+        child = Deadline(0)
+        child.expires_at = self.expires_at - min(seconds, self.remaining() / 2)
+        return child
+
+
+class CircuitBreaker:
+    """单个上游域名的熔断器：连续失败达到阈值后熔断，冷却期过后放行一个探测请求"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> int:
+        if self.opened_at is None:
+            return 0
+        return max(1, round(self.reset_timeout - (time.monotonic() - self.opened_at)))
+
+    def allow(self) -> bool:
+        """是否放行请求；半开状态下同一时间只放行一个探测请求（探测请求被取消时超时后重新放行）"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+            return False
+        self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def release_probe(self):
+        """探测请求没有真正发出或被指令预算截断，不代表上游状态，让下一个请求重新探测"""
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        # 探测失败立即重新熔断
+        if self.probe_started is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+
+def code_is(value):
+    """成功判定：返回结果的code字段等于指定值"""
+    return lambda result: isinstance(result, dict) and result.get("code") == value
+
+
+def field_of(*names):
+    """错误信息：依次取返回结果中第一个非空的字段"""
+    def extract(result):
+        if isinstance(result, dict):
+            for name in names:
+                if result.get(name):
+                    return str(result[name])
+        return None
+    return extract
+
+
+# 上游接口登记表，键同时作为调试日志标签和统计名称：
+#   url / method：地址和请求方法；body：POST请求体格式（form或json）
+#   parse：json、text或bytes；timeout：超时秒数
+#   success：业务成功判定；error：失败时提取错误信息
+#   cache_ttl：成功结果的缓存秒数（0为不缓存）；retries：网络错误和5xx时的重试次数
+#   idempotent：是否允许重试，默认只有GET请求允许
+#   stale：失败时能否返回过期缓存，按日期变化的数据设为False，避免过了零点返回前一天的内容
+UPSTREAM_ENDPOINTS = {
+    "战力查询": {
+        "url": "https://yunzhiapi.cn/API/wzzlcx.php",
+        "success": code_is(200), "error": field_of("message", "msg"),
+        "cache_ttl": 600, "retries": 1,
+    },
+    "路线查询": {
+        "url": "https://api.pearktrue.cn/api/citytravelroutes/", "method": "POST", "body": "json",
+        "success": code_is(200), "retries": 1, "idempotent": True,
+    },
+    "绘画": {
+        "url": "https://yunzhiapi.cn//API/ks/api.php", "parse": "text",
+        "success": lambda result: result.startswith("http"),
+        "error": lambda result: f"AI绘画生成失败：{result}",
+    },
+    "图片下载": {
+        "parse": "bytes", "retries": 1,
+    },
+    "代理ip": {
+        "url": "https://api.pearktrue.cn/api/proxy/",
+        "success": code_is(200),
+    },
+    "油价查询": {
+        "url": "https://free.wqwlkj.cn/wqwlapi/oilprice.php", "timeout": 60,
+        "success": code_is(1), "retries": 1,
+    },
+    "qq估价": {
+        "url": "https://free.wqwlkj.cn/wqwlapi/qq_gj.php", "timeout": 60,
+        "success": code_is(1), "cache_ttl": 3600, "retries": 1,
+    },
+    "qq吉凶": {
+        "url": "https://v2.xxapi.cn/api/qqjixiong", "timeout": 60,
+        "success": code_is(200), "cache_ttl": 86400, "retries": 1,
+    },
+    "qq估价AI分析": {
+        "url": "https://api.jkyai.top/API/depsek3.1.php", "parse": "text", "timeout": 60,
+    },
+    "内容审核": {
+        "url": MODERATION_API_URL, "method": "POST", "body": "form", "parse": "text",
+    },
+    "星座运势": {
+        "url": "https://yunzhiapi.cn//API/xzyspd.php",
+        "success": lambda result: isinstance(result, dict) and result.get("status") == "success",
+        "cache_ttl": 1800, "retries": 1,
+    },
+    "天气": {
+        "url": "https://uapis.cn/api/v1/misc/weather",
+        "error": field_of("message"), "retries": 1,
+    },
+    "天气wttr": {
+        # 地址为 https://wttr.in/<城市>，请求时传入
+        "url": "https://wttr.in/",
+        "success": lambda result: isinstance(result, dict) and bool(result.get("current_condition")),
+        "error": lambda result: "未查询到该城市的天气", "retries": 1,
+    },
+    "油价查询tianapi": {
+        "url": "https://apis.tianapi.com/oilprice/index",
+        "success": code_is(200), "retries": 1,
+    },
+    "mc状态": {
+        "url": "https://uapis.cn/api/v1/game/minecraft/serverstatus",
+        "success": lambda result: isinstance(result, dict) and "online" in result,
+        "error": field_of("message"),
+    },
+    "实时科技资讯": {
+        "url": "https://api.pearktrue.cn/api/sciencenews/",
+        "success": code_is(200), "retries": 1,
+    },
+    "历史上的今天": {
+        "url": "https://api.pearktrue.cn/api/lsjt/",
+        "success": code_is(200), "cache_ttl": 1800, "retries": 1, "stale": False,
+    },
+    "图文合成": {
+        "url": "http://ryapi.sbs/API/zsy.php", "parse": "bytes", "retries": 1,
+    },
+    "万年历": {
+        "url": "https://api.52vmy.cn/api/wl/wnl", "cache_ttl": 600, "retries": 1, "stale": False,
+    },
+    "黄历": {
+        "url": "https://api.52vmy.cn/api/wl/wnl/huangli",
+        "success": lambda result: isinstance(result, dict) and result.get("code") == 200 and bool(result.get("data")),
+        "error": lambda result: "黄历数据获取失败，请稍后重试",
+        "cache_ttl": 600, "retries": 1, "stale": False,
+    },
+    "网页截图": {
+        "url": "https://api.apifox.cn/api/v1/browser/screenshot", "method": "POST", "body": "json",
+        "success": code_is(0), "error": field_of("message"),
+    },
+    "加密": {
+        "url": "https://yunzhiapi.cn//API/shouyu/api.php",
+        "success": code_is(1), "error": field_of("text"), "retries": 1,
+    },
+    "解密": {
+        "url": "https://yunzhiapi.cn/API/shouyu/api.php",
+        "success": code_is(1), "error": field_of("text"), "retries": 1,
+    },
+    "AES加密": {
+        "url": "https://uapis.cn/api/v1/text/aes/encrypt-advanced", "method": "POST", "body": "json",
+        "error": field_of("error"),
+    },
+    "AES解密": {
+        "url": "https://uapis.cn/api/v1/text/aes/decrypt-advanced", "method": "POST", "body": "json",
+        "error": field_of("error"),
+    },
+}
+
+
+class UpstreamFetcher:
+    """统一的上游请求引擎：共享连接池、调试日志、结果缓存、退避重试、分域名熔断和分接口统计"""
+
+    def __init__(self, get_session, upstream_log: UpstreamPayloadLogger, cache_size: int = 1024,
+                 stale_ttl: float = 3600, retry_base_delay: float = 0.5, retry_max_delay: float = 5,
+                 failure_threshold: int = 5, reset_timeout: float = 30, hedge: HedgePolicy = None,
+                 hedge_endpoints=()):
+        self.get_session = get_session
+        self.upstream_log = upstream_log
+        # 缓存条目为 (新鲜截止时间, 结果)，过了新鲜期的结果再保留stale_ttl秒，熔断或请求失败时兜底返回
+        self.cache = TTLCache(maxsize=cache_size, ttl=600)
+        self.stale_ttl = stale_ttl
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # 域名 -> 熔断器
+        self.breakers = {}
+        # 启用对冲请求的接口
+        self.hedge = hedge
+        self.hedge_endpoints = set(hedge_endpoints)
+        # 接口名 -> 统计数据
+        self.metrics = {}
+
+    def metric(self, name: str) -> dict:
+        if name not in self.metrics:
+            self.metrics[name] = {"calls": 0, "failures": 0, "cache_hits": 0, "stale_hits": 0, "retries": 0,
+                                  "short_circuits": 0, "latencies": deque(maxlen=200)}
+        return self.metrics[name]
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[host]
+
+    def backoff(self, attempt: int) -> float:
+        """指数退避加全抖动，避免大量请求在同一时刻重试"""
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def fetch(self, name: str, params: dict = None, data: dict = None, url: str = None,
+                    deadline: Deadline = None, **log_fields):
+        """请求登记表中的接口，返回解析后的结果；状态码或业务失败时抛出UpstreamError，
+        域名熔断时抛出UpstreamUnavailable，网络错误、超时和JSON格式错误按原样抛出；
+        熔断或网络失败时如有过期不久的缓存结果则返回缓存。
+        传入deadline时每次请求的超时不超过剩余预算，预算用完时抛出DeadlineExceeded。
+        抛出的异常按接口名和类型计入当前指令的错误数"""
+        try:
+            return await self.fetch_endpoint(name, params, data, url, deadline, log_fields)
+        except Exception as e:
+            record_error(name, e)
+            raise
+
+    async def fetch_endpoint(self, name: str, params: dict, data: dict, url: str, deadline: Deadline,
+                             log_fields: dict):
+        endpoint = UPSTREAM_ENDPOINTS[name]
+        metric = self.metric(name)
+        metric["calls"] += 1
+
+        cache_key = None
+        stale = None
+        if endpoint.get("cache_ttl"):
+            cache_key = (name, url, json.dumps([params, data], sort_keys=True, ensure_ascii=False))
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                fresh_until, stale = cached
+                if fresh_until > time.monotonic():
+                    metric["cache_hits"] += 1
+                    return stale
+
+        if deadline is not None and deadline.expired:
+            metric["failures"] += 1
+            if stale is not None:
+                metric["stale_hits"] += 1
+                return stale
+            raise DeadlineExceeded(f"{name}请求前时间预算已用完")
+
+        host = urllib.parse.urlsplit(url or endpoint["url"]).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            metric["short_circuits"] += 1
+            if stale is not None:
+                metric["stale_hits"] += 1
+                return stale
+            metric["failures"] += 1
+            raise UpstreamUnavailable(f"{host} 暂时不可用，请约 {breaker.retry_after()} 秒后重试")
+
+        attempts = endpoint.get("retries", 0) + 1
+        if not endpoint.get("idempotent", endpoint.get("method", "GET") == "GET"):
+            attempts = 1
+        for attempt in range(attempts):
+            started = time.monotonic()
+            timeout = endpoint.get("timeout", 30)
+            if deadline is not None:
+                # 每次尝试前都检查预算（退避等待后可能已用完），ClientTimeout(total=0)表示不限时，不能传入
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    breaker.release_probe()
+                    metric["failures"] += 1
+                    if stale is not None:
+                        metric["stale_hits"] += 1
+                        return stale
+                    raise DeadlineExceeded(f"{name}第 {attempt + 1} 次请求前时间预算已用完")
+                timeout = min(timeout, remaining)
+            try:
+                if self.hedge is not None and name in self.hedge_endpoints:
+                    result = await self.hedge.run(
+                        f"{name}:{host}",
+                        lambda: self.request(name, endpoint, url, params, data, timeout, log_fields),
+                    )
+                else:
+                    result = await self.request(name, endpoint, url, params, data, timeout, log_fields)
+                metric["latencies"].append(time.monotonic() - started)
+                breaker.record_success()
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamError, json.JSONDecodeError) as e:
+                # 被指令预算截断的请求不代表上游不健康，不计入熔断
+                if deadline is not None and deadline.expired:
+                    breaker.release_probe()
+                    metric["failures"] += 1
+                    if stale is not None:
+                        metric["stale_hits"] += 1
+                        return stale
+                    raise DeadlineExceeded(f"{name}请求超出指令时间预算") from e
+                # 网络错误、超时、5xx和非JSON响应（通常是HTML错误页）说明上游不健康，计入熔断；4xx是请求本身的问题
+                transient = is_transient_error(e)
+                if transient:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                delay = self.backoff(attempt)
+                if (not transient or attempt + 1 >= attempts or breaker.state != "closed"
+                        or (deadline is not None and deadline.remaining() <= delay)):
+                    metric["failures"] += 1
+                    if transient and stale is not None:
+                        metric["stale_hits"] += 1
+                        logger.warning(f"{name}请求失败，返回缓存结果：{str(e) or type(e).__name__}")
+                        return stale
+                    raise
+                metric["retries"] += 1
+                logger.debug(f"{name}请求失败，{delay:.2f} 秒后重试第 {attempt + 1} 次：{str(e) or type(e).__name__}")
+                await asyncio.sleep(delay)
+
+        success = endpoint.get("success")
+        if success is not None and not success(result):
+            metric["failures"] += 1
+            error = endpoint.get("error", field_of("msg"))
+            raise UpstreamError(error(result) or "未知错误")
+
+        if cache_key is not None:
+            stale_ttl = self.stale_ttl if endpoint.get("stale", True) else 0
+            self.cache.set(cache_key, (time.monotonic() + endpoint["cache_ttl"], result),
+                           ttl=endpoint["cache_ttl"] + stale_ttl)
+        return result
+
+    async def request(self, name: str, endpoint: dict, url: str, params: dict, data: dict, timeout: float,
+                      log_fields: dict):
+        method = endpoint.get("method", "GET")
+        kwargs = {"params": params, "timeout": aiohttp.ClientTimeout(total=timeout)}
+        if data is not None:
+            kwargs["json" if endpoint.get("body") == "json" else "data"] = data
+
+        # 每次实际发出的请求按域名计入当前指令的上游阶段
+        started = time.monotonic()
+        host = urllib.parse.urlsplit(url or endpoint["url"]).netloc
+        try:
+            async with self.get_session().request(method, url or endpoint["url"], **kwargs) as resp:
+                if endpoint.get("parse") == "bytes" and resp.status == 200:
+                    return await resp.read()
+                raw_content = await resp.text()
+                self.upstream_log.log(name, raw_content, status=resp.status, **log_fields)
+                status = resp.status
+        finally:
+            record_phase("upstream", started, host=host)
+
+        if status != 200:
+            message = None
+            try:
+                message = endpoint.get("error", field_of("msg"))(json.loads(raw_content))
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                pass
+            raise UpstreamError(message or f"服务器返回错误状态码：{status}", status)
+        # 先读取响应文本再解析JSON，兼容Content-Type不规范的接口
+        if endpoint.get("parse", "json") == "json":
+            return json.loads(raw_content)
+        return raw_content
+
+    def stats(self) -> dict:
+        """各接口的调用次数、失败次数、缓存命中、重试次数和延迟分位数"""
+        stats = {}
+        for name, metric in self.metrics.items():
+            latencies = sorted(metric["latencies"])
+
+            def percentile(p):
+                if not latencies:
+                    return 0
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000)
+
+            stats[name] = {
+                "calls": metric["calls"],
+                "failures": metric["failures"],
+                "cache_hits": metric["cache_hits"],
+                "stale_hits": metric["stale_hits"],
+                "retries": metric["retries"],
+                "short_circuits": metric["short_circuits"],
+                "p50_ms": percentile(0.5),
+                "p95_ms": percentile(0.95),
+            }
+        return stats
+
+    def breaker_states(self) -> dict:
+        """各上游域名的熔断状态"""
+        return {
+            host: {"state": breaker.state, "failures": breaker.failures, "retry_after": breaker.retry_after()}
+            for host, breaker in self.breakers.items()
+        }
+
+
+class ProviderRouter:
+    """多供应商路由：按健康度和延迟给同一查询的供应商排序，依次回退，直到有供应商返回可用结果"""
+
+    def __init__(self, chains: dict, unhealthy_streak: int = 3, cooldown: float = 60):
+        # 查询名 -> [{"name": 供应商名, "fetch": 异步请求函数}]，列表顺序为默认优先级
+        self.chains = chains
+        self.unhealthy_streak = unhealthy_streak
+        self.cooldown = cooldown
+        # (查询名, 供应商名) -> 健康数据
+        self.health = {}
+
+    def provider_health(self, query: str, name: str) -> dict:
+        key = (query, name)
+        if key not in self.health:
+            self.health[key] = {"latency_ms": None, "successes": 0, "failures": 0, "streak": 0, "last_failure": 0}
+        return self.health[key]
+
+    def healthy(self, health: dict) -> bool:
+        """连续失败达到阈值的供应商在冷却期内视为不健康"""
+        return health["streak"] < self.unhealthy_streak or time.monotonic() - health["last_failure"] > self.cooldown
+
+    def ranked(self, query: str) -> list:
+        """健康的排在前面，其中有延迟数据的按平均延迟从低到高，没有数据的按默认顺序"""
+        def sort_key(item):
+            index, provider = item
+            health = self.provider_health(query, provider["name"])
+            latency = health["latency_ms"]
+            return (not self.healthy(health), latency is None, latency or 0, index)
+
+        return [provider for _, provider in sorted(enumerate(self.chains[query]), key=sort_key)]
+
+    def record(self, query: str, name: str, latency_ms: float = None, failed: bool = False):
+        health = self.provider_health(query, name)
+        if failed:
+            health["failures"] += 1
+            health["streak"] += 1
+            health["last_failure"] = time.monotonic()
+            return
+        health["successes"] += 1
+        health["streak"] = 0
+        if latency_ms is not None:
+            # 指数加权平均，新样本占20%
+            previous = health["latency_ms"]
+            health["latency_ms"] = latency_ms if previous is None else previous * 0.8 + latency_ms * 0.2
+
+    async def call(self, query: str, *args, accept=None):
+        """按排序依次请求供应商，返回第一个可用结果；accept判定结果是否可用，
+        不可用的结果只在所有供应商都没有可用结果时返回。
+        只有上游不健康（网络错误、超时、5xx、熔断）才计入失败并回退到下一个供应商，
+        城市不存在、地址格式错误等请求本身的问题直接抛出；全部失败时抛出首个供应商的异常"""
+        errors = []
+        fallback = None
+        for provider in self.ranked(query):
+            # 供应商可以声明只支持部分查询，例如只能按省份查询油价
+            if "supports" in provider and not provider["supports"](*args):
+                continue
+            started = time.monotonic()
+            try:
+                result = await provider["fetch"](*args)
+            except DeadlineExceeded:
+                # 预算已用完，不再尝试其他供应商
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                if not is_transient_error(e):
+                    # 供应商正常应答，换一个供应商也不会有更好的结果
+                    self.record(query, provider["name"])
+                    if fallback is not None:
+                        return fallback
+                    raise
+                self.record(query, provider["name"], failed=True)
+                logger.debug(f"{query}供应商 {provider['name']} 请求失败：{e}")
+                errors.append(e)
+                continue
+            if accept is not None and not accept(result):
+                # 供应商本身正常，只是结果不可用（如服务器离线），不计入延迟
+                self.record(query, provider["name"])
+                if fallback is None:
+                    fallback = result
+                continue
+            self.record(query, provider["name"], (time.monotonic() - started) * 1000)
+            return result
+        if fallback is not None:
+            return fallback
+        if not errors:
+            raise ValueError(f"没有支持该{query}查询的供应商")
+        raise errors[0]
+
+    def stats(self) -> dict:
+        """各查询的供应商排序与健康数据"""
+        stats = {}
+        for query in self.chains:
+            stats[query] = []
+            for provider in self.ranked(query):
+                health = self.provider_health(query, provider["name"])
+                latency = health["latency_ms"]
+                stats[query].append({
+                    "name": provider["name"],
+                    "healthy": self.healthy(health),
+                    "latency_ms": round(latency) if latency is not None else None,
+                    "successes": health["successes"],
+                    "failures": health["failures"],
+                })
+        return stats
+
+
+# 启动预热时预先建立连接的上游地址（登记表中的全部域名）
+DEFAULT_WARMUP_URLS = list(dict.fromkeys(
+    "{0.scheme}://{0.netloc}/".format(urllib.parse.urlsplit(endpoint["url"]))
+    for endpoint in UPSTREAM_ENDPOINTS.values() if "url" in endpoint
+))
+
+# HTML模板目录（与本文件同级）
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TEMPLATE_INCLUDE_PATTERN = re.compile(r'\{%\s*include\s+"([^"]+)"\s*%\}')
+CSS_COMMENT_PATTERN = re.compile(r"/\*.*?\*/", re.S)
+CSS_PUNCTUATION_PATTERN = re.compile(r"\s*([{};:,>])\s*")
+
+
+def minify_css(css: str) -> str:
+    """去掉CSS中的注释和多余空白"""
+    css = CSS_COMMENT_PATTERN.sub("", css)
+    css = CSS_PUNCTUATION_PATTERN.sub(r"\1", re.sub(r"\s+", " ", css))
+    return css.replace(";}", "}").strip()
+
+
+class TemplateLoader:
+    """HTML模板加载器：首次使用时读取并编译（展开公共样式片段、压缩CSS），文件修改后自动重新编译"""
+
+    def __init__(self, directory: str, hot_reload: bool = True):
+        self.directory = directory
+        self.hot_reload = hot_reload
+        # 模板名 -> (依赖文件 -> 修改时间, 编译结果)
+        self.compiled = {}
+
+    def get(self, name: str) -> str:
+        entry = self.compiled.get(name)
+        if entry is not None:
+            mtimes, html = entry
+            if not self.hot_reload or all(self.mtime(path) == mtime for path, mtime in mtimes.items()):
+                return html
+        mtimes = {}
+        html = self.compile(name, mtimes)
+        self.compiled[name] = (mtimes, html)
+        return html
+
+    @staticmethod
+    def mtime(path: str):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def read(self, relative_path: str, mtimes: dict) -> str:
+        path = os.path.join(self.directory, relative_path)
+        mtimes[path] = self.mtime(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def compile(self, name: str, mtimes: dict) -> str:
+        html = self.read(f"{name}.html", mtimes)
+        html = TEMPLATE_INCLUDE_PATTERN.sub(
+            lambda m: self.read(os.path.join("partials", m.group(1)), mtimes), html)
+        html = re.sub(r"<style>(.*?)</style>", lambda m: f"<style>{minify_css(m.group(1))}</style>", html, flags=re.S)
+        # 去掉每行的缩进和空行，模板中没有依赖空白的内容
+        return "\n".join(line.strip() for line in html.splitlines() if line.strip())
+
+
+class CardRenderer:
+    """用Pillow直接绘制固定版式的卡片，跳过 HTML -> 无头浏览器 -> JPEG 的渲染流程"""
+
+    PADDING = 30
+    INNER = 40
+    GAP = 15
+
+    def __init__(self, output_dir: str, font_path: str = "", max_files: int = 200, quality: int = 90):
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self.quality = quality
+        self.font_path = None
+        if PILImage is not None:
+            for path in ([font_path] if font_path else []) + CARD_FONT_CANDIDATES:
+                if os.path.exists(path):
+                    self.font_path = path
+                    break
+        self.fonts = {}
+        # 预先画好的背景（渐变 + 白色卡片底），按 颜色和尺寸 缓存
+        self.shells = TTLCache(maxsize=16, ttl=86400)
+
+    @property
+    def available(self) -> bool:
+        return PILImage is not None and self.font_path is not None
+
+    def font(self, size: int):
+        if size not in self.fonts:
+            self.fonts[size] = ImageFont.truetype(self.font_path, size)
+        return self.fonts[size]
+
+    def shell(self, colors: tuple, width: int, height: int):
+        """135度渐变背景加圆角白色卡片，同尺寸复用"""
+        key = (colors, width, height)
+        shell = self.shells.get(key)
+        if shell is None:
+            start = PILImage.new("RGB", (1, 1), colors[0])
+            end = PILImage.new("RGB", (1, 1), colors[1])
+            mask = PILImage.new("L", (64, 64))
+            mask.putdata([(x + y) * 255 // 126 for y in range(64) for x in range(64)])
+            mask = mask.resize((width, height), PILImage.BILINEAR)
+            shell = PILImage.composite(end.resize((width, height)), start.resize((width, height)), mask)
+            ImageDraw.Draw(shell).rounded_rectangle(
+                (self.PADDING, self.PADDING, width - self.PADDING, height - self.PADDING), 15, fill="white")
+            self.shells.set(key, shell)
+        return shell.copy()
+
+    def wrap(self, text, size: int, width: int) -> list:
+        """按像素宽度逐字折行，兼容没有空格的中文"""
+        font = self.font(size)
+        lines = []
+        for paragraph in str(text).split("\n"):
+            line = ""
+            for char in paragraph:
+                if line and font.getlength(line + char) > width:
+                    lines.append(line)
+                    line = char
+                else:
+                    line += char
+            lines.append(line)
+        return lines
+
+    def layout(self, card: dict) -> tuple:
+        """计算每个元素的位置，返回 [(类型, 区域, 参数)] 和卡片总高度"""
+        width = card["width"]
+        left = self.PADDING + self.INNER
+        content_width = width - 2 * left
+        ops = []
+        y = self.PADDING + self.INNER
+
+        ops.append(("text", (left, y, content_width), {"text": card["title"], "size": 28, "color": card["title_color"]}))
+        y += 28 + 30
+
+        header_lines = self.wrap(card["subtitle"], 16, content_width - 40)
+        header_height = 20 + 42 + len(header_lines) * 24 + 20
+        ops.append(("box", (left, y, left + content_width, y + header_height), {"fill": card["header_background"], "radius": 10}))
+        ops.append(("text", (left, y + 20, content_width), {"text": card["header"], "size": 32, "color": card["header_color"]}))
+        for index, line in enumerate(header_lines):
+            ops.append(("text", (left, y + 62 + index * 24, content_width), {"text": line, "size": 16, "color": "#666666"}))
+        y += header_height + 30
+
+        if card["badge"]:
+            text, color = card["badge"]
+            badge_width = self.font(20).getlength(text) + 40
+            badge_left = left + (content_width - badge_width) / 2
+            ops.append(("box", (badge_left, y, badge_left + badge_width, y + 46), {"fill": color, "radius": 23}))
+            ops.append(("text", (left, y + 10, content_width), {"text": text, "size": 20, "color": "white"}))
+            y += 46 + 30
+
+        cell_width = (content_width - self.GAP) / 2
+        for section in card["sections"]:
+            if section.get("title"):
+                ops.append(("text", (left, y, content_width), {"text": section["title"], "size": 24, "color": "#2c3e50", "align": "left"}))
+                y += 34
+                ops.append(("line", (left, y, left + content_width, y), {"fill": "#3498db", "width": 2}))
+                y += 16
+            # 两列网格，第三个参数为True的字段独占一行
+            rows = []
+            pending = []
+            for field in section["fields"]:
+                if len(field) > 2 and field[2]:
+                    if pending:
+                        rows.append(pending)
+                        pending = []
+                    rows.append([field])
+                else:
+                    pending.append(field)
+                    if len(pending) == 2:
+                        rows.append(pending)
+                        pending = []
+            if pending:
+                rows.append(pending)
+            for row in rows:
+                box_width = content_width if len(row[0]) > 2 and row[0][2] else cell_width
+                wrapped = [self.wrap(item[1], 22, box_width - 40) for item in row]
+                height = 20 + 24 + max(len(lines) for lines in wrapped) * 32 + 20
+                for index, (item, lines) in enumerate(zip(row, wrapped)):
+                    x = left + index * (cell_width + self.GAP)
+                    ops.append(("box", (x, y, x + box_width, y + height), {"fill": "#f8f9fa", "radius": 8}))
+                    ops.append(("text", (x + 20, y + 20, box_width - 40), {"text": item[0], "size": 14, "color": "#7f8c8d", "align": "left"}))
+                    for line_index, line in enumerate(lines):
+                        ops.append(("text", (x + 20, y + 44 + line_index * 32, box_width - 40),
+                                    {"text": line, "size": 22, "color": section["value_color"], "align": "left"}))
+                y += height + self.GAP
+            y += self.GAP
+
+        ops.append(("line", (left, y, left + content_width, y), {"fill": "#ecf0f1", "width": 1}))
+        y += 20
+        for line in self.wrap(card["footer"], 14, content_width):
+            ops.append(("text", (left, y, content_width), {"text": line, "size": 14, "color": "#95a5a6"}))
+            y += 22
+        return ops, y + self.INNER + self.PADDING
+
+    def draw(self, card: dict) -> bytes:
+        ops, height = self.layout(card)
+        image = self.shell(card["background"], card["width"], int(height))
+        draw = ImageDraw.Draw(image)
+        for kind, area, params in ops:
+            if kind == "box":
+                draw.rounded_rectangle(area, params["radius"], fill=params["fill"])
+            elif kind == "line":
+                draw.line(area, fill=params["fill"], width=params["width"])
+            else:
+                x, y, width = area
+                font = self.font(params["size"])
+                if params.get("align") != "left":
+                    x += (width - font.getlength(params["text"])) / 2
+                draw.text((x, y), params["text"], font=font, fill=params["color"])
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=self.quality)
+        return buffer.getvalue()
+
+    def save(self, content: bytes) -> str:
+        """按内容哈希保存图片，超过文件数上限时删除最旧的卡片"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{hashlib.sha256(content).hexdigest()[:32]}.jpg")
+        with open(path, "wb") as f:
+            f.write(content)
+        files = [os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir)]
+        if len(files) > self.max_files:
+            files.sort(key=os.path.getmtime)
+            for old in files[:len(files) - self.max_files]:
+                PromptImageCache.remove_file(old)
+        return path
+
+    async def render(self, command: str, template_data: dict) -> str:
+        """在线程池中绘制指定指令的卡片，返回本地图片路径"""
+        card = CARD_LAYOUTS[command](template_data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.save(self.draw(card)))
+
+
+@register("D-G-N-C-J", "Tinyxi", "早晚安记录+王者战力查询+城际路线查询+AI绘画", "1.0.0", "")
+class Main(Star):
+    def __init__(self, context: Context, config: AstrBotConfig = None) -> None:
+        super().__init__(context)
+        self.config = config if config is not None else {}
+        # 各指令分阶段耗时、错误数等指标，工具箱状态指令和指标端口读取
+        self.metrics = MetricsRegistry()
+        self.metrics_runner = None
+        self.PLUGIN_NAME = "astrbot_plugin_essential"
+        PLUGIN_NAME = self.PLUGIN_NAME
+
+        if not os.path.exists(f"data/{PLUGIN_NAME}_data.json"):
+            with open(f"data/{PLUGIN_NAME}_data.json", "w", encoding="utf-8") as f:
+                f.write(json.dumps({}, ensure_ascii=False, indent=2))
+        with open(f"data/{PLUGIN_NAME}_data.json", "r", encoding="utf-8") as f:
+            self.data = json.loads(f.read())
+        self.good_morning_data = self.data.get("good_morning", {})
+
+        self.daily_sleep_cache = {}
+        self.good_morning_cd = {}
+        # 插件生命周期内的后台任务，卸载时统一取消
+        self.background_tasks = set()
+        # 上游原始数据调试日志
+        self.upstream_log = UpstreamPayloadLogger(
+            sample_rate=self.config.get("debug_payload_sample_rate", 1.0),
+            max_length=self.config.get("debug_payload_max_length", 500),
+        )
+        # 共享HTTP会话（连接池 + DNS缓存），首次使用时创建
+        self.http_session = None
+        # 统一的上游请求引擎，所有指令通过登记表中的接口名请求上游
+        self.upstream = UpstreamFetcher(
+            self.get_http_session,
+            self.upstream_log,
+            cache_size=self.config.get("upstream_cache_size", 1024),
+            stale_ttl=self.config.get("upstream_stale_ttl", 3600),
+            retry_base_delay=self.config.get("upstream_retry_base_delay", 0.5),
+            retry_max_delay=self.config.get("upstream_retry_max_delay", 5),
+            failure_threshold=self.config.get("circuit_failure_threshold", 5),
+            reset_timeout=self.config.get("circuit_reset_timeout", 30),
+            hedge=HedgePolicy(
+                max_ratio=self.config.get("hedge_max_ratio", 0.1),
+                min_samples=self.config.get("hedge_min_samples", 20),
+            ),
+            hedge_endpoints=[name for name in self.config.get("hedge_targets", []) if name in UPSTREAM_ENDPOINTS],
+        )
+        # Minecraft状态查询的对冲策略，与上游接口分开统计对冲比例
+        self.mc_hedge = HedgePolicy(
+            max_ratio=self.config.get("hedge_max_ratio", 0.1),
+            min_samples=self.config.get("hedge_min_samples", 20),
+        )
+        # 天气、油价和服务器状态的多供应商回退链，列表顺序为默认优先级
+        provider_chains = {
+            "天气": [
+                {"name": "uapis", "fetch": self.fetch_weather_uapis},
+                {"name": "wttr.in", "fetch": self.fetch_weather_wttr},
+            ],
+            "油价": [
+                {"name": "wqwlkj", "fetch": self.fetch_oil_price_wqwlkj},
+            ],
+            "mcs": [
+                {"name": "直连", "fetch": self.ping_mc_status},
+                {"name": "uapis", "fetch": self.fetch_mc_status_uapis},
+            ],
+        }
+        if self.config.get("oil_tianapi_key", ""):
+            # 天行数据只能按省份查询
+            provider_chains["油价"].append({
+                "name": "tianapi",
+                "fetch": self.fetch_oil_price_tianapi,
+                "supports": lambda city_name: normalize_region_name(city_name) in OIL_PRICE_REGIONS,
+            })
+        if not self.config.get("provider_fallback_enabled", True):
+            provider_chains = {query: chain[:1] for query, chain in provider_chains.items()}
+        self.providers = ProviderRouter(provider_chains)
+
+        # 内容审核服务：本地预过滤 + 结论缓存 + 批量AI审核
+        block_words = DEFAULT_MODERATION_BLOCK_WORDS + list(self.config.get("moderation_block_words", []))
+        self.moderation = ModerationService(
+            ModerationPreFilter(
+                block_words,
+                safe_max_length=self.config.get("moderation_safe_max_length", 0),
+            ),
+            # AI审核结论缓存，键为归一化文本的哈希
+            TTLCache(
+                maxsize=self.config.get("moderation_cache_size", 2048),
+                ttl=self.config.get("moderation_cache_ttl", 86400),
+            ),
+            lambda data: self.upstream.fetch("内容审核", data=data),
+            max_concurrency=self.config.get("moderation_max_concurrency", 4),
+            batch_size=self.config.get("moderation_batch_size", 8),
+            batch_window=self.config.get("moderation_batch_window_ms", 50) / 1000,
+        )
+
+        # 原生Minecraft服务器状态查询客户端
+        self.mc_status_client = MinecraftStatusClient(
+            timeout=self.config.get("mc_status_timeout", 5),
+            dns_server=self.config.get("mc_dns_server", ""),
+        )
+
+        # Minecraft服务器关注列表（按会话保存）与后台轮询结果
+        self.mc_watchlist_path = f"data/{PLUGIN_NAME}_mc_watchlist.json"
+        self.mc_watchlist = {}
+        if os.path.exists(self.mc_watchlist_path):
+            with open(self.mc_watchlist_path, "r", encoding="utf-8") as f:
+                self.mc_watchlist = json.loads(f.read())
+        # 间隔过小会让后台查询空转，最少30秒
+        self.mc_watch_interval = max(30, self.config.get("mc_watch_interval", 300))
+        self.mc_status_results = TTLCache(maxsize=512, ttl=self.mc_watch_interval * 2)
+        self.start_background_task(self.mc_watch_loop())
+
+        # socks5代理池，后台预取并健康检查
+        self.proxy_pool = ProxyPool(
+            lambda: self.upstream.fetch("代理ip", params={"agreement": "socks5"}),
+            size=self.config.get("proxy_pool_size", 10),
+            check_target=self.config.get("proxy_check_target", "www.baidu.com:80"),
+            check_timeout=self.config.get("proxy_check_timeout", 5),
+        )
+        if self.config.get("proxy_pool_enabled", True):
+            self.start_background_task(self.proxy_pool_loop())
+
+        # 全国油价表，每天定时整体刷新
+        self.oil_price_table = OilPriceTable(f"data/{PLUGIN_NAME}_oil_prices.json")
+        self.start_background_task(self.oil_price_loop())
+
+        # 天气缓存，按归一化城市名保存每一期天气数据和渲染好的卡片
+        self.weather_cache = TTLCache(maxsize=512, ttl=86400)
+
+        # 实时科技资讯快照，后台定时刷新
+        self.tech_news_snapshot = None
+        self.start_background_task(self.tech_news_loop())
+
+        # AI绘画任务队列
+        self.painting_queue = FairJobQueue(
+            concurrency=self.config.get("painting_concurrency", 2),
+            max_wait=self.config.get("painting_max_wait", 300),
+            max_queue=self.config.get("painting_max_queue", 50),
+            per_user_max=self.config.get("painting_per_user_max", 2),
+        )
+
+        # HTML模板在首次使用时加载，修改模板文件后自动重新加载
+        self.templates = TemplateLoader(TEMPLATE_DIR, hot_reload=self.config.get("template_hot_reload", True))
+
+        # 全局图片渲染调度
+        self.render_scheduler = RenderScheduler(
+            concurrency=self.config.get("render_concurrency", 2),
+            max_queue=self.config.get("render_max_queue", 20),
+        )
+
+        # 固定版式卡片的本地Pillow绘制引擎，按指令启用
+        self.card_renderer = CardRenderer(
+            f"data/{PLUGIN_NAME}_cards",
+            font_path=self.config.get("card_font_path", ""),
+        )
+
+        # AI绘画提示词缓存（可选）
+        self.painting_cache = None
+        if self.config.get("painting_cache_enabled", False):
+            self.painting_cache = PromptImageCache(
+                f"data/{PLUGIN_NAME}_painting_cache.json",
+                ttl=self.config.get("painting_cache_ttl", 7 * 86400),
+                max_prompts=self.config.get("painting_cache_max_prompts", 200),
+                max_variants=self.config.get("painting_cache_max_variants", 3),
+                reuse_probability=self.config.get("painting_cache_reuse_probability", 0.8),
+            )
+
+        # 城际路线缓存与热门路线预取
+        self.route_cache = TTLCache(
+            maxsize=self.config.get("route_cache_size", 1024),
+            ttl=self.config.get("route_cache_ttl", 7 * 86400),
+        )
+        if self.config.get("route_popular_pairs", []):
+            self.start_background_task(self.route_prefetch_loop())
+
+        # 启动预热在后台进行，不阻塞Bot启动
+        if self.config.get("warmup_enabled", True):
+            self.start_background_task(self.warm_up())
+
+        # 本机Prometheus文本格式指标端口，默认关闭
+        if self.config.get("metrics_port", 0):
+            self.start_background_task(self.start_metrics_server(self.config.get("metrics_port", 0)))
+
+    def start_background_task(self, coro):
+        """启动后台任务，插件卸载时统一取消"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def get_http_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话，复用连接和DNS解析结果"""
+        if self.http_session is None or self.http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.get("http_pool_size", 100),
+                ttl_dns_cache=self.config.get("http_dns_cache_ttl", 300),
+                keepalive_timeout=self.config.get("http_keepalive_timeout", 60),
+            )
+            self.http_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        return self.http_session
+
+    async def warm_up(self):
+        """启动预热：编译模板、解析上游域名并建立连接、执行一次丢弃的渲染"""
+        await asyncio.sleep(self.config.get("warmup_delay", 5))
+        started = time.monotonic()
+        
+        # 1. 编译全部模板
+        for file_name in os.listdir(TEMPLATE_DIR):
+            if file_name.endswith(".html"):
+                self.templates.get(file_name[:-5])
+        
+        # 2. 解析上游域名并在连接池中留下保活连接，忽略返回内容
+        session = self.get_http_session()
+        
+        async def touch(url):
+            try:
+                async with session.head(url, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=5)):
+                    pass
+            except Exception as e:
+                logger.debug(f"预热连接 {url} 失败：{e}")
+        
+        await asyncio.gather(*(touch(url) for url in self.config.get("warmup_urls", []) or DEFAULT_WARMUP_URLS))
+        
+        # 3. 丢弃的渲染：启动浏览器/渲染服务，并加载本地绘制用到的字体和背景
+        try:
+            await self.render_html(self.templates.get("menu").replace("{{content}}", ""), "menu",
+                                   priority=RENDER_PRIORITY_BACKGROUND)
+            for command in self.config.get("pillow_card_commands", []):
+                if command in CARD_LAYOUTS and self.card_renderer.available:
+                    await self.card_renderer.render(command, CARD_BENCHMARK_SAMPLES[command])
+        except Exception as e:
+            logger.warning(f"预热渲染失败：{e}")
+        
+        logger.info(f"工具箱预热完成，耗时 {time.monotonic() - started:.1f} 秒")
+
+    async def render_html(self, html: str, profile: str = "default", priority: int = RENDER_PRIORITY_NORMAL,
+                          deadline: Deadline = None):
+        """按模板的输出档位经全局渲染调度器调用html_render，队列过深时抛出RenderQueueFull，
+        排队加渲染超出指令剩余预算时抛出DeadlineExceeded"""
+        started = time.monotonic()
+        if self.config.get("render_adaptive_output", True):
+            html, options = render_output_options(profile, html)
+        else:
+            options = dict(RENDER_LEGACY_OPTIONS)
+        render = self.render_scheduler.run(
+            lambda: self.html_render(html, {}, True, options),
+            priority,
+        )
+        try:
+            if deadline is None:
+                return await render
+            if deadline.expired:
+                render.close()
+                raise DeadlineExceeded("渲染前时间预算已用完")
+            try:
+                return await asyncio.wait_for(render, deadline.remaining())
+            except asyncio.TimeoutError as e:
+                if deadline.expired:
+                    raise DeadlineExceeded("图片渲染超出指令时间预算") from e
+                raise
+        except Exception as e:
+            record_error("渲染", e)
+            raise
+        finally:
+            # 排队时间也计入渲染阶段
+            record_phase("render", started)
+
+    def command_deadline(self, command: str) -> Deadline:
+        """按配置创建指令的端到端时间预算"""
+        budget = self.config.get("command_deadline", 40)
+        for item in self.config.get("command_deadline_overrides", []):
+            name, _, seconds = item.partition("=")
+            if name.strip() == command:
+                try:
+                    budget = float(seconds)
+                except ValueError:
+                    logger.warning(f"指令时间预算配置格式错误：{item}")
+                break
+        return Deadline(budget)
+
+    async def render_card(self, command: str, template: str, template_data: dict, profile: str,
+                          priority: int = RENDER_PRIORITY_NORMAL) -> str:
+        """渲染固定版式卡片：该指令启用了Pillow引擎且可用时本地绘制，否则填充HTML模板走html_render"""
+        if command in self.config.get("pillow_card_commands", []) and self.card_renderer.available:
+            started = time.monotonic()
+            try:
+                return await self.card_renderer.render(command, template_data)
+            except Exception as e:
+                record_error("本地绘制", e)
+                logger.error(f"本地绘制{command}卡片失败，改用html_render：{e}")
+            finally:
+                record_phase("render", started)
+        
+        return await self.render_html(fill_template(template, template_data), profile, priority)
+
+    async def benchmark_render(self, render_once, rounds: int) -> dict:
+        """重复执行渲染统计耗时。不统计内存：Pillow的图像缓冲区和浏览器进程都在Python分配器之外，
+        同时运行的其他协程也会干扰，测出的数字无法用来比较两种引擎"""
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await render_once()
+            timings.append((time.perf_counter() - started) * 1000)
+        
+        return {
+            "avg_ms": sum(timings) / len(timings),
+            "max_ms": max(timings),
+        }
+
+    def get_cached_sleep_count(self, umo_id: str, date_str: str) -> int:
+        """获取缓存的睡觉人数"""
+        if umo_id not in self.daily_sleep_cache:
+            self.daily_sleep_cache[umo_id] = {}
+        return self.daily_sleep_cache[umo_id].get(date_str, -1)
+
+    def update_sleep_cache(self, umo_id: str, date_str: str, count: int):
+        """更新睡觉人数缓存"""
+        if umo_id not in self.daily_sleep_cache:
+            self.daily_sleep_cache[umo_id] = {}
+        self.daily_sleep_cache[umo_id][date_str] = count
+
+    def invalidate_sleep_cache(self, umo_id: str, date_str: str):
+        """使缓存失效"""
+        if umo_id in self.daily_sleep_cache and date_str in self.daily_sleep_cache[umo_id]:
+            del self.daily_sleep_cache[umo_id][date_str]
+
+    def check_good_morning_cd(self, user_id: str, current_time: datetime.datetime) -> bool:
+        """检查用户是否在CD中，返回True表示在CD中"""
+        if user_id not in self.good_morning_cd:
+            return False
+        
+        last_time = self.good_morning_cd[user_id]
+        time_diff = (current_time - last_time).total_seconds()
+        return time_diff < 1800
+
+    def update_good_morning_cd(self, user_id: str, current_time: datetime.datetime):
+        """更新用户的CD时间"""
+        self.good_morning_cd[user_id] = current_time
+
+    def format_moderation_block(self, verdict: dict) -> str:
+        """生成解密内容被拦截时的提示文本"""
+        severity = moderation_severity(verdict["score"])
+        if verdict["reason"]:
+            return f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规内容含：{verdict['reason']}\n违规程度：{verdict['score']}分<{severity}>"
+        return f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规程度：{verdict['score']}分<{severity}>"
+
+    def format_calendar_text(self, data: dict) -> str:
+        """万年历图片来不及生成时的文字版结果"""
+        response = f"{data['year']}年{data['month']}月{data['day']}日 星期{data['cnDay']}\n"
+        response += f"农历：{data['lunarYear']}年{data['lunarMonth']}月{data['lunarDate']}日\n"
+        response += f"干支：{data['gzYear']}年{data['gzMonth']}月{data['gzDate']}日\n"
+        response += f"生肖：{data['animal']}\n"
+        response += f"宜：{data['suit']}\n"
+        response += f"忌：{data['avoid']}\n\n图片生成超时，以上为文字版结果"
+        return response
+
     async def text_to_image_menu_style(self, text: str) -> str:
         """使用菜单样式的HTML模板生成图片"""
         try:
@@ -2214,21 +3048,10 @@ class Main(Star):
             formatted_html = '\n'.join(html_parts)
             
             # 渲染HTML模板
-            html_content = self.MENU_TEMPLATE.replace("{{content}}", formatted_html)
-            
-            # 使用html_render函数生成图片
-            options = {
-                "full_page": True,
-                "type": "jpeg",
-                "quality": 95,
-            }
+            html_content = self.templates.get("menu").replace("{{content}}", formatted_html)
             
-            image_url = await self.html_render(
-                html_content,  # 渲染后的HTML内容
-                {},  # 空数据字典
-                True,  # 返回URL
-                options  # 图片生成选项
-            )
+            # 按模板的输出档位生成图片
+            image_url = await self.render_html(html_content, "menu", priority=RENDER_PRIORITY_HIGH)
             
             return image_url
         except Exception as e:
@@ -2237,6 +3060,7 @@ class Main(Star):
             return await self.text_to_image(text)
 
     @filter.regex(r"^(早安|晚安)")
+    @instrumented("早晚安")
     async def good_morning(self, message: AstrMessageEvent):
         """和Bot说早晚安，记录睡眠时间，培养良好作息"""
         umo_id = message.unified_msg_origin
@@ -2319,6 +3143,7 @@ class Main(Star):
 
 
     @filter.command("战力查询")
+    @instrumented("战力查询")
     async def hero_power(self, message: AstrMessageEvent):
         """王者英雄战力查询，显示四个战区数据"""
         msg = message.message_str.replace("战力查询", "").strip()
@@ -2328,7 +3153,6 @@ class Main(Star):
             return
         
         hero_name = msg.strip()
-        api_url = "https://yunzhiapi.cn/API/wzzlcx.php"
         
         try:
             # 构造请求参数（注意API文档中的参数名是hero，但示例中写的是hreo，这里使用正确的hero）
@@ -2337,119 +3161,95 @@ class Main(Star):
                 "type": "json"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result("请求战力查询失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    # 先读取响应文本，再使用json.loads()解析，解决Content-Type问题
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    if result.get("code") != 200:
-                        yield message.plain_result(f"查询失败：{result.get('message', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    data = result.get("data", {})
-                    if not data:
-                        yield message.plain_result("未查询到该英雄的战力信息").use_t2i(False)
-                        return
-                    
-                    hero_data = data.get("hero_data", {})
-                    platforms = data.get("platforms", {})
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 增强数据处理，确保每个平台都有完整的数据
-                    # 定义默认平台数据
-                    default_platform_data = {
-                        "province": "未知省",
-                        "provincePower": "0",
-                        "city": "未知市",
-                        "cityPower": "0",
-                        "area": "未知区",
-                        "areaPower": "0",
-                        "guobiao": "0"
-                    }
-                    
-                    # 确保每个平台都有数据
-                    aqq_data = {**default_platform_data, **platforms.get('aqq', {})}
-                    awx_data = {**default_platform_data, **platforms.get('awx', {})}
-                    iqq_data = {**default_platform_data, **platforms.get('iqq', {})}
-                    iwx_data = {**default_platform_data, **platforms.get('iwx', {})}
-                    
-                    # 添加日志记录，便于调试
-                    logger.info(f"战力查询数据 - 英雄: {hero_name}, 平台数据: {platforms.keys()}")
-                    
-                    # 准备模板数据，包含四个战区的战力信息
-                    template_data = {
-                        "hero_name": hero_data.get('name', hero_name),
-                        "updatetime": hero_data.get('updatetime', current_time),
-                        "current_time": current_time,
-                        
-                        # Android QQ区数据
-                        "aqq_guobiao": aqq_data.get('guobiao', '0'),
-                        "aqq_province": aqq_data.get('province', '未知省'),
-                        "aqq_provincePower": aqq_data.get('provincePower', '0'),
-                        "aqq_city": aqq_data.get('city', '未知市'),
-                        "aqq_cityPower": aqq_data.get('cityPower', '0'),
-                        "aqq_area": aqq_data.get('area', '未知区'),
-                        "aqq_areaPower": aqq_data.get('areaPower', '0'),
-                        
-                        # Android 微信区数据
-                        "awx_guobiao": awx_data.get('guobiao', '0'),
-                        "awx_province": awx_data.get('province', '未知省'),
-                        "awx_provincePower": awx_data.get('provincePower', '0'),
-                        "awx_city": awx_data.get('city', '未知市'),
-                        "awx_cityPower": awx_data.get('cityPower', '0'),
-                        "awx_area": awx_data.get('area', '未知区'),
-                        "awx_areaPower": awx_data.get('areaPower', '0'),
-                        
-                        # iOS QQ区数据
-                        "iqq_guobiao": iqq_data.get('guobiao', '0'),
-                        "iqq_province": iqq_data.get('province', '未知省'),
-                        "iqq_provincePower": iqq_data.get('provincePower', '0'),
-                        "iqq_city": iqq_data.get('city', '未知市'),
-                        "iqq_cityPower": iqq_data.get('cityPower', '0'),
-                        "iqq_area": iqq_data.get('area', '未知区'),
-                        "iqq_areaPower": iqq_data.get('areaPower', '0'),
-                        
-                        # iOS 微信区数据
-                        "iwx_guobiao": iwx_data.get('guobiao', '0'),
-                        "iwx_province": iwx_data.get('province', '未知省'),
-                        "iwx_provincePower": iwx_data.get('provincePower', '0'),
-                        "iwx_city": iwx_data.get('city', '未知市'),
-                        "iwx_cityPower": iwx_data.get('cityPower', '0'),
-                        "iwx_area": iwx_data.get('area', '未知区'),
-                        "iwx_areaPower": iwx_data.get('areaPower', '0')
-                    }
-                    
-                    # 渲染HTML模板
-                    html_content = self.HERO_POWER_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
+            result = await self.upstream.fetch("战力查询", params=params)
+                
+            data = result.get("data", {})
+            if not data:
+                yield message.plain_result("未查询到该英雄的战力信息").use_t2i(False)
+                return
+                
+            hero_data = data.get("hero_data", {})
+            platforms = data.get("platforms", {})
+                
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+                
+            # 增强数据处理，确保每个平台都有完整的数据
+            # 定义默认平台数据
+            default_platform_data = {
+                "province": "未知省",
+                "provincePower": "0",
+                "city": "未知市",
+                "cityPower": "0",
+                "area": "未知区",
+                "areaPower": "0",
+                "guobiao": "0"
+            }
+                
+            # 确保每个平台都有数据
+            aqq_data = {**default_platform_data, **platforms.get('aqq', {})}
+            awx_data = {**default_platform_data, **platforms.get('awx', {})}
+            iqq_data = {**default_platform_data, **platforms.get('iqq', {})}
+            iwx_data = {**default_platform_data, **platforms.get('iwx', {})}
+                
+            # 调试日志，记录返回了哪些平台的数据
+            self.upstream_log.log("战力查询", list(platforms), hero=hero_name)
+                
+            # 准备模板数据，包含四个战区的战力信息
+            template_data = {
+                "hero_name": hero_data.get('name', hero_name),
+                "updatetime": hero_data.get('updatetime', current_time),
+                "current_time": current_time,
+                    
+                # Android QQ区数据
+                "aqq_guobiao": aqq_data.get('guobiao', '0'),
+                "aqq_province": aqq_data.get('province', '未知省'),
+                "aqq_provincePower": aqq_data.get('provincePower', '0'),
+                "aqq_city": aqq_data.get('city', '未知市'),
+                "aqq_cityPower": aqq_data.get('cityPower', '0'),
+                "aqq_area": aqq_data.get('area', '未知区'),
+                "aqq_areaPower": aqq_data.get('areaPower', '0'),
+                    
+                # Android 微信区数据
+                "awx_guobiao": awx_data.get('guobiao', '0'),
+                "awx_province": awx_data.get('province', '未知省'),
+                "awx_provincePower": awx_data.get('provincePower', '0'),
+                "awx_city": awx_data.get('city', '未知市'),
+                "awx_cityPower": awx_data.get('cityPower', '0'),
+                "awx_area": awx_data.get('area', '未知区'),
+                "awx_areaPower": awx_data.get('areaPower', '0'),
+                    
+                # iOS QQ区数据
+                "iqq_guobiao": iqq_data.get('guobiao', '0'),
+                "iqq_province": iqq_data.get('province', '未知省'),
+                "iqq_provincePower": iqq_data.get('provincePower', '0'),
+                "iqq_city": iqq_data.get('city', '未知市'),
+                "iqq_cityPower": iqq_data.get('cityPower', '0'),
+                "iqq_area": iqq_data.get('area', '未知区'),
+                "iqq_areaPower": iqq_data.get('areaPower', '0'),
+                    
+                # iOS 微信区数据
+                "iwx_guobiao": iwx_data.get('guobiao', '0'),
+                "iwx_province": iwx_data.get('province', '未知省'),
+                "iwx_provincePower": iwx_data.get('provincePower', '0'),
+                "iwx_city": iwx_data.get('city', '未知市'),
+                "iwx_cityPower": iwx_data.get('cityPower', '0'),
+                "iwx_area": iwx_data.get('area', '未知区'),
+                "iwx_areaPower": iwx_data.get('areaPower', '0')
+            }
+                
+            # 渲染HTML模板
+            html_content = self.templates.get("hero_power")
+            for key, value in template_data.items():
+                placeholder = "{{" + key + "}}"
+                html_content = html_content.replace(placeholder, str(value))
+                
+            # 按模板的输出档位生成图片
+            image_url = await self.render_html(html_content, "hero_power")
+                
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -2463,12 +3263,75 @@ class Main(Star):
             logger.error("JSON解析错误")
             yield message.plain_result("服务器返回数据格式错误").use_t2i(False)
             return
+        except UpstreamError as e:
+            yield message.plain_result(f"查询失败：{e}").use_t2i(False)
+            return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求战力查询时发生错误：{e}")
             yield message.plain_result(f"请求战力查询时发生错误：{str(e)}").use_t2i(False)
             return
 
+    def route_cache_key(self, from_city: str, to_city: str) -> tuple:
+        """路线缓存键：城市名归一化后按方向区分，往返的路线步骤、路况和过路费不同"""
+        return (normalize_region_name(from_city), normalize_region_name(to_city))
+
+    async def fetch_city_route(self, from_city: str, to_city: str) -> dict:
+        """查询城际路线并写入缓存，失败时抛出ValueError"""
+        # 构造请求参数
+        payload = {
+            "from": from_city,
+            "to": to_city
+        }
+        
+        result = await self.upstream.fetch("路线查询", data=payload)
+        
+        data = result.get("data", {})
+        if not data:
+            raise ValueError("未查询到该路线的信息")
+        
+        route = {
+            "from": result.get('from', from_city),
+            "to": result.get('to', to_city),
+            "data": data
+        }
+        self.route_cache.set(self.route_cache_key(from_city, to_city), route)
+        return route
+
+    async def route_prefetch_loop(self):
+        """热门路线预取：启动时补齐缓存，之后每天在低峰时段刷新"""
+        refresh_hour = self.config.get("route_prefetch_hour", 4)
+        tz = datetime.timezone(datetime.timedelta(hours=8))
+        first_run = True
+        while True:
+            pairs = []
+            for pair in self.config.get("route_popular_pairs", []):
+                cities = re.split(r"[\s\-—>→,，]+", pair.strip())
+                if len(cities) >= 2:
+                    pairs.append((cities[0], cities[1]))
+            
+            for from_city, to_city in pairs:
+                # 启动时只补齐缺失的路线
+                if first_run and self.route_cache.get(self.route_cache_key(from_city, to_city)) is not None:
+                    continue
+                try:
+                    await self.fetch_city_route(from_city, to_city)
+                except Exception as e:
+                    logger.warning(f"预取路线 {from_city}-{to_city} 失败：{e}")
+                # 逐条请求，避免集中压到上游
+                await asyncio.sleep(1)
+            first_run = False
+            
+            now = datetime.datetime.now(tz)
+            next_run = now.replace(hour=refresh_hour, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += datetime.timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+
     @filter.command("路线查询")
+    @instrumented("路线查询")
     async def city_route(self, message: AstrMessageEvent):
         """城际路线查询，支持异步请求"""
         msg = message.message_str.replace("路线查询", "").strip()
@@ -2486,76 +3349,49 @@ class Main(Star):
         from_city = parts[0]
         to_city = parts[1]
         
-        api_url = "https://api.pearktrue.cn/api/citytravelroutes/"
-        
         try:
-            # 构造请求参数
-            payload = {
-                "from": from_city,
-                "to": to_city
+            # 优先使用路线缓存（“广州 深圳”与“广州市 深圳市”共用一条）
+            route = self.route_cache.get(self.route_cache_key(from_city, to_city))
+            if route is None:
+                try:
+                    route = await self.fetch_city_route(from_city, to_city)
+                except ValueError as e:
+                    yield message.plain_result(f"查询失败：{str(e)}").use_t2i(False)
+                    return
+            
+            data = route["data"]
+            result_from, result_to = route["from"], route["to"]
+
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 准备模板数据
+            template_data = {
+                "from_city": result_from,
+                "to_city": result_to,
+                "corese": data.get('corese', ''),
+                "distance": data.get('distance', '0'),
+                "time": data.get('time', '0'),
+                "fuelcosts": data.get('fuelcosts', '0'),
+                "bridgetoll": data.get('bridgetoll', '0'),
+                "totalcost": data.get('totalcost', '0'),
+                "roadconditions": data.get('roadconditions', '暂无数据'),
+                "current_time": current_time
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(api_url, json=payload) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result("请求路线查询失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    # 先读取响应文本，再使用json.loads()解析，解决Content-Type问题
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    if result.get("code") != 200:
-                        yield message.plain_result(f"查询失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    data = result.get("data", {})
-                    if not data:
-                        yield message.plain_result("未查询到该路线的信息").use_t2i(False)
-                        return
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    template_data = {
-                        "from_city": result.get('from', from_city),
-                        "to_city": result.get('to', to_city),
-                        "corese": data.get('corese', ''),
-                        "distance": data.get('distance', '0'),
-                        "time": data.get('time', '0'),
-                        "fuelcosts": data.get('fuelcosts', '0'),
-                        "bridgetoll": data.get('bridgetoll', '0'),
-                        "totalcost": data.get('totalcost', '0'),
-                        "roadconditions": data.get('roadconditions', '暂无数据'),
-                        "current_time": current_time
-                    }
-                    
-                    # 渲染HTML模板
-                    html_content = self.ROUTE_QUERY_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
-                        
+            # 渲染HTML模板
+            html_content = self.templates.get("route_query")
+            for key, value in template_data.items():
+                placeholder = "{{" + key + "}}"
+                html_content = html_content.replace(placeholder, str(value))
+            
+            # 按模板的输出档位生成图片
+            image_url = await self.render_html(html_content, "route_query")
+            
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
+                
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result("无法连接到路线查询服务器，请稍后重试或检查网络连接").use_t2i(False)
@@ -2568,12 +3404,48 @@ class Main(Star):
             logger.error("JSON解析错误")
             yield message.plain_result("服务器返回数据格式错误").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求路线查询时发生错误：{e}")
             yield message.plain_result(f"请求路线查询时发生错误：{str(e)}").use_t2i(False)
             return
 
+    async def generate_painting(self, prompt: str) -> str:
+        """请求AI绘画并下载图片到本地，返回文件路径，失败时抛出ValueError"""
+        # 构造请求参数，使用默认的1024x1024大小，guidance设为最高10，batch为1
+        params = {
+            "msg": prompt,
+            "size": PAINTING_SIZE,
+            "guidance": PAINTING_GUIDANCE,
+            "batch": 1
+        }
+        
+        # 返回的文本不是图片地址时登记表判定为失败
+        image_url = await self.upstream.fetch("绘画", params=params)
+        
+        # 下载图片到本地
+        import uuid
+        
+        # 创建存储目录
+        save_dir = f"data/{self.PLUGIN_NAME}_images"
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+        
+        # 生成唯一文件名
+        file_name = f"{uuid.uuid4().hex}.jpg"
+        file_path = os.path.join(save_dir, file_name)
+        
+        # 下载图片
+        image_bytes = await self.upstream.fetch("图片下载", url=image_url)
+        with open(file_path, "wb") as f:
+            f.write(image_bytes)
+        
+        return file_path
+
     @filter.command("绘画")
+    @instrumented("绘画")
     async def ai_painting(self, message: AstrMessageEvent):
         """AI绘画功能，根据提示词生成图片"""
         # 提取提示词，命令匹配会自动处理命令前缀
@@ -2584,60 +3456,49 @@ class Main(Star):
             return
         
         prompt = msg.strip()
-        api_url = "https://yunzhiapi.cn//API/ks/api.php"
         
         try:
-            # 先回复用户正在生成图片
-            yield message.plain_result("正在制作精美图片..........").use_t2i(False)
-            
-            # 构造请求参数，使用默认的1024x1024大小，guidance设为最高10，batch为1
-            params = {
-                "msg": prompt,
-                "size": "1024x1024",
-                "guidance": 10,
-                "batch": 1
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result("请求AI绘画失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    image_url = await resp.text()
-                    
-                    # 检查返回的是否为有效的URL
-                    if not image_url.startswith("http"):
-                        yield message.plain_result(f"AI绘画生成失败：{image_url}").use_t2i(False)
-                        return
-                    
-                    # 下载图片到本地并发送
-                    import uuid
-                    import os
+            # 热门提示词直接复用已生成的图片
+            if self.painting_cache is not None:
+                cached_path = self.painting_cache.get(prompt, PAINTING_SIZE, PAINTING_GUIDANCE)
+                if cached_path is not None:
                     from astrbot.api.message_components import Image
-                    
-                    # 创建存储目录
-                    save_dir = f"data/{self.PLUGIN_NAME}_images"
-                    if not os.path.exists(save_dir):
-                        os.makedirs(save_dir)
-                    
-                    # 生成唯一文件名
-                    file_name = f"{uuid.uuid4().hex}.jpg"
-                    file_path = os.path.join(save_dir, file_name)
-                    
-                    # 下载图片
-                    async with session.get(image_url, timeout=30) as img_resp:
-                        if img_resp.status != 200:
-                            yield message.plain_result("下载图片失败，服务器返回错误状态码").use_t2i(False)
-                            return
-                        
-                        with open(file_path, "wb") as f:
-                            f.write(await img_resp.read())
-                    
-                    # 使用本地文件路径发送图片
-                    yield message.chain_result([Image.fromFileSystem(file_path)]).use_t2i(False)
+                    yield message.chain_result([Image.fromFileSystem(cached_path)]).use_t2i(False)
                     return
+            
+            # 加入绘画队列，按群和用户轮转调度
+            user_id = message.message_obj.sender.user_id
+            group_id = message.message_obj.group_id or f"private_{user_id}"
+            try:
+                future, position = self.painting_queue.submit(
+                    group_id, user_id, lambda: self.generate_painting(prompt)
+                )
+            except JobQueueFull as e:
+                yield message.plain_result(f"绘画队列繁忙：{str(e)}").use_t2i(False)
+                return
+            
+            # 回复排队位置
+            if position is None:
+                yield message.plain_result("已开始绘制，请稍候...").use_t2i(False)
+            else:
+                yield message.plain_result(f"已加入绘画队列，当前排在第 {position + 1} 位，请稍候...").use_t2i(False)
+            
+            try:
+                file_path = await future
+            except JobQueueTimeout as e:
+                yield message.plain_result(f"绘画排队超时：{str(e)}，请稍后再试").use_t2i(False)
+                return
+            except ValueError as e:
+                yield message.plain_result(str(e)).use_t2i(False)
+                return
+            
+            if self.painting_cache is not None:
+                self.painting_cache.add(prompt, PAINTING_SIZE, PAINTING_GUIDANCE, file_path)
+            
+            # 使用本地文件路径发送图片
+            from astrbot.api.message_components import Image
+            yield message.chain_result([Image.fromFileSystem(file_path)]).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -2652,7 +3513,130 @@ class Main(Star):
             yield message.plain_result(f"请求AI绘画时发生错误：{str(e)}").use_t2i(False)
             return
 
+    def save_mc_watchlist(self):
+        """保存Minecraft服务器关注列表"""
+        with open(self.mc_watchlist_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.mc_watchlist, ensure_ascii=False, indent=2))
+
+    def parse_mc_addresses(self, msg: str) -> list:
+        """解析以空格或逗号分隔的多个服务器地址，去重并保持顺序"""
+        addresses = []
+        for address in re.split(r"[\s,，]+", msg):
+            address = address.strip().lower()
+            if address and address not in addresses:
+                addresses.append(address)
+        return addresses
+
+    async def query_mc_status(self, address: str, hedge: bool = True, fallback: bool = True) -> dict:
+        """查询单个服务器状态；直连查询失败或离线时按供应商链回退到第三方接口，优先采用在线结果"""
+        if not fallback:
+            return await self.ping_mc_status(address, hedge)
+        return await self.providers.call("mcs", address, accept=lambda result: result["online"])
+
+    async def ping_mc_status(self, address: str, hedge: bool = True) -> dict:
+        """直连查询服务器状态；开启对冲时超过该服务器的历史p90仍未返回则补发一次查询，优先采用在线结果"""
+        if not hedge or "mcs" not in self.config.get("hedge_targets", []):
+            return await self.mc_status_client.status(address)
+        return await self.mc_hedge.run(
+            address,
+            lambda: self.mc_status_client.status(address),
+            accept=lambda result: result["online"],
+        )
+
+    async def fetch_mc_status_uapis(self, address: str) -> dict:
+        """通过第三方接口查询服务器状态，作为直连查询的备用"""
+        parse_server_address(address)
+        result = await self.upstream.fetch("mc状态", params={"server": address}, server=address)
+        return mc_status_from_uapis(result, address)
+
+    async def probe_mc_servers(self, addresses: list, hedge: bool = True, fallback: bool = True) -> list:
+        """并发查询多个服务器状态，结果写入状态缓存"""
+        results = await asyncio.gather(
+            *(self.query_mc_status(address, hedge, fallback) for address in addresses),
+            return_exceptions=True
+        )
+        checked_at = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+        statuses = []
+        for address, result in zip(addresses, results):
+            if isinstance(result, Exception):
+                # 地址格式错误等情况按离线展示，并在版本栏给出原因
+                result = {
+                    "online": False,
+                    "ip": address,
+                    "port": "-",
+                    "players": 0,
+                    "max_players": 0,
+                    "version": str(result),
+                    "latency_ms": None,
+                }
+            status = {**result, "server_addr": address, "checked_at": checked_at}
+            self.mc_status_results.set(address, status)
+            statuses.append(status)
+        return statuses
+
+    async def get_mc_statuses(self, addresses: list) -> list:
+        """优先使用后台轮询缓存的状态，缺失的服务器并发实时查询"""
+        cached = {address: self.mc_status_results.get(address) for address in addresses}
+        missing = [address for address, status in cached.items() if status is None]
+        if missing:
+            for status in await self.probe_mc_servers(missing):
+                cached[status["server_addr"]] = status
+        return [cached[address] for address in addresses]
+
+    async def mc_watch_loop(self):
+        """后台定时轮询所有会话关注的服务器"""
+        while True:
+            addresses = sorted({address for watchlist in self.mc_watchlist.values() for address in watchlist})
+            if addresses:
+                try:
+                    # 后台轮询不赶时间，不做对冲
+                    await self.probe_mc_servers(addresses, hedge=False, fallback=False)
+                except Exception as e:
+                    logger.error(f"轮询Minecraft服务器状态时发生错误：{e}")
+            await asyncio.sleep(self.mc_watch_interval)
+
+    async def render_mc_board(self, statuses: list, priority: int = RENDER_PRIORITY_NORMAL) -> str:
+        """把多个服务器状态渲染为一张状态板图片；实时查询按普通优先级排队，受排队上限限制"""
+        cards = []
+        for status in statuses:
+            online = status.get("online", False)
+            latency = status.get("latency_ms")
+            card_data = {
+                "server_addr": status["server_addr"],
+                "online_status": "online" if online else "offline",
+                "online_text": "在线" if online else "离线",
+                "ip": status.get("ip", "未知"),
+                "port": status.get("port", 25565),
+                "players": status.get("players", 0),
+                "max_players": status.get("max_players", 0),
+                "version": status.get("version", "未知"),
+                "latency": f"{latency}ms" if latency is not None else "-",
+                "checked_at": status.get("checked_at", ""),
+            }
+            card_html = self.templates.get("mc_board_card")
+            for key, value in card_data.items():
+                card_html = card_html.replace("{{" + key + "}}", str(value))
+            cards.append(card_html)
+        
+        current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+        template_data = {
+            "server_count": len(statuses),
+            "online_count": sum(1 for status in statuses if status.get("online")),
+            "server_cards": "".join(cards),
+            "current_time": current_time
+        }
+        
+        # 渲染HTML模板
+        html_content = self.templates.get("mc_board")
+        for key, value in template_data.items():
+            placeholder = "{{" + key + "}}"
+            html_content = html_content.replace(placeholder, str(value))
+        
+        # 按模板的输出档位生成图片
+        return await self.render_html(html_content, "mc_board", priority=priority)
+
     @filter.command("mcs")
+    @instrumented("mcs")
     async def mc_server_status(self, message: AstrMessageEvent):
         """查询Minecraft服务器状态"""
         # 提取服务器地址参数
@@ -2662,131 +3646,195 @@ class Main(Star):
             yield message.plain_result("缺少必要参数，正确示例：\n\nmcs 121.com").use_t2i(False)
             return
         
-        server_addr = msg.strip()
-        api_url = "https://uapis.cn/api/v1/game/minecraft/serverstatus"
+        addresses = self.parse_mc_addresses(msg)
+        if not addresses:
+            yield message.plain_result("缺少必要参数，正确示例：\n\nmcs 121.com").use_t2i(False)
+            return
+        # 单个地址也使用解析后的地址，去掉多余的分隔符和空白
+        server_addr = addresses[0]
         
         try:
-            # 构造请求参数
-            params = {
-                "server": server_addr
+            # 多个地址时并发查询，合成一张状态板
+            if len(addresses) > 1:
+                max_servers = self.config.get("mc_batch_max", 10)
+                if len(addresses) > max_servers:
+                    yield message.plain_result(f"一次最多查询 {max_servers} 个服务器").use_t2i(False)
+                    return
+                image_url = await self.render_mc_board(await self.probe_mc_servers(addresses))
+                yield message.image_result(image_url).use_t2i(False)
+                return
+            
+            # 直接与目标服务器通信（SRV解析 + 状态协议，失败时回退旧版Ping）
+            try:
+                data = await self.query_mc_status(server_addr)
+            except ValueError as e:
+                yield message.plain_result(f"查询失败：{str(e)}").use_t2i(False)
+                return
+            
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 准备模板数据
+            online = data.get('online', False)
+            online_text = "在线" if online else "离线"
+            online_status = "online" if online else "offline"
+            
+            template_data = {
+                "server_addr": server_addr,
+                "online_text": online_text,
+                "online_status": online_status,
+                "ip": data.get('ip', '未知'),
+                "port": data.get('port', 25565),
+                "players": data.get('players', 0),
+                "max_players": data.get('max_players', 0),
+                "version": data.get('version', '未知'),
+                "current_time": current_time
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        try:
-                            raw_content = await resp.text()
-                            result = json.loads(raw_content)
-                            yield message.plain_result(f"查询失败：{result.get('message', '未知错误')}").use_t2i(False)
-                        except json.JSONDecodeError:
-                            yield message.plain_result(f"查询失败：服务器返回错误状态码 {resp.status}").use_t2i(False)
-                        return
-                    
-                    raw_content = await resp.text()
-                    data = json.loads(raw_content)
-                    
-                    # 检查响应是否包含online字段，这是API返回的主要字段
-                    if 'online' not in data:
-                        yield message.plain_result(f"查询失败：服务器返回格式异常").use_t2i(False)
-                        return
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    online = data.get('online', False)
-                    online_text = "在线" if online else "离线"
-                    online_status = "online" if online else "offline"
-                    
-                    template_data = {
-                        "server_addr": server_addr,
-                        "online_text": online_text,
-                        "online_status": online_status,
-                        "ip": data.get('ip', '未知'),
-                        "port": data.get('port', 25565),
-                        "players": data.get('players', 0),
-                        "max_players": data.get('max_players', 0),
-                        "version": data.get('version', '未知'),
-                        "current_time": current_time
-                    }
-                    
-                    # 渲染HTML模板
-                    html_content = self.MC_SERVER_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
-                        
-        except aiohttp.ClientError as e:
-            logger.error(f"网络连接错误：{e}")
-            yield message.plain_result("无法连接到查询服务器，请稍后重试或检查网络连接").use_t2i(False)
+            # 渲染卡片（按配置选择本地绘制或html_render）
+            image_url = await self.render_card("mcs", self.templates.get("mc_server"), template_data, "mc_server")
+            
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
             return
+                        
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
             return
-        except json.JSONDecodeError:
-            logger.error("JSON解析错误")
-            yield message.plain_result("服务器返回数据格式错误").use_t2i(False)
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
             return
         except Exception as e:
             logger.error(f"请求Minecraft服务器查询时发生错误：{e}")
             yield message.plain_result(f"请求Minecraft服务器查询时发生错误：{str(e)}").use_t2i(False)
             return
 
+    @filter.command("mc关注")
+    @instrumented("mc关注")
+    async def mc_watch_add(self, message: AstrMessageEvent):
+        """把服务器加入本群的关注列表，后台定时查询状态"""
+        msg = message.message_str.replace("mc关注", "").strip()
+        addresses = self.parse_mc_addresses(msg)
+        
+        if not addresses:
+            yield message.plain_result("正确指令：mc关注 <服务器地址> [服务器地址...]\n\n示例：mc关注 2b2t.org hypixel.net").use_t2i(False)
+            return
+        
+        for address in addresses:
+            try:
+                parse_server_address(address)
+            except ValueError as e:
+                yield message.plain_result(f"服务器地址 {address} 格式错误：{str(e)}").use_t2i(False)
+                return
+        
+        umo_id = message.unified_msg_origin
+        watchlist = self.mc_watchlist.get(umo_id, [])
+        new_addresses = [address for address in addresses if address not in watchlist]
+        max_servers = self.config.get("mc_watchlist_max", 10)
+        if len(watchlist) + len(new_addresses) > max_servers:
+            yield message.plain_result(f"每个群最多关注 {max_servers} 个服务器，当前已关注 {len(watchlist)} 个").use_t2i(False)
+            return
+        
+        self.mc_watchlist[umo_id] = watchlist + new_addresses
+        self.save_mc_watchlist()
+        
+        # 立即查询一次新关注的服务器，状态板无需等待下一轮轮询
+        if new_addresses:
+            self.start_background_task(self.probe_mc_servers(new_addresses, hedge=False, fallback=False))
+        
+        yield message.plain_result(f"已关注 {len(new_addresses)} 个服务器，本群共关注 {len(self.mc_watchlist[umo_id])} 个\n\n发送 mc状态板 查看所有服务器状态").use_t2i(False)
+
+    @filter.command("mc取消关注")
+    @instrumented("mc取消关注")
+    async def mc_watch_remove(self, message: AstrMessageEvent):
+        """把服务器移出本群的关注列表"""
+        msg = message.message_str.replace("mc取消关注", "").strip()
+        addresses = self.parse_mc_addresses(msg)
+        
+        if not addresses:
+            yield message.plain_result("正确指令：mc取消关注 <服务器地址> [服务器地址...]\n\n示例：mc取消关注 2b2t.org").use_t2i(False)
+            return
+        
+        umo_id = message.unified_msg_origin
+        watchlist = self.mc_watchlist.get(umo_id, [])
+        remaining = [address for address in watchlist if address not in addresses]
+        removed = len(watchlist) - len(remaining)
+        
+        if remaining:
+            self.mc_watchlist[umo_id] = remaining
+        else:
+            self.mc_watchlist.pop(umo_id, None)
+        self.save_mc_watchlist()
+        
+        yield message.plain_result(f"已取消关注 {removed} 个服务器，本群还关注 {len(remaining)} 个").use_t2i(False)
+
+    @filter.command("mc状态板")
+    @instrumented("mc状态板")
+    async def mc_status_board(self, message: AstrMessageEvent):
+        """显示本群关注的所有Minecraft服务器状态"""
+        watchlist = self.mc_watchlist.get(message.unified_msg_origin, [])
+        
+        if not watchlist:
+            yield message.plain_result("本群还没有关注服务器\n\n正确指令：mc关注 <服务器地址>\n\n示例：mc关注 2b2t.org").use_t2i(False)
+            return
+        
+        try:
+            # 状态板来自后台轮询的缓存结果，且每个群的关注数量有限，按缓存卡片优先处理
+            image_url = await self.render_mc_board(await self.get_mc_statuses(watchlist), RENDER_PRIORITY_HIGH)
+            yield message.image_result(image_url).use_t2i(False)
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+        except Exception as e:
+            logger.error(f"生成Minecraft服务器状态板时发生错误：{e}")
+            yield message.plain_result(f"生成Minecraft服务器状态板时发生错误：{str(e)}").use_t2i(False)
+
+    async def proxy_pool_loop(self):
+        """后台定时刷新代理池"""
+        interval = self.config.get("proxy_pool_refresh_interval", 120)
+        while True:
+            try:
+                await self.proxy_pool.refresh()
+            except Exception as e:
+                logger.error(f"刷新代理池时发生错误：{e}")
+            await asyncio.sleep(interval)
+
     @filter.command("代理ip")
+    @instrumented("代理ip")
     async def proxy_ip(self, message: AstrMessageEvent):
         """获取socks5代理IP信息"""
-        api_url = "https://api.pearktrue.cn/api/proxy/"
+        # 优先从代理池中取延迟最低的存活代理
+        entry = self.proxy_pool.pick(self.config.get("proxy_pool_serve_top", 3))
+        if entry is not None:
+            response = "成功获取ip\n"
+            response += f"时间：{entry['checked_at']}\n"
+            response += f"类型：{entry['type']}\n"
+            response += f"延迟：{entry['latency_ms']}ms\n"
+            response += f"ip:{entry['proxy']}"
+            yield message.plain_result(response).use_t2i(False)
+            return
         
+        # 代理池为空时直接请求上游接口
         try:
             # 构造请求参数，默认获取socks5代理
             params = {
                 "agreement": "socks5"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result("请求代理IP失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    # 先读取响应文本，再使用json.loads()解析，解决Content-Type问题
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    if result.get("code") != 200:
-                        yield message.plain_result(f"获取失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 格式化输出结果
-                    response = f"成功获取ip\n"
-                    response += f"时间：{result.get('time', '未知')}\n"
-                    response += f"类型：{result.get('type', '未知')}\n"
-                    response += f"ip:{result.get('proxy', '未知')}"
-                    
-                    yield message.plain_result(response).use_t2i(False)
-                    return
-                        
+            result = await self.upstream.fetch("代理ip", params=params)
+            
+            # 格式化输出结果
+            response = "成功获取ip\n"
+            response += f"时间：{result.get('time', '未知')}\n"
+            response += f"类型：{result.get('type', '未知')}\n"
+            response += f"ip:{result.get('proxy', '未知')}"
+            
+            yield message.plain_result(response).use_t2i(False)
+            return
+                
+        except UpstreamError as e:
+            yield message.plain_result(f"获取失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result("无法连接到代理IP服务器，请稍后重试或检查网络连接").use_t2i(False)
@@ -2804,7 +3852,75 @@ class Main(Star):
             yield message.plain_result(f"请求代理IP时发生错误：{str(e)}").use_t2i(False)
             return
 
+    async def fetch_oil_price(self, city_name: str) -> dict:
+        """查询单个地区的油价，按供应商链依次回退，全部失败时抛出ValueError"""
+        return await self.providers.call("油价", city_name, accept=bool)
+
+    async def fetch_oil_price_tianapi(self, city_name: str) -> dict:
+        """通过天行数据接口按省份查询油价，需要配置oil_tianapi_key"""
+        params = {
+            "key": self.config.get("oil_tianapi_key", ""),
+            "prov": normalize_region_name(city_name)
+        }
+        result = await self.upstream.fetch("油价查询tianapi", params=params, city=city_name)
+        return oil_prices_from_tianapi(result)
+
+    async def fetch_oil_price_wqwlkj(self, city_name: str) -> dict:
+        """通过默认接口查询油价"""
+        # 构造请求参数
+        params = {
+            "city": city_name,
+            "type": "json"
+        }
+        
+        result = await self.upstream.fetch("油价查询", params=params, city=city_name)
+        return parse_oil_prices(result.get("data", []))
+
+    async def refresh_oil_prices(self):
+        """拉取全国各地区油价写入油价表并保存快照"""
+        today = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d")
+        # 已查询过的其它城市也一起刷新
+        regions = list(dict.fromkeys(OIL_PRICE_REGIONS + list(self.oil_price_table.rows)))
+        semaphore = asyncio.Semaphore(self.config.get("oil_price_refresh_concurrency", 4))
+        
+        async def refresh_one(region):
+            async with semaphore:
+                try:
+                    prices = await self.fetch_oil_price(region)
+                except Exception as e:
+                    logger.warning(f"刷新{region}油价失败：{e}")
+                    return False
+            if prices:
+                self.oil_price_table.update(region, prices, today)
+            return bool(prices)
+        
+        results = await asyncio.gather(*(refresh_one(region) for region in regions))
+        
+        if any(results):
+            self.oil_price_table.refreshed_date = today
+            self.oil_price_table.save()
+        logger.info(f"油价表刷新完成，成功 {sum(results)}/{len(regions)} 个地区")
+
+    async def oil_price_loop(self):
+        """每天在配置的时间刷新一次油价表，启动时快照不是当天的则立即刷新"""
+        refresh_hour = self.config.get("oil_price_refresh_hour", 1)
+        tz = datetime.timezone(datetime.timedelta(hours=8))
+        while True:
+            now = datetime.datetime.now(tz)
+            if self.oil_price_table.refreshed_date != now.strftime("%Y-%m-%d"):
+                try:
+                    await self.refresh_oil_prices()
+                except Exception as e:
+                    logger.error(f"刷新油价表时发生错误：{e}")
+            
+            now = datetime.datetime.now(tz)
+            next_run = now.replace(hour=refresh_hour, minute=0, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += datetime.timedelta(days=1)
+            await asyncio.sleep((next_run - now).total_seconds())
+
     @filter.command("油价查询")
+    @instrumented("油价查询")
     async def oil_price(self, message: AstrMessageEvent):
         """查询指定城市的油价信息"""
         # 提取城市名称参数
@@ -2815,97 +3931,48 @@ class Main(Star):
             return
         
         city_name = msg.strip()
-        api_url = "https://free.wqwlkj.cn/wqwlapi/oilprice.php"
         
         try:
-            # 构造请求参数
-            params = {
-                "city": city_name,
-                "type": "json"
+            # 优先查本地油价表，表中没有的城市再实时查询并加入油价表
+            found = self.oil_price_table.lookup(city_name)
+            if found is None:
+                try:
+                    oil_prices = await self.fetch_oil_price(city_name)
+                except ValueError as e:
+                    yield message.plain_result(f"查询失败：{str(e)}").use_t2i(False)
+                    return
+                # 没有查到价格的地区不写入油价表，避免每天刷新时重复查询
+                if not oil_prices:
+                    yield message.plain_result(f"未查询到{city_name}的油价信息").use_t2i(False)
+                    return
+                today = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d")
+                self.oil_price_table.update(city_name, oil_prices, today)
+                self.oil_price_table.save()
+                found = self.oil_price_table.lookup(city_name)
+            
+            table_city, row = found
+            oil_prices = row["prices"]
+            
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 准备模板数据
+            template_data = {
+                "city_name": city_name,
+                "trend": self.oil_price_table.trend(table_city),
+                "oil_92": oil_prices.get('92', '未知'),
+                "oil_95": oil_prices.get('95', '未知'),
+                "oil_98": oil_prices.get('98', '未知'),
+                "oil_0": oil_prices.get('0', '未知'),
+                "current_time": current_time
             }
             
-            # 添加详细日志
-            logger.info(f"开始查询{city_name}的油价，API地址：{api_url}，参数：{params}")
+            # 渲染卡片（按配置选择本地绘制或html_render）
+            image_url = await self.render_card("油价查询", self.templates.get("oil_price"), template_data, "oil_price", priority=RENDER_PRIORITY_HIGH)
             
-            timeout = aiohttp.ClientTimeout(total=60)  # 延长超时时间到60秒
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    logger.info(f"油价查询响应状态码：{resp.status}")
-                    logger.info(f"油价查询响应头：{resp.headers}")
-                    
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求油价查询失败，服务器返回错误状态码：{resp.status}").use_t2i(False)
-                        return
-                    
-                    # 先读取原始响应内容，方便调试
-                    raw_content = await resp.text()
-                    logger.info(f"油价查询原始响应：{raw_content}")
-                    
-                    # 尝试解析JSON，使用json.loads()直接解析文本
-                    result = json.loads(raw_content)
-                    
-                    logger.info(f"油价查询解析结果：{result}")
-                    
-                    if result.get("code") != 1:
-                        yield message.plain_result(f"查询失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 格式化输出结果
-                    data = result.get("data", [])
-                    qushi = result.get("qushi", "")
-                    
-                    # 提取不同类型的油价
-                    oil_prices = {}
-                    for item in data:
-                        oil_type = item.get("type", "")
-                        price = item.get("price", 0)
-                        # 提取油价类型，如"92#汽油"、"95#汽油"等
-                        if "92#" in oil_type:
-                            oil_prices["92"] = price
-                        elif "95#" in oil_type:
-                            oil_prices["95"] = price
-                        elif "98#" in oil_type:
-                            oil_prices["98"] = price
-                        elif "0#" in oil_type:
-                            oil_prices["0"] = price
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    template_data = {
-                        "city_name": city_name,
-                        "trend": qushi,
-                        "oil_92": oil_prices.get('92', '未知'),
-                        "oil_95": oil_prices.get('95', '未知'),
-                        "oil_98": oil_prices.get('98', '未知'),
-                        "oil_0": oil_prices.get('0', '未知'),
-                        "current_time": current_time
-                    }
-                    
-                    # 渲染HTML模板
-                    html_content = self.OIL_PRICE_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -2919,12 +3986,16 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求油价查询时发生错误：{e}")
             yield message.plain_result(f"请求油价查询时发生错误：{str(e)}").use_t2i(False)
             return
 
     @filter.command("qq估价")
+    @instrumented("qq估价")
     async def qq_valuation(self, message: AstrMessageEvent):
         """查询指定QQ号的估价信息，包含吉凶分析和AI综合评估"""
         # 提取QQ号参数
@@ -2935,178 +4006,174 @@ class Main(Star):
             return
         
         qq_number = msg.strip()
+        # 整条指令共用一份时间预算，查询步骤为渲染预留时间
+        deadline = self.command_deadline("qq估价")
+        fetch_deadline = deadline.reserve(self.config.get("deadline_render_reserve", 8))
         
         try:
-            timeout = aiohttp.ClientTimeout(total=60)  # 延长超时时间
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # 1. 查询QQ估价数据
-                valuation_api = "https://free.wqwlkj.cn/wqwlapi/qq_gj.php"
-                valuation_params = {
-                    "qq": qq_number,
-                    "type": "json"
-                }
-                
-                async with session.get(valuation_api, params=valuation_params) as valuation_resp:
-                    if valuation_resp.status != 200:
-                        yield message.plain_result("请求QQ估价失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    valuation_raw = await valuation_resp.text()
-                    valuation_result = json.loads(valuation_raw)
-                    
-                    if valuation_result.get("code") != 1:
-                        yield message.plain_result(f"QQ估价查询失败：{valuation_result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                
-                # 2. 查询QQ测吉凶数据
-                jixiong_api = "https://v2.xxapi.cn/api/qqjixiong"
-                jixiong_params = {
-                    "qq": qq_number
-                }
-                
-                async with session.get(jixiong_api, params=jixiong_params) as jixiong_resp:
-                    if jixiong_resp.status != 200:
-                        yield message.plain_result("请求QQ测吉凶失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    jixiong_raw = await jixiong_resp.text()
-                    jixiong_result = json.loads(jixiong_raw)
-                    
-                    if jixiong_result.get("code") != 200:
-                        yield message.plain_result(f"QQ测吉凶查询失败：{jixiong_result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    jixiong_data = jixiong_result.get("data", {})
-                
-                # 3. 调用DeepSeek-3.1API进行综合分析
-                ai_api_url = "https://api.jkyai.top/API/depsek3.1.php"
-                ai_system_prompt = "QQ估价专用提示词（硬性数据版）\n角色：你是一位专注客观数据的数字资产评估师，仅根据可验证的硬性指标分析QQ账号价值。\n\n请基于以下参考数据，独立给出QQ账号的最终估价和综合分析：\nQQ号码：{qq_number}\n参考估价：{valuation}元\nQQ特点：{law}\nQQ数字特征：{digit}\nQQ吉凶：{jixiong_nature}\nQQ数理：{jixiong_number}\nQQ吉凶名称：{jixiong_title}\nQQ吉凶含义：{jixiong_meaning}\n\n注意：\n1. 最终估价由你独立判断，参考估价仅作为参考\n2. 输出的估价部分请只包含数字，不要包含单位\n3. 严格按照以下格式输出，不要添加额外内容：\n估价：XXXX\n特点评估：\n吉凶评估：\n总评估："
-                
-                ai_prompt = ai_system_prompt.format(
-                    qq_number=qq_number,
-                    valuation=valuation_result.get('valuation', 0),
-                    law=valuation_result.get('law', ''),
-                    digit=valuation_result.get('digit', ''),
-                    jixiong_nature=jixiong_data.get('nature', ''),
-                    jixiong_number=jixiong_data.get('number', ''),
-                    jixiong_title=jixiong_data.get('title', ''),
-                    jixiong_meaning=jixiong_data.get('meaning', '')
-                )
-                
-                ai_params = {
-                    "question": ai_prompt,
-                    "type": "text"
-                }
-                
-                async with session.get(ai_api_url, params=ai_params) as ai_resp:
-                    if ai_resp.status != 200:
-                        yield message.plain_result("AI分析服务不可用，请稍后重试").use_t2i(False)
-                        return
-                    
-                    ai_analysis = await ai_resp.text()
-                    ai_analysis = ai_analysis.strip()
-                
-                # 4. 解析AI分析结果
-                analysis_features = ""
-                analysis_jixiong = ""
-                analysis_total = ""
-                valuation_from_ai = str(valuation_result.get('valuation', 0))
-                
-                try:
-                    # 提取各部分分析结果
-                    lines = ai_analysis.split('\n')
-                    current_section = ""
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        
-                        if line.startswith("估价："):
-                            valuation_from_ai = line.replace("估价：", "").strip()
-                            # 移除可能包含的"元"字，避免重复显示
-                            if valuation_from_ai.endswith("元"):
-                                valuation_from_ai = valuation_from_ai[:-1]
-                        elif line.startswith("特点评估："):
-                            current_section = "features"
-                        elif line.startswith("吉凶评估："):
-                            current_section = "jixiong"
-                        elif line.startswith("总评估："):
-                            current_section = "total"
-                        else:
-                            if current_section == "features":
-                                analysis_features += line + "\n"
-                            elif current_section == "jixiong":
-                                analysis_jixiong += line + "\n"
-                            elif current_section == "total":
-                                analysis_total += line + "\n"
-                    
-                    # 去除多余换行
-                    analysis_features = analysis_features.strip()
-                    analysis_jixiong = analysis_jixiong.strip()
-                    analysis_total = analysis_total.strip()
-                    
-                    # 设置默认值（仅当内容为空时）
-                    if not analysis_features:
-                        analysis_features = "根据QQ号码特点进行了综合评估"
-                    if not analysis_jixiong:
-                        analysis_jixiong = "根据81数理进行了吉凶分析"
-                    if not analysis_total:
-                        analysis_total = "综合考虑各项因素给出了最终估价"
-                except Exception as parse_e:
-                    logger.error(f"解析AI分析结果时发生错误：{parse_e}")
-                    # 解析失败时使用默认值
-                    analysis_features = "AI分析结果解析失败"
-                    analysis_jixiong = "AI分析结果解析失败"
-                    analysis_total = "AI分析结果解析失败"
-                
-                # 5. 获取当前时间，用于显示在图片中
-                current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                
-                # 6. 准备模板数据
-                template_data = {
-                    "qq_number": valuation_result.get('qq', qq_number),
-                    "valuation": valuation_from_ai,
-                    "law": valuation_result.get('law', ''),
-                    "digit": valuation_result.get('digit', ''),
-                    "jixiong_nature": jixiong_data.get('nature', ''),
-                    "jixiong_number": jixiong_data.get('number', ''),
-                    "jixiong_title": jixiong_data.get('title', ''),
-                    "jixiong_meaning": jixiong_data.get('meaning', ''),
-                    "analysis_features": analysis_features,
-                    "analysis_jixiong": analysis_jixiong,
-                    "analysis_total": analysis_total,
-                    "current_time": current_time
-                }
-                
-                # 7. 渲染HTML模板
-                html_content = self.QQ_VALUATION_TEMPLATE
-                for key, value in template_data.items():
-                    placeholder = "{{" + key + "}}"
-                    html_content = html_content.replace(placeholder, str(value))
+            # 1. 并发查询QQ估价和QQ测吉凶数据
+            valuation_params = {
+                "qq": qq_number,
+                "type": "json"
+            }
+            jixiong_params = {
+                "qq": qq_number
+            }
+            
+            valuation_result, jixiong_result = await asyncio.gather(
+                self.upstream.fetch("qq估价", params=valuation_params, deadline=fetch_deadline),
+                self.upstream.fetch("qq吉凶", params=jixiong_params, deadline=fetch_deadline),
+                return_exceptions=True,
+            )
+            for result in (valuation_result, jixiong_result):
+                if isinstance(result, BaseException) and not isinstance(result, UpstreamError):
+                    raise result
+            if isinstance(valuation_result, UpstreamError):
+                yield message.plain_result(f"QQ估价查询失败：{valuation_result}").use_t2i(False)
+                return
+            
+            # 2. 检查QQ测吉凶数据
+            if isinstance(jixiong_result, UpstreamError):
+                yield message.plain_result(f"QQ测吉凶查询失败：{jixiong_result}").use_t2i(False)
+                return
+            
+            jixiong_data = jixiong_result.get("data", {})
+            
+            # 3. 调用DeepSeek-3.1API进行综合分析
+            ai_system_prompt = "QQ估价专用提示词（硬性数据版）\n角色：你是一位专注客观数据的数字资产评估师，仅根据可验证的硬性指标分析QQ账号价值。\n\n请基于以下参考数据，独立给出QQ账号的最终估价和综合分析：\nQQ号码：{qq_number}\n参考估价：{valuation}元\nQQ特点：{law}\nQQ数字特征：{digit}\nQQ吉凶：{jixiong_nature}\nQQ数理：{jixiong_number}\nQQ吉凶名称：{jixiong_title}\nQQ吉凶含义：{jixiong_meaning}\n\n注意：\n1. 最终估价由你独立判断，参考估价仅作为参考\n2. 输出的估价部分请只包含数字，不要包含单位\n3. 严格按照以下格式输出，不要添加额外内容：\n估价：XXXX\n特点评估：\n吉凶评估：\n总评估："
+            
+            ai_prompt = ai_system_prompt.format(
+                qq_number=qq_number,
+                valuation=valuation_result.get('valuation', 0),
+                law=valuation_result.get('law', ''),
+                digit=valuation_result.get('digit', ''),
+                jixiong_nature=jixiong_data.get('nature', ''),
+                jixiong_number=jixiong_data.get('number', ''),
+                jixiong_title=jixiong_data.get('title', ''),
+                jixiong_meaning=jixiong_data.get('meaning', '')
+            )
+            
+            ai_params = {
+                "question": ai_prompt,
+                "type": "text"
+            }
+            
+            ai_timed_out = False
+            try:
+                ai_analysis = (await self.upstream.fetch("qq估价AI分析", params=ai_params, deadline=fetch_deadline)).strip()
+            except DeadlineExceeded:
+                # 预算不够等AI分析时降级为参考估价
+                ai_analysis = ""
+                ai_timed_out = True
+            except UpstreamError:
+                yield message.plain_result("AI分析服务不可用，请稍后重试").use_t2i(False)
+                return
+            
+            # 4. 解析AI分析结果
+            analysis_features = ""
+            analysis_jixiong = ""
+            analysis_total = ""
+            valuation_from_ai = str(valuation_result.get('valuation', 0))
+            
+            try:
+                # 提取各部分分析结果
+                lines = ai_analysis.split('\n')
+                current_section = ""
                 
-                # 8. 使用html_render函数生成图片
-                options = {
-                    "full_page": True,
-                    "type": "jpeg",
-                    "quality": 95,
-                }
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    
+                    if line.startswith("估价："):
+                        valuation_from_ai = line.replace("估价：", "").strip()
+                        # 移除可能包含的"元"字，避免重复显示
+                        if valuation_from_ai.endswith("元"):
+                            valuation_from_ai = valuation_from_ai[:-1]
+                    elif line.startswith("特点评估："):
+                        current_section = "features"
+                    elif line.startswith("吉凶评估："):
+                        current_section = "jixiong"
+                    elif line.startswith("总评估："):
+                        current_section = "total"
+                    else:
+                        if current_section == "features":
+                            analysis_features += line + "\n"
+                        elif current_section == "jixiong":
+                            analysis_jixiong += line + "\n"
+                        elif current_section == "total":
+                            analysis_total += line + "\n"
                 
-                image_url = await self.html_render(
-                    html_content,  # 渲染后的HTML内容
-                    {},  # 空数据字典
-                    True,  # 返回URL
-                    options  # 图片生成选项
-                )
+                # 去除多余换行
+                analysis_features = analysis_features.strip()
+                analysis_jixiong = analysis_jixiong.strip()
+                analysis_total = analysis_total.strip()
                 
-                # 9. 返回图片结果
-                yield message.image_result(image_url).use_t2i(False)
+                # 设置默认值（仅当内容为空时）
+                if not analysis_features:
+                    analysis_features = "根据QQ号码特点进行了综合评估"
+                if not analysis_jixiong:
+                    analysis_jixiong = "根据81数理进行了吉凶分析"
+                if not analysis_total:
+                    analysis_total = "综合考虑各项因素给出了最终估价"
+            except Exception as parse_e:
+                logger.error(f"解析AI分析结果时发生错误：{parse_e}")
+                # 解析失败时使用默认值
+                analysis_features = "AI分析结果解析失败"
+                analysis_jixiong = "AI分析结果解析失败"
+                analysis_total = "AI分析结果解析失败"
+            
+            if ai_timed_out:
+                analysis_features = analysis_jixiong = analysis_total = "AI分析超时，以上为参考估价"
+            
+            # 5. 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 6. 准备模板数据
+            template_data = {
+                "qq_number": valuation_result.get('qq', qq_number),
+                "valuation": valuation_from_ai,
+                "law": valuation_result.get('law', ''),
+                "digit": valuation_result.get('digit', ''),
+                "jixiong_nature": jixiong_data.get('nature', ''),
+                "jixiong_number": jixiong_data.get('number', ''),
+                "jixiong_title": jixiong_data.get('title', ''),
+                "jixiong_meaning": jixiong_data.get('meaning', ''),
+                "analysis_features": analysis_features,
+                "analysis_jixiong": analysis_jixiong,
+                "analysis_total": analysis_total,
+                "current_time": current_time
+            }
+            
+            # 7. 渲染HTML模板
+            html_content = self.templates.get("qq_valuation")
+            for key, value in template_data.items():
+                placeholder = "{{" + key + "}}"
+                html_content = html_content.replace(placeholder, str(value))
+            
+            # 8. 按模板的输出档位生成图片，来不及渲染时改发文字版结果
+            try:
+                image_url = await self.render_html(html_content, "qq_valuation", deadline=deadline)
+            except DeadlineExceeded:
+                response = f"QQ：{template_data['qq_number']}\n"
+                response += f"估价：{valuation_from_ai}元\n"
+                response += f"特点：{template_data['law']}\n"
+                response += f"吉凶：{template_data['jixiong_title']}（{template_data['jixiong_nature']}）\n"
+                response += f"总评估：{analysis_total}\n\n图片生成超时，以上为文字版结果"
+                yield message.plain_result(response).use_t2i(False)
                 return
-                        
+            
+            # 9. 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
+                    
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"网络连接错误：{str(e)}").use_t2i(False)
             return
+        except DeadlineExceeded:
+            yield message.plain_result("QQ估价查询超时，请稍后重试").use_t2i(False)
+            return
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
@@ -3115,12 +4182,16 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求QQ估价时发生错误：{e}")
             yield message.plain_result(f"请求QQ估价时发生错误：{str(e)}").use_t2i(False)
             return
 
     @filter.command("星座运势")
+    @instrumented("星座运势")
     async def constellation_fortune(self, message: AstrMessageEvent):
         """查询指定星座的运势图片"""
         # 提取星座名称参数
@@ -3131,7 +4202,6 @@ class Main(Star):
             return
         
         constellation = msg.strip()
-        api_url = "https://yunzhiapi.cn//API/xzyspd.php"
         
         try:
             # 构造请求参数
@@ -3141,84 +4211,53 @@ class Main(Star):
                 "type": "json"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求星座运势失败，服务器返回错误状态码：{resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 检查API返回是否成功
-                    if result.get("status") != "success":
-                        yield message.plain_result(f"查询失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 将列表类型的字段转换为字符串，以便在HTML模板中显示
-                    lucky_colors = ", ".join(result.get("lucky_colors", []))
-                    lucky_numbers = ", ".join(map(str, result.get("lucky_numbers", [])))
-                    good_matches = ", ".join(result.get("good_matches", []))
-                    fair_matches = ", ".join(result.get("fair_matches", []))
-                    poor_matches = ", ".join(result.get("poor_matches", []))
-                    
-                    # 准备模板数据
-                    template_data = {
-                        "constellation_name": result.get("constellation_name", constellation),
-                        "constellation_en": result.get("constellation_en", ""),
-                        "date_range": result.get("date_range", ""),
-                        "element": result.get("element", ""),
-                        "ruling_planet": result.get("ruling_planet", ""),
-                        "strengths": result.get("strengths", ""),
-                        "weaknesses": result.get("weaknesses", ""),
-                        "best_match": result.get("best_match", ""),
-                        "best_match_en": result.get("best_match_en", ""),
-                        "good_matches": good_matches,
-                        "fair_matches": fair_matches,
-                        "poor_matches": poor_matches,
-                        "lucky_colors": lucky_colors,
-                        "lucky_numbers": lucky_numbers,
-                        "time_period": result.get("time_period", "today"),
-                        "love_advice": result.get("love_advice", ""),
-                        "general_fortune": result.get("general_fortune", ""),
-                        "love_fortune": result.get("love_fortune", ""),
-                        "work_fortune": result.get("work_fortune", ""),
-                        "wealth_fortune": result.get("wealth_fortune", ""),
-                        "health_fortune": result.get("health_fortune", ""),
-                        "desire_analysis": result.get("desire_analysis", ""),
-                        "lucky_direction": result.get("lucky_direction", ""),
-                        "lucky_time": result.get("lucky_time", ""),
-                        "current_time": current_time
-                    }
-                    
-                    # 渲染HTML模板
-                    html_content = self.CONSTELLATION_FORTUNE_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
+            result = await self.upstream.fetch("星座运势", params=params)
+            
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 将列表类型的字段转换为字符串，以便在HTML模板中显示
+            lucky_colors = ", ".join(result.get("lucky_colors", []))
+            lucky_numbers = ", ".join(map(str, result.get("lucky_numbers", [])))
+            good_matches = ", ".join(result.get("good_matches", []))
+            fair_matches = ", ".join(result.get("fair_matches", []))
+            poor_matches = ", ".join(result.get("poor_matches", []))
+            
+            # 准备模板数据
+            template_data = {
+                "constellation_name": result.get("constellation_name", constellation),
+                "constellation_en": result.get("constellation_en", ""),
+                "date_range": result.get("date_range", ""),
+                "element": result.get("element", ""),
+                "ruling_planet": result.get("ruling_planet", ""),
+                "strengths": result.get("strengths", ""),
+                "weaknesses": result.get("weaknesses", ""),
+                "best_match": result.get("best_match", ""),
+                "best_match_en": result.get("best_match_en", ""),
+                "good_matches": good_matches,
+                "fair_matches": fair_matches,
+                "poor_matches": poor_matches,
+                "lucky_colors": lucky_colors,
+                "lucky_numbers": lucky_numbers,
+                "time_period": result.get("time_period", "today"),
+                "love_advice": result.get("love_advice", ""),
+                "general_fortune": result.get("general_fortune", ""),
+                "love_fortune": result.get("love_fortune", ""),
+                "work_fortune": result.get("work_fortune", ""),
+                "wealth_fortune": result.get("wealth_fortune", ""),
+                "health_fortune": result.get("health_fortune", ""),
+                "desire_analysis": result.get("desire_analysis", ""),
+                "lucky_direction": result.get("lucky_direction", ""),
+                "lucky_time": result.get("lucky_time", ""),
+                "current_time": current_time
+            }
+            
+            # 渲染卡片（按配置选择本地绘制或html_render）
+            image_url = await self.render_card("星座运势", self.templates.get("constellation_fortune"), template_data, "constellation")
+            
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -3232,12 +4271,146 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except UpstreamError as e:
+            yield message.plain_result(f"查询失败：{e}").use_t2i(False)
+            return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求星座运势时发生错误：{e}")
             yield message.plain_result(f"请求星座运势时发生错误：{str(e)}").use_t2i(False)
             return
     
+    async def fetch_weather(self, city: str) -> dict:
+        """按供应商链请求天气，全部失败时抛出ValueError"""
+        return await self.providers.call("天气", city)
+
+    async def fetch_weather_wttr(self, city: str) -> dict:
+        """通过wttr.in请求天气，作为默认接口的备用"""
+        result = await self.upstream.fetch(
+            "天气wttr",
+            params={"format": "j1", "lang": "zh"},
+            url=f"https://wttr.in/{urllib.parse.quote(city)}",
+            city=city,
+        )
+        return weather_from_wttr(result, city)
+
+    async def fetch_weather_uapis(self, city: str) -> dict:
+        """通过默认接口请求天气"""
+        # 构造请求参数
+        params = {
+            "city": city,
+            "extended": "true",
+            "indices": "true"
+        }
+        
+        return await self.upstream.fetch("天气", params=params)
+
+    def weather_expires_at(self, report_time: str) -> float:
+        """按上游发布时间加更新间隔计算缓存失效时间，发布时间无法解析时从现在起算"""
+        now = time.time()
+        interval = self.config.get("weather_update_interval", 3600)
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S"):
+            try:
+                report = datetime.datetime.strptime(report_time, fmt)
+            except (TypeError, ValueError):
+                continue
+            if report.tzinfo is None:
+                report = report.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=8)))
+            expires_at = report.timestamp() + interval
+            # 发布时间已超过更新间隔说明上游延迟更新，稍后再查
+            if expires_at <= now:
+                return now + self.config.get("weather_recheck_interval", 600)
+            return expires_at
+        return now + interval
+
+    async def render_weather_card(self, result: dict, city: str) -> str:
+        """把天气数据渲染为图片"""
+        # 获取当前时间，用于显示在图片中
+        current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+        
+        # 准备模板数据
+        template_data = {
+            "city": result.get("city", city),
+            "report_time": result.get("report_time", ""),
+            "weather": result.get("weather", ""),
+            "temperature": result.get("temperature", 0),
+            "wind_direction": result.get("wind_direction", ""),
+            "wind_power": result.get("wind_power", ""),
+            "humidity": result.get("humidity", 0),
+            "feels_like": result.get("feels_like", 0),
+            "visibility": result.get("visibility", 0),
+            "pressure": result.get("pressure", 0),
+            "uv": result.get("uv", 0),
+            "aqi": result.get("aqi", 0),
+            "precipitation": result.get("precipitation", 0),
+            "cloud": result.get("cloud", 0),
+            "current_time": current_time
+        }
+        
+        # 处理生活指数数据
+        life_indices = result.get("life_indices", {})
+        
+        # 穿衣指数
+        clothing = life_indices.get("clothing", {})
+        template_data["clothing_level"] = clothing.get("level", "")
+        template_data["clothing_brief"] = clothing.get("brief", "")
+        template_data["clothing_advice"] = clothing.get("advice", "")
+        
+        # 紫外线指数
+        uv_index = life_indices.get("uv", {})
+        template_data["uv_level"] = uv_index.get("level", "")
+        template_data["uv_brief"] = uv_index.get("brief", "")
+        template_data["uv_advice"] = uv_index.get("advice", "")
+        
+        # 洗车指数
+        car_wash = life_indices.get("car_wash", {})
+        template_data["car_wash_level"] = car_wash.get("level", "")
+        template_data["car_wash_brief"] = car_wash.get("brief", "")
+        template_data["car_wash_advice"] = car_wash.get("advice", "")
+        
+        # 晾晒指数
+        drying = life_indices.get("drying", {})
+        template_data["drying_level"] = drying.get("level", "")
+        template_data["drying_brief"] = drying.get("brief", "")
+        template_data["drying_advice"] = drying.get("advice", "")
+        
+        # 空调指数
+        air_conditioner = life_indices.get("air_conditioner", {})
+        template_data["air_conditioner_level"] = air_conditioner.get("level", "")
+        template_data["air_conditioner_brief"] = air_conditioner.get("brief", "")
+        template_data["air_conditioner_advice"] = air_conditioner.get("advice", "")
+        
+        # 感冒指数
+        cold_risk = life_indices.get("cold_risk", {})
+        template_data["cold_risk_level"] = cold_risk.get("level", "")
+        template_data["cold_risk_brief"] = cold_risk.get("brief", "")
+        template_data["cold_risk_advice"] = cold_risk.get("advice", "")
+        
+        # 运动指数
+        exercise = life_indices.get("exercise", {})
+        template_data["exercise_level"] = exercise.get("level", "")
+        template_data["exercise_brief"] = exercise.get("brief", "")
+        template_data["exercise_advice"] = exercise.get("advice", "")
+        
+        # 舒适度指数
+        comfort = life_indices.get("comfort", {})
+        template_data["comfort_level"] = comfort.get("level", "")
+        template_data["comfort_brief"] = comfort.get("brief", "")
+        template_data["comfort_advice"] = comfort.get("advice", "")
+        
+        # 渲染HTML模板
+        html_content = self.templates.get("weather")
+        for key, value in template_data.items():
+            placeholder = "{{" + key + "}}"
+            html_content = html_content.replace(placeholder, str(value))
+        
+        # 按模板的输出档位生成图片
+        return await self.render_html(html_content, "weather")
+
     @filter.command("天气")
+    @instrumented("天气")
     async def weather(self, message: AstrMessageEvent):
         """查询指定城市的天气信息"""
         # 提取城市名称参数
@@ -3248,128 +4421,38 @@ class Main(Star):
             return
         
         city = msg.strip()
-        api_url = "https://uapis.cn/api/v1/misc/weather"
+        cache_key = normalize_region_name(city)
         
         try:
-            # 构造请求参数
-            params = {
-                "city": city,
-                "extended": "true",
-                "indices": "true"
-            }
-            
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        try:
-                            raw_content = await resp.text()
-                            result = json.loads(raw_content)
-                            yield message.plain_result(f"天气查询失败：{result.get('message', '未知错误')}").use_t2i(False)
-                        except json.JSONDecodeError:
-                            yield message.plain_result(f"天气查询失败：服务器返回错误状态码 {resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    template_data = {
-                        "city": result.get("city", city),
-                        "report_time": result.get("report_time", ""),
-                        "weather": result.get("weather", ""),
-                        "temperature": result.get("temperature", 0),
-                        "wind_direction": result.get("wind_direction", ""),
-                        "wind_power": result.get("wind_power", ""),
-                        "humidity": result.get("humidity", 0),
-                        "feels_like": result.get("feels_like", 0),
-                        "visibility": result.get("visibility", 0),
-                        "pressure": result.get("pressure", 0),
-                        "uv": result.get("uv", 0),
-                        "aqi": result.get("aqi", 0),
-                        "precipitation": result.get("precipitation", 0),
-                        "cloud": result.get("cloud", 0),
-                        "current_time": current_time
-                    }
-                    
-                    # 处理生活指数数据
-                    life_indices = result.get("life_indices", {})
-                    
-                    # 穿衣指数
-                    clothing = life_indices.get("clothing", {})
-                    template_data["clothing_level"] = clothing.get("level", "")
-                    template_data["clothing_brief"] = clothing.get("brief", "")
-                    template_data["clothing_advice"] = clothing.get("advice", "")
-                    
-                    # 紫外线指数
-                    uv_index = life_indices.get("uv", {})
-                    template_data["uv_level"] = uv_index.get("level", "")
-                    template_data["uv_brief"] = uv_index.get("brief", "")
-                    template_data["uv_advice"] = uv_index.get("advice", "")
-                    
-                    # 洗车指数
-                    car_wash = life_indices.get("car_wash", {})
-                    template_data["car_wash_level"] = car_wash.get("level", "")
-                    template_data["car_wash_brief"] = car_wash.get("brief", "")
-                    template_data["car_wash_advice"] = car_wash.get("advice", "")
-                    
-                    # 晾晒指数
-                    drying = life_indices.get("drying", {})
-                    template_data["drying_level"] = drying.get("level", "")
-                    template_data["drying_brief"] = drying.get("brief", "")
-                    template_data["drying_advice"] = drying.get("advice", "")
-                    
-                    # 空调指数
-                    air_conditioner = life_indices.get("air_conditioner", {})
-                    template_data["air_conditioner_level"] = air_conditioner.get("level", "")
-                    template_data["air_conditioner_brief"] = air_conditioner.get("brief", "")
-                    template_data["air_conditioner_advice"] = air_conditioner.get("advice", "")
-                    
-                    # 感冒指数
-                    cold_risk = life_indices.get("cold_risk", {})
-                    template_data["cold_risk_level"] = cold_risk.get("level", "")
-                    template_data["cold_risk_brief"] = cold_risk.get("brief", "")
-                    template_data["cold_risk_advice"] = cold_risk.get("advice", "")
-                    
-                    # 运动指数
-                    exercise = life_indices.get("exercise", {})
-                    template_data["exercise_level"] = exercise.get("level", "")
-                    template_data["exercise_brief"] = exercise.get("brief", "")
-                    template_data["exercise_advice"] = exercise.get("advice", "")
-                    
-                    # 舒适度指数
-                    comfort = life_indices.get("comfort", {})
-                    template_data["comfort_level"] = comfort.get("level", "")
-                    template_data["comfort_brief"] = comfort.get("brief", "")
-                    template_data["comfort_advice"] = comfort.get("advice", "")
-                    
-                    # 渲染HTML模板
-                    html_content = self.WEATHER_TEMPLATE
-                    for key, value in template_data.items():
-                        placeholder = "{{" + key + "}}"
-                        html_content = html_content.replace(placeholder, str(value))
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
+            # 上游只在发布新一期数据（report_time前进）后才有变化，缓存到下一期预计发布时间
+            entry = self.weather_cache.get(cache_key)
+            if entry is None or time.time() >= entry["expires_at"]:
+                try:
+                    result = await self.fetch_weather(city)
+                except ValueError as e:
+                    yield message.plain_result(f"天气查询失败：{str(e)}").use_t2i(False)
                     return
+                
+                report_time = result.get("report_time", "")
+                if entry is not None and report_time and entry["report_time"] == report_time:
+                    # 上游还没有发布新数据，沿用已渲染的卡片
+                    entry["expires_at"] = time.time() + self.config.get("weather_recheck_interval", 600)
+                else:
+                    entry = {
+                        "result": result,
+                        "report_time": report_time,
+                        "expires_at": self.weather_expires_at(report_time),
+                        "image_url": None
+                    }
+                    self.weather_cache.set(cache_key, entry)
+            
+            # 每期天气数据只渲染一次卡片
+            if entry["image_url"] is None:
+                entry["image_url"] = await self.render_weather_card(entry["result"], city)
+            
+            # 返回图片结果
+            yield message.image_result(entry["image_url"]).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -3383,74 +4466,79 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求天气查询时发生错误：{e}")
             yield message.plain_result(f"请求天气查询时发生错误：{str(e)}").use_t2i(False)
             return
     
+    async def refresh_tech_news(self) -> bool:
+        """拉取科技资讯，update字段未变化时跳过；返回快照是否有变化，失败时抛出ValueError"""
+        result = await self.upstream.fetch("实时科技资讯")
+        
+        update_time = result.get("update", "")
+        snapshot = self.tech_news_snapshot
+        if snapshot is not None and update_time and snapshot["update_time"] == update_time:
+            return False
+        
+        # 生成新闻列表HTML，每个快照只拼接一次
+        news_html = "".join(
+            f'<div class="news-item"><span class="news-time">{news.get("time", "")}</span><span class="news-title">{news.get("title", "")}</span></div>'
+            for news in result.get("data", [])
+            if isinstance(news, dict) and news.get("title")
+        )
+        self.tech_news_snapshot = {
+            "update_time": update_time,
+            "news_count": str(result.get("count", 0)),
+            "news_html": news_html,
+            # 渲染好的卡片缓存到下一次资讯更新
+            "image_url": None
+        }
+        return True
+
+    async def tech_news_loop(self):
+        """后台定时刷新科技资讯快照"""
+        interval = self.config.get("tech_news_refresh_interval", 600)
+        while True:
+            try:
+                await self.refresh_tech_news()
+            except Exception as e:
+                logger.error(f"刷新实时科技资讯时发生错误：{e}")
+            await asyncio.sleep(interval)
+
     @filter.command("实时科技资讯")
+    @instrumented("实时科技资讯")
     async def tech_news(self, message: AstrMessageEvent):
         """获取实时科技资讯，显示最新科技新闻"""
-        api_url = "https://api.pearktrue.cn/api/sciencenews/"
-        
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求实时科技资讯失败，服务器返回错误状态码 {resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 检查API返回是否成功
-                    if result.get("code") != 200:
-                        yield message.plain_result(f"实时科技资讯获取失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    update_time = result.get("update", "")
-                    news_count = str(result.get("count", 0))
-                    
-                    # 生成新闻列表HTML
-                    news_items = result.get("data", [])
-                    news_html = ""
-                    for news in news_items:
-                        if isinstance(news, dict):
-                            news_time = news.get("time", "")
-                            news_title = news.get("title", "")
-                            if news_title:
-                                news_html += f'<div class="news-item"><span class="news-time">{news_time}</span><span class="news-title">{news_title}</span></div>'
-                    
-                    # 渲染HTML模板
-                    html_content = self.TECH_NEWS_TEMPLATE
-                    html_content = html_content.replace("{{update_time}}", update_time)
-                    html_content = html_content.replace("{{news_count}}", news_count)
-                    html_content = html_content.replace("{{news_items}}", news_html)
-                    html_content = html_content.replace("{{current_time}}", current_time)
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
+            # 后台任务尚未拉取到数据时现场拉取一次
+            if self.tech_news_snapshot is None:
+                try:
+                    await self.refresh_tech_news()
+                except ValueError as e:
+                    yield message.plain_result(f"实时科技资讯获取失败：{str(e)}").use_t2i(False)
                     return
+            
+            snapshot = self.tech_news_snapshot
+            if snapshot["image_url"] is None:
+                # 获取当前时间，用于显示在图片中
+                current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+                
+                # 渲染HTML模板
+                html_content = self.templates.get("tech_news")
+                html_content = html_content.replace("{{update_time}}", snapshot["update_time"])
+                html_content = html_content.replace("{{news_count}}", snapshot["news_count"])
+                html_content = html_content.replace("{{news_items}}", snapshot["news_html"])
+                html_content = html_content.replace("{{current_time}}", current_time)
+                
+                # 按模板的输出档位生成图片
+                snapshot["image_url"] = await self.render_html(html_content, "tech_news", priority=RENDER_PRIORITY_HIGH)
+            
+            # 返回图片结果
+            yield message.image_result(snapshot["image_url"]).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -3464,76 +4552,57 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求实时科技资讯时发生错误：{e}")
             yield message.plain_result(f"请求实时科技资讯时发生错误：{str(e)}").use_t2i(False)
             return
     
     @filter.command("历史上的今天")
+    @instrumented("历史上的今天")
     async def historical_events(self, message: AstrMessageEvent):
         """获取历史上的今天发生的事件，显示为图片"""
-        api_url = "https://api.pearktrue.cn/api/lsjt/"
-        
         try:
             # 构造请求参数
             params = {
                 "type": "json"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求历史上的今天失败，服务器返回错误状态码 {resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 检查API返回是否成功
-                    if result.get("code") != 200:
-                        yield message.plain_result(f"历史上的今天获取失败：{result.get('msg', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 获取当前时间，用于显示在图片中
-                    current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    # 准备模板数据
-                    current_date = result.get("time", "")
-                    events = result.get("data", [])
-                    events_count = str(len(events))
-                    
-                    # 生成历史事件列表HTML
-                    events_html = ""
-                    for event in events:
-                        if isinstance(event, str) and event.strip():
-                            events_html += f'<div class="event-item">{event}</div>'
-                    
-                    # 渲染HTML模板
-                    html_content = self.HISTORICAL_EVENTS_TEMPLATE
-                    html_content = html_content.replace("{{current_date}}", current_date)
-                    html_content = html_content.replace("{{events_count}}", events_count)
-                    html_content = html_content.replace("{{events_html}}", events_html)
-                    html_content = html_content.replace("{{current_time}}", current_time)
-                    
-                    # 使用html_render函数生成图片
-                    options = {
-                        "full_page": True,
-                        "type": "jpeg",
-                        "quality": 95,
-                    }
-                    
-                    image_url = await self.html_render(
-                        html_content,  # 渲染后的HTML内容
-                        {},  # 空数据字典
-                        True,  # 返回URL
-                        options  # 图片生成选项
-                    )
-                    
-                    # 返回图片结果
-                    yield message.image_result(image_url).use_t2i(False)
-                    return
+            try:
+                result = await self.upstream.fetch("历史上的今天", params=params)
+            except UpstreamError as e:
+                yield message.plain_result(f"历史上的今天获取失败：{e}").use_t2i(False)
+                return
+            
+            # 获取当前时间，用于显示在图片中
+            current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 准备模板数据
+            current_date = result.get("time", "")
+            events = result.get("data", [])
+            events_count = str(len(events))
+            
+            # 生成历史事件列表HTML
+            events_html = ""
+            for event in events:
+                if isinstance(event, str) and event.strip():
+                    events_html += f'<div class="event-item">{event}</div>'
+            
+            # 渲染HTML模板
+            html_content = self.templates.get("historical_events")
+            html_content = html_content.replace("{{current_date}}", current_date)
+            html_content = html_content.replace("{{events_count}}", events_count)
+            html_content = html_content.replace("{{events_html}}", events_html)
+            html_content = html_content.replace("{{current_time}}", current_time)
+            
+            # 按模板的输出档位生成图片
+            image_url = await self.render_html(html_content, "historical_events")
+            
+            # 返回图片结果
+            yield message.image_result(image_url).use_t2i(False)
+            return
                         
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
@@ -3547,12 +4616,28 @@ class Main(Star):
             logger.error(f"JSON解析错误：{e}")
             yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
             return
+        except RenderQueueFull as e:
+            yield message.plain_result(str(e)).use_t2i(False)
+            return
         except Exception as e:
             logger.error(f"请求历史上的今天时发生错误：{e}")
             yield message.plain_result(f"请求历史上的今天时发生错误：{str(e)}").use_t2i(False)
             return
     
+    async def fetch_synthesis_image(self, content: str, deadline: Deadline = None):
+        """请求图文合成API，返回图片内容，状态码异常时返回None"""
+        image_params = {
+            "msg": content
+        }
+        
+        try:
+            return await self.upstream.fetch("图文合成", params=image_params, deadline=deadline)
+        except UpstreamError as e:
+            logger.warning(f"图文合成失败：{e}")
+            return None
+
     @filter.command("图文合成")
+    @instrumented("图文合成")
     async def image_text_synthesis(self, message: AstrMessageEvent):
         """图文合成功能，将文字转换为图片，包含内容安全审核"""
         # 提取合成内容
@@ -3563,70 +4648,63 @@ class Main(Star):
             return
         
         content = msg.strip()
-        
-        # 内容安全审核
-        ai_api_url = "https://api.jkyai.top/API/depsek3.2.php"
-        ai_system_prompt = "你是一个专业的合规内容审核助手，请严格检测以下文本中是否包含违规内容。\n违规词范围包括但不限于：\n暴力、血腥、恐怖内容\n仇恨、歧视、人身攻击言论\n违法、违禁品或行为引导\n政治敏感、不当言论\n色情、低俗、性暗示内容\n虚假信息、不实谣言\n诈骗、广告、恶意推广\n泄露隐私、他人信息,包括所有链接\n其他违反公序良俗的内容\n请按以下步骤处理：\n逐句或分段分析文本内容；\n如发现疑似违规词或内容则输出：false\n如果内容安全则输出：true"
-        
-        ai_question = f"{ai_system_prompt}\n\n需要审核的文本：\n{content}"
+        image_task = None
+        # 审核和生成图片共用一份时间预算
+        deadline = self.command_deadline("图文合成")
         
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # 调用AI审核API
-                ai_params = {
-                    "question": ai_question,
-                    "type": "text"
-                }
-                
-                async with session.get(ai_api_url, params=ai_params) as ai_resp:
-                    if ai_resp.status != 200:
-                        yield message.plain_result("内容审核服务不可用，请稍后重试").use_t2i(False)
-                        return
-                    
-                    ai_result = await ai_resp.text()
-                    ai_result = ai_result.strip().lower()
-                    
-                    # 检查审核结果
-                    if ai_result != "true":
-                        yield message.plain_result("内容违规，暂停生成！").use_t2i(False)
-                        return
-                
-                # 审核通过，调用图文合成API
-                image_api_url = "http://ryapi.sbs/API/zsy.php"
-                image_params = {
-                    "msg": content
-                }
-                
-                async with session.get(image_api_url, params=image_params) as image_resp:
-                    if image_resp.status != 200:
-                        yield message.plain_result("图文合成失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    
-                    # 读取图片内容
-                    image_content = await image_resp.read()
-                    
-                    # 保存图片到本地
-                    import uuid
-                    save_dir = f"data/{self.PLUGIN_NAME}_images"
-                    if not os.path.exists(save_dir):
-                        os.makedirs(save_dir)
-                    
-                    file_name = f"{uuid.uuid4().hex}.jpg"
-                    file_path = os.path.join(save_dir, file_name)
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(image_content)
+            # 推测执行：审核的同时开始生成图片，审核不通过时丢弃图片
+            if self.config.get("image_text_speculative", False):
+                image_task = asyncio.create_task(self.fetch_synthesis_image(content, deadline))
+            
+            # 内容安全审核，与解密功能共用审核结论缓存
+            verdict = await self.moderation.moderate(content, timeout=deadline.remaining())
+            if verdict is None or not verdict["safe"]:
+                # 丢弃推测执行的图片请求
+                if image_task is not None:
+                    image_task.cancel()
+                if verdict is None and deadline.expired:
+                    yield message.plain_result("图文合成超时，请稍后重试").use_t2i(False)
+                elif verdict is None:
+                    yield message.plain_result("内容审核服务不可用，请稍后重试").use_t2i(False)
+                else:
+                    yield message.plain_result("内容违规，暂停生成！").use_t2i(False)
+                return
+            
+            # 审核通过，取推测执行的图片或调用图文合成API
+            if image_task is not None:
+                image_content = await image_task
+            else:
+                image_content = await self.fetch_synthesis_image(content, deadline)
+            
+            if image_content is None:
+                yield message.plain_result("图文合成失败，服务器返回错误状态码").use_t2i(False)
+                return
+            
+            # 保存图片到本地
+            import uuid
+            save_dir = f"data/{self.PLUGIN_NAME}_images"
+            if not os.path.exists(save_dir):
+                os.makedirs(save_dir)
+            
+            file_name = f"{uuid.uuid4().hex}.jpg"
+            file_path = os.path.join(save_dir, file_name)
+            
+            with open(file_path, "wb") as f:
+                f.write(image_content)
+            
+            # 使用本地文件路径发送图片
+            from astrbot.api.message_components import Image
+            yield message.chain_result([Image.fromFileSystem(file_path)]).use_t2i(False)
+            return
                     
-                    # 使用本地文件路径发送图片
-                    from astrbot.api.message_components import Image
-                    yield message.chain_result([Image.fromFileSystem(file_path)]).use_t2i(False)
-                    return
-                        
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"网络连接错误：{str(e)}").use_t2i(False)
             return
+        except DeadlineExceeded:
+            yield message.plain_result("图文合成超时，请稍后重试").use_t2i(False)
+            return
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
@@ -3635,120 +4713,16 @@ class Main(Star):
             logger.error(f"请求图文合同时发生错误：{e}")
             yield message.plain_result(f"请求图文合同时发生错误：{str(e)}").use_t2i(False)
             return
+        finally:
+            # 审核未通过或出错时取消尚未完成的推测请求，已完成的取走异常避免告警
+            if image_task is not None:
+                if not image_task.done():
+                    image_task.cancel()
+                elif not image_task.cancelled():
+                    image_task.exception()
     
-    @filter.command("万年历")
-    async def calendar(self, message: AstrMessageEvent):
-        """万年历和黄历结合查询功能"""
-        try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # 1. 获取万年历数据
-                wnl_api = "https://api.52vmy.cn/api/wl/wnl"
-                async with session.get(wnl_api) as wnl_resp:
-                    if wnl_resp.status != 200:
-                        yield message.plain_result(f"请求万年历数据失败，服务器返回错误状态码 {wnl_resp.status}").use_t2i(False)
-                        return
-                    # 先读取响应文本，处理可能的HTML响应
-                    wnl_text = await wnl_resp.text()
-                    try:
-                        wnl_data = json.loads(wnl_text)
-                    except json.JSONDecodeError:
-                        # 如果返回的是HTML，记录错误
-                        logger.error(f"万年历API返回HTML而非JSON: {wnl_text[:500]}...")
-                        yield message.plain_result("万年历数据格式错误，请稍后重试").use_t2i(False)
-                        return
-                
-                # 2. 获取黄历数据
-                hl_api = "https://api.52vmy.cn/api/wl/wnl/huangli"
-                async with session.get(hl_api) as hl_resp:
-                    if hl_resp.status != 200:
-                        yield message.plain_result(f"请求黄历数据失败，服务器返回错误状态码 {hl_resp.status}").use_t2i(False)
-                        return
-                    # 先读取响应文本，处理可能的HTML响应
-                    hl_text = await hl_resp.text()
-                    try:
-                        hl_data = json.loads(hl_text)
-                    except json.JSONDecodeError:
-                        # 如果返回的是HTML，检查是否包含错误信息
-                        logger.error(f"黄历API返回HTML而非JSON: {hl_text[:500]}...")
-                        yield message.plain_result("黄历数据格式错误，请稍后重试").use_t2i(False)
-                        return
-                
-                # 3. 检查API返回数据完整性
-                if not wnl_data:
-                    yield message.plain_result("万年历数据获取失败，请稍后重试").use_t2i(False)
-                    return
-                if hl_data.get("code") != 200 or not hl_data.get("data"):
-                    yield message.plain_result("黄历数据获取失败，请稍后重试").use_t2i(False)
-                    return
-                
-                # 4. 准备模板数据
-                current_time = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                
-                template_data = {
-                    "year": wnl_data.get("year", ""),
-                    "month": wnl_data.get("month", ""),
-                    "day": wnl_data.get("day", ""),
-                    "cnDay": wnl_data.get("cnDay", ""),
-                    "animal": wnl_data.get("animal", ""),
-                    "lunarYear": wnl_data.get("lunarYear", ""),
-                    "lMonth": wnl_data.get("lMonth", "") + "月",
-                    "lDate": wnl_data.get("lDate", ""),
-                    "gzYear": wnl_data.get("gzYear", ""),
-                    "gzMonth": wnl_data.get("gzMonth", ""),
-                    "gzDate": wnl_data.get("gzDate", ""),
-                    "lunarMonth": wnl_data.get("lunarMonth", ""),
-                    "lunarDate": wnl_data.get("lunarDate", ""),
-                    "term": wnl_data.get("term", ""),
-                    "suit": wnl_data.get("suit", ""),
-                    "avoid": wnl_data.get("avoid", ""),
-                    "festival": wnl_data.get("value", wnl_data.get("festivalList", "")),
-                    "huangli_info": hl_data.get("data", {}).get("info", []),
-                    "current_time": current_time
-                }
-                
-                # 5. 渲染HTML模板
-                html_content = self.CALENDAR_TEMPLATE
-                for key, value in template_data.items():
-                    placeholder = "{{" + key + "}}"
-                    html_content = html_content.replace(placeholder, str(value))
-                
-                # 6. 使用html_render函数生成图片
-                options = {
-                    "full_page": True,
-                    "type": "jpeg",
-                    "quality": 95,
-                }
-                
-                image_url = await self.html_render(
-                    html_content,  # 渲染后的HTML内容
-                    {},  # 空数据字典
-                    True,  # 返回URL
-                    options  # 图片生成选项
-                )
-                
-                # 7. 返回图片结果
-                yield message.image_result(image_url).use_t2i(False)
-                return
-                    
-        except aiohttp.ClientError as e:
-            logger.error(f"网络连接错误：{e}")
-            yield message.plain_result(f"网络连接错误：{str(e)}").use_t2i(False)
-            return
-        except asyncio.TimeoutError:
-            logger.error("请求超时")
-            yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
-            return
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析错误：{e}")
-            yield message.plain_result(f"服务器返回数据格式错误：{str(e)}").use_t2i(False)
-            return
-        except Exception as e:
-            logger.error(f"请求万年历时发生错误：{e}")
-            yield message.plain_result(f"请求万年历时发生错误：{str(e)}").use_t2i(False)
-            return
-
     @filter.command("加密")
+    @instrumented("加密")
     async def shouyu_encrypt(self, message: AstrMessageEvent):
         """兽语在线加密功能"""
         # 提取加密内容参数
@@ -3765,7 +4739,6 @@ class Main(Star):
             return
         
         encrypt_content = msg.strip()
-        api_url = "https://yunzhiapi.cn//API/shouyu/api.php"
         
         try:
             # 构造请求参数
@@ -3775,33 +4748,22 @@ class Main(Star):
                 # 默认format为空，即加密模式
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求加密失败，服务器返回错误状态码：{resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 检查API返回是否成功
-                    if result.get("code") != 1:
-                        yield message.plain_result(f"加密失败：{result.get('text', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 提取加密结果
-                    encrypted_text = result.get("data", {}).get("Message", "")
-                    if not encrypted_text:
-                        yield message.plain_result("加密失败：返回结果为空").use_t2i(False)
-                        return
-                    
-                    # 返回加密结果
-                    response = f"加密结果：{encrypted_text}\n\n注意，解密是通过腾讯安全中心接口，请注意违规词，避免被封禁账号！！！"
-                    yield message.plain_result(response).use_t2i(False)
-                    return
-                        
+            result = await self.upstream.fetch("加密", params=params)
+            
+            # 提取加密结果
+            encrypted_text = result.get("data", {}).get("Message", "")
+            if not encrypted_text:
+                yield message.plain_result("加密失败：返回结果为空").use_t2i(False)
+                return
+            
+            # 返回加密结果
+            response = f"加密结果：{encrypted_text}\n\n注意，解密是通过腾讯安全中心接口，请注意违规词，避免被封禁账号！！！"
+            yield message.plain_result(response).use_t2i(False)
+            return
+                
+        except UpstreamError as e:
+            yield message.plain_result(f"加密失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"无法连接到加密服务器：{str(e)}").use_t2i(False)
@@ -3820,110 +4782,111 @@ class Main(Star):
             return
     
     @filter.command("万年历")
+    @instrumented("万年历")
     async def calendar(self, message: AstrMessageEvent):
         """万年历和黄历结合查询功能"""
+        # 整条指令共用一份时间预算，查询步骤为截图预留时间
+        deadline = self.command_deadline("万年历")
+        fetch_deadline = deadline.reserve(self.config.get("deadline_render_reserve", 8))
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # 1. 获取万年历数据
-                calendar_api = "https://api.52vmy.cn/api/wl/wnl"
-                async with session.get(calendar_api) as calendar_resp:
-                    if calendar_resp.status != 200:
-                        yield message.plain_result("获取万年历数据失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    calendar_result = await calendar_resp.json()
-                
-                # 2. 获取黄历数据
-                huangli_api = "https://api.52vmy.cn/api/wl/wnl/huangli"
-                async with session.get(huangli_api) as huangli_resp:
-                    if huangli_resp.status != 200:
-                        yield message.plain_result("获取黄历数据失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    huangli_result = await huangli_resp.json()
-                
-                # 3. 处理数据
-                # 万年历数据
-                animal = calendar_result.get("animal", "")
-                avoid = calendar_result.get("avoid", "")
-                cnDay = calendar_result.get("cnDay", "")
-                day = calendar_result.get("day", "")
-                festivalList = calendar_result.get("festivalList", "")
-                gzDate = calendar_result.get("gzDate", "")
-                gzMonth = calendar_result.get("gzMonth", "")
-                gzYear = calendar_result.get("gzYear", "")
-                lDate = calendar_result.get("lDate", "")
-                lMonth = calendar_result.get("lMonth", "")
-                lunarDate = calendar_result.get("lunarDate", "")
-                lunarMonth = calendar_result.get("lunarMonth", "")
-                lunarYear = calendar_result.get("lunarYear", "")
-                month = calendar_result.get("month", "")
-                suit = calendar_result.get("suit", "")
-                term = calendar_result.get("term", "")
-                year = calendar_result.get("year", "")
-                
-                # 黄历数据
-                huangli_info = []
-                if huangli_result.get("code") == 200:
-                    huangli_data = huangli_result.get("data", {})
-                    huangli_info = huangli_data.get("info", [])
-                
-                # 4. 准备模板数据
-                template_data = {
-                    "animal": animal,
-                    "avoid": avoid,
-                    "cnDay": cnDay,
-                    "day": day,
-                    "festival": festivalList,
-                    "gzDate": gzDate,
-                    "gzMonth": gzMonth,
-                    "gzYear": gzYear,
-                    "lDate": lDate,
-                    "lMonth": lMonth,
-                    "lunarDate": lunarDate,
-                    "lunarMonth": lunarMonth,
-                    "lunarYear": lunarYear,
-                    "month": month,
-                    "suit": suit,
-                    "term": term,
-                    "year": year,
-                    "huangli_info": huangli_info,
-                    "current_time": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
-                }
-                
-                # 5. 生成HTML
-                html_content = self.CALENDAR_TEMPLATE
-                for key, value in template_data.items():
-                    html_content = html_content.replace(f"{{{{{key}}}}}", str(value))
-                
-                # 6. 生成图片
-                img_api_url = "https://api.apifox.cn/api/v1/browser/screenshot"
-                img_payload = {
-                    "html": html_content,
-                    "width": 800,
-                    "height": 1200,
-                    "deviceScaleFactor": 2,
-                    "isMobile": False
-                }
-                
-                async with session.post(img_api_url, json=img_payload) as img_resp:
-                    if img_resp.status != 200:
-                        yield message.plain_result("生成图片失败，服务器返回错误状态码").use_t2i(False)
-                        return
-                    img_data = await img_resp.json()
-                    if img_data.get("code") != 0:
-                        yield message.plain_result(f"生成图片失败：{img_data.get('message', '未知错误')}").use_t2i(False)
-                        return
-                    img_url = img_data.get("data", {}).get("url", "")
-                    if not img_url:
-                        yield message.plain_result("生成图片失败，未获取到图片URL").use_t2i(False)
-                        return
-                
-                # 7. 返回图片结果
-                yield message.image_result(img_url)
+            # 1. 并发获取万年历和黄历数据，黄历获取失败或超出预算时不显示黄历
+            calendar_result, huangli_result = await asyncio.gather(
+                self.upstream.fetch("万年历", deadline=fetch_deadline),
+                self.upstream.fetch("黄历", deadline=fetch_deadline),
+                return_exceptions=True,
+            )
+            if isinstance(calendar_result, Exception):
+                raise calendar_result
+            
+            # 2. 处理数据
+            # 万年历数据
+            animal = calendar_result.get("animal", "")
+            avoid = calendar_result.get("avoid", "")
+            cnDay = calendar_result.get("cnDay", "")
+            day = calendar_result.get("day", "")
+            festivalList = calendar_result.get("festivalList", "")
+            gzDate = calendar_result.get("gzDate", "")
+            gzMonth = calendar_result.get("gzMonth", "")
+            gzYear = calendar_result.get("gzYear", "")
+            lDate = calendar_result.get("lDate", "")
+            lMonth = calendar_result.get("lMonth", "")
+            lunarDate = calendar_result.get("lunarDate", "")
+            lunarMonth = calendar_result.get("lunarMonth", "")
+            lunarYear = calendar_result.get("lunarYear", "")
+            month = calendar_result.get("month", "")
+            suit = calendar_result.get("suit", "")
+            term = calendar_result.get("term", "")
+            year = calendar_result.get("year", "")
+            
+            # 黄历数据
+            huangli_info = []
+            if not isinstance(huangli_result, Exception):
+                huangli_data = huangli_result.get("data", {})
+                huangli_info = huangli_data.get("info", [])
+            
+            # 3. 准备模板数据
+            template_data = {
+                "animal": animal,
+                "avoid": avoid,
+                "cnDay": cnDay,
+                "day": day,
+                "festival": festivalList,
+                "gzDate": gzDate,
+                "gzMonth": gzMonth,
+                "gzYear": gzYear,
+                "lDate": lDate,
+                "lMonth": lMonth,
+                "lunarDate": lunarDate,
+                "lunarMonth": lunarMonth,
+                "lunarYear": lunarYear,
+                "month": month,
+                "suit": suit,
+                "term": term,
+                "year": year,
+                "huangli_info": huangli_info,
+                "current_time": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+            }
+            
+            # 4. 生成HTML
+            html_content = self.templates.get("calendar")
+            for key, value in template_data.items():
+                html_content = html_content.replace(f"{{{{{key}}}}}", str(value))
+            
+            # 5. 生成图片
+            img_payload = {
+                "html": html_content,
+                "width": 800,
+                "height": 1200,
+                "deviceScaleFactor": 2,
+                "isMobile": False
+            }
+            
+            try:
+                img_data = await self.upstream.fetch("网页截图", data=img_payload, deadline=deadline)
+            except DeadlineExceeded:
+                # 来不及截图时改发文字版结果
+                yield message.plain_result(self.format_calendar_text(template_data)).use_t2i(False)
+                return
+            except UpstreamError as e:
+                yield message.plain_result(f"生成图片失败：{e}").use_t2i(False)
+                return
+            img_url = img_data.get("data", {}).get("url", "")
+            if not img_url:
+                yield message.plain_result("生成图片失败，未获取到图片URL").use_t2i(False)
+                return
+            
+            # 6. 返回图片结果
+            yield message.image_result(img_url)
+        except UpstreamError as e:
+            yield message.plain_result(f"查询失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"无法连接到服务器：{str(e)}").use_t2i(False)
             return
+        except DeadlineExceeded:
+            yield message.plain_result("万年历查询超时，请稍后重试").use_t2i(False)
+            return
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
@@ -3938,6 +4901,7 @@ class Main(Star):
             return
     
     @filter.command("解密")
+    @instrumented("解密")
     async def shouyu_decrypt(self, message: AstrMessageEvent):
         """兽语在线解密功能"""
         # 提取解密内容参数
@@ -3954,7 +4918,8 @@ class Main(Star):
             return
         
         decrypt_content = msg.strip()
-        api_url = "https://yunzhiapi.cn/API/shouyu/api.php"
+        # 解密和审核共用一份时间预算
+        deadline = self.command_deadline("解密")
         
         try:
             # 构造请求参数
@@ -3964,127 +4929,41 @@ class Main(Star):
                 "format": 1  # format=1表示解密模式
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(api_url, params=params) as resp:
-                    if resp.status != 200:
-                        yield message.plain_result(f"请求解密失败，服务器返回错误状态码：{resp.status}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 检查API返回是否成功
-                    if result.get("code") != 1:
-                        yield message.plain_result(f"解密失败：{result.get('text', '未知错误')}").use_t2i(False)
-                        return
-                    
-                    # 提取解密结果
-                    decrypted_text = result.get("data", {}).get("Message", "")
-                    if not decrypted_text:
-                        yield message.plain_result("解密失败：返回结果为空").use_t2i(False)
-                        return
-                    
-                    # AI审核步骤
-                    ai_api_url = "https://api.jkyai.top/API/depsek3.2.php"
-                    ai_system_prompt = "你是一个专业的合规内容审核助手，请严格检测以下文本中是否包含违规内容。\n\n违规词范围包括但不限于：\n\n暴力、血腥、恐怖内容\n\n仇恨、歧视、人身攻击言论\n\n违法、违禁品或行为引导\n\n政治敏感、不当言论\n\n色情、低俗、性暗示内容\n\n虚假信息、不实谣言\n\n诈骗、广告、恶意推广\n\n泄露隐私、他人信息\n\n链接一概不允许\n\n其他违反公序良俗的内容\n\n请按以下步骤处理：\n\n1. 逐句或分段分析文本内容；\n2. 如发现疑似违规词或内容则输出：false\n3. 如果内容安全则输出：true\n4. 并且给出拦截原因，比如如果是链接就输出：包含链接！！\n   如果是骂人则输出：不当言论！！\n   如果是骂人和链接一起就输出：包含链接和不当言论！！\n5. 并且按照恶劣程度给出违规分数，1-10分\n\n输出格式要求：\n<安全状态>\n<拦截原因（如果安全则为空）>\n<违规分数（如果安全则为0）>\n\n例如：\nfalse\n不当言论！！\n8\n\n或：\ntrue\n\n0"
-                    
-                    ai_question = f"{ai_system_prompt}\n\n需要审核的文本：\n{decrypted_text}"
-                    
-                    try:
-                        # 调用AI审核API
-                        ai_params = {
-                            "question": ai_question,
-                            "type": "text"
-                        }
-                        
-                        async with session.get(ai_api_url, params=ai_params) as ai_resp:
-                            if ai_resp.status != 200:
-                                # AI审核失败，进行拦截
-                                logger.warning(f"AI审核失败，状态码：{ai_resp.status}")
-                                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                return
-                            
-                            ai_result = await ai_resp.text()
-                            ai_result = ai_result.strip()
-                            
-                            # 解析AI结果
-                            try:
-                                ai_lines = ai_result.split('\n')
-                                if len(ai_lines) < 1:
-                                    # 结果格式异常，进行拦截
-                                    logger.warning(f"AI审核结果格式异常：{ai_result}")
-                                    yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                    return
-                                
-                                # 提取安全状态
-                                safety_status = ai_lines[0].strip().lower()
-                                
-                                # 提取拦截原因（如果存在）
-                                intercept_reason = ""
-                                if len(ai_lines) > 1:
-                                    intercept_reason = ai_lines[1].strip()
-                                
-                                # 提取违规分数（如果存在）
-                                violation_score = 0
-                                if len(ai_lines) > 2:
-                                    try:
-                                        violation_score = int(ai_lines[2].strip())
-                                    except ValueError:
-                                        violation_score = 0
-                                
-                                # 计算违规程度
-                                if violation_score >= 7:
-                                    severity = "非常恶劣"
-                                elif violation_score >= 4:
-                                    severity = "中度恶劣"
-                                elif violation_score >= 1:
-                                    severity = "轻度恶劣"
-                                else:
-                                    severity = "无"
-                                
-                                # 检查AI审核结果
-                                if safety_status == "false":
-                                    # 内容违规，返回违规提示
-                                    if intercept_reason:
-                                        response = f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规内容含：{intercept_reason}\n违规程度：{violation_score}分<{severity}>"
-                                    else:
-                                        response = f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规程度：{violation_score}分<{severity}>"
-                                    
-                                    # 记录违规分数到日志
-                                    logger.warning(f"解密内容违规，原因：{intercept_reason}，违规分数：{violation_score}，违规程度：{severity}")
-                                    
-                                    yield message.plain_result(response).use_t2i(False)
-                                    return
-                                elif safety_status == "true":
-                                    # 内容安全，返回解密结果
-                                    yield message.plain_result(f"解密结果：{decrypted_text}").use_t2i(False)
-                                    return
-                                else:
-                                    # 结果格式异常，进行拦截
-                                    logger.warning(f"AI审核结果格式异常：{ai_result}")
-                                    yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                    return
-                            except Exception as parse_e:
-                                # 解析AI结果失败，进行拦截
-                                logger.error(f"解析AI审核结果时发生错误：{parse_e}")
-                                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                return
-                    except Exception as ai_e:
-                        # AI审核过程中发生异常，进行拦截
-                        logger.error(f"AI审核过程中发生错误：{ai_e}")
-                        yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                        return
-                    
-                    # 返回解密结果
-                    yield message.plain_result(f"解密结果：{decrypted_text}").use_t2i(False)
-                    return
-                        
+            result = await self.upstream.fetch("解密", params=params, deadline=deadline)
+            
+            # 提取解密结果
+            decrypted_text = result.get("data", {}).get("Message", "")
+            if not decrypted_text:
+                yield message.plain_result("解密失败：返回结果为空").use_t2i(False)
+                return
+            
+            # 内容审核：本地预审核和结论缓存都未命中时才请求AI审核
+            verdict = await self.moderation.moderate(decrypted_text, timeout=deadline.remaining())
+            if verdict is None:
+                # AI审核失败或超出预算，进行拦截
+                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
+                return
+
+            if not verdict["safe"]:
+                # 内容违规，返回违规提示并记录违规分数到日志
+                logger.warning(f"解密内容违规，原因：{verdict['reason']}，违规分数：{verdict['score']}，违规程度：{moderation_severity(verdict['score'])}，来源：{verdict['source']}，审核耗时：{verdict['latency_ms']}ms")
+                yield message.plain_result(self.format_moderation_block(verdict)).use_t2i(False)
+                return
+
+            # 返回解密结果
+            yield message.plain_result(f"解密结果：{decrypted_text}").use_t2i(False)
+            return
+                
+        except UpstreamError as e:
+            yield message.plain_result(f"解密失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"无法连接到解密服务器：{str(e)}").use_t2i(False)
             return
+        except DeadlineExceeded:
+            yield message.plain_result("解密超时，请稍后重试").use_t2i(False)
+            return
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
@@ -4099,6 +4978,7 @@ class Main(Star):
             return
     
     @filter.command("AES加密")
+    @instrumented("AES加密")
     async def aes_encrypt(self, message: AstrMessageEvent):
         """AES高级加密，支持多种模式和填充方式"""
         # 提取命令参数
@@ -4118,8 +4998,6 @@ class Main(Star):
         key = parts[0]
         text = " ".join(parts[1:])
         
-        api_url = "https://uapis.cn/api/v1/text/aes/encrypt-advanced"
-        
         try:
             # 构造请求体
             payload = {
@@ -4130,39 +5008,27 @@ class Main(Star):
                 "output_format": "base64"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(api_url, json=payload) as resp:
-                    if resp.status != 200:
-                        raw_content = await resp.text()
-                        try:
-                            error_result = json.loads(raw_content)
-                            error_msg = error_result.get("error", f"服务器返回错误状态码：{resp.status}")
-                        except json.JSONDecodeError:
-                            error_msg = f"服务器返回错误状态码：{resp.status}"
-                        yield message.plain_result(f"AES加密失败：{error_msg}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 提取加密结果
-                    ciphertext = result.get("ciphertext", "")
-                    mode = result.get("mode", "")
-                    padding = result.get("padding", "")
-                    
-                    if not ciphertext:
-                        yield message.plain_result("AES加密失败：返回结果为空").use_t2i(False)
-                        return
-                    
-                    # 构造响应消息
-                    response = f"密文：{ciphertext}\n模式：{mode}\n填充：{padding}\n\n注意！！保护好你的密文和加密密钥，解密需要加密密钥和密文\n\n注意，解密是通过腾讯安全中心接口，请注意违规词，避免被封禁账号！！！"
-                    
-                    # 返回加密结果
-                    yield message.plain_result(response).use_t2i(False)
-                    return
-                        
+            result = await self.upstream.fetch("AES加密", data=payload)
+            
+            # 提取加密结果
+            ciphertext = result.get("ciphertext", "")
+            mode = result.get("mode", "")
+            padding = result.get("padding", "")
+            
+            if not ciphertext:
+                yield message.plain_result("AES加密失败：返回结果为空").use_t2i(False)
+                return
+            
+            # 构造响应消息
+            response = f"密文：{ciphertext}\n模式：{mode}\n填充：{padding}\n\n注意！！保护好你的密文和加密密钥，解密需要加密密钥和密文\n\n注意，解密是通过腾讯安全中心接口，请注意违规词，避免被封禁账号！！！"
+            
+            # 返回加密结果
+            yield message.plain_result(response).use_t2i(False)
+            return
+                
+        except UpstreamError as e:
+            yield message.plain_result(f"AES加密失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"无法连接到AES加密服务器：{str(e)}").use_t2i(False)
@@ -4181,6 +5047,7 @@ class Main(Star):
             return
     
     @filter.command("AES解密")
+    @instrumented("AES解密")
     async def aes_decrypt(self, message: AstrMessageEvent):
         """AES高级解密，支持多种模式和填充方式"""
         # 提取命令参数
@@ -4199,8 +5066,8 @@ class Main(Star):
         # 提取解密密钥和加密内容
         key = parts[0]
         ciphertext = " ".join(parts[1:])
-        
-        api_url = "https://uapis.cn/api/v1/text/aes/decrypt-advanced"
+        # 解密和审核共用一份时间预算
+        deadline = self.command_deadline("AES解密")
         
         try:
             # 构造请求体
@@ -4211,131 +5078,43 @@ class Main(Star):
                 "padding": "PKCS7"
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(api_url, json=payload) as resp:
-                    if resp.status != 200:
-                        raw_content = await resp.text()
-                        try:
-                            error_result = json.loads(raw_content)
-                            error_msg = error_result.get("error", f"服务器返回错误状态码：{resp.status}")
-                        except json.JSONDecodeError:
-                            error_msg = f"服务器返回错误状态码：{resp.status}"
-                        yield message.plain_result(f"AES解密失败：{error_msg}").use_t2i(False)
-                        return
-                    
-                    # 读取响应文本，解析JSON
-                    raw_content = await resp.text()
-                    result = json.loads(raw_content)
-                    
-                    # 提取解密结果
-                    plaintext = result.get("plaintext", "")
-                    
-                    if plaintext is None or plaintext == "":
-                        yield message.plain_result("AES解密失败：返回结果为空").use_t2i(False)
-                        return
-                    
-                    # AI审核步骤
-                    ai_api_url = "https://api.jkyai.top/API/depsek3.2.php"
-                    ai_system_prompt = "你是一个专业的合规内容审核助手，请严格检测以下文本中是否包含违规内容。\n\n违规词范围包括但不限于：\n\n暴力、血腥、恐怖内容\n\n仇恨、歧视、人身攻击言论\n\n违法、违禁品或行为引导\n\n政治敏感、不当言论\n\n色情、低俗、性暗示内容\n\n虚假信息、不实谣言\n\n诈骗、广告、恶意推广\n\n泄露隐私、他人信息\n\n链接一概不允许\n\n其他违反公序良俗的内容\n\n请按以下步骤处理：\n\n1. 逐句或分段分析文本内容；\n2. 如发现疑似违规词或内容则输出：false\n3. 如果内容安全则输出：true\n4. 并且给出拦截原因，比如如果是链接就输出：包含链接！！\n   如果是骂人则输出：不当言论！！\n   如果是骂人和链接一起就输出：包含链接和不当言论！！\n5. 并且按照恶劣程度给出违规分数，1-10分\n\n输出格式要求：\n<安全状态>\n<拦截原因（如果安全则为空）>\n<违规分数（如果安全则为0）>\n\n例如：\nfalse\n不当言论！！\n8\n\n或：\ntrue\n\n0"
-                    
-                    ai_question = f"{ai_system_prompt}\n\n需要审核的文本：\n{plaintext}"
-                    
-                    try:
-                        # 调用AI审核API
-                        ai_params = {
-                            "question": ai_question,
-                            "type": "text"
-                        }
-                        
-                        async with session.get(ai_api_url, params=ai_params) as ai_resp:
-                            if ai_resp.status != 200:
-                                # AI审核失败，进行拦截
-                                logger.warning(f"AI审核失败，状态码：{ai_resp.status}")
-                                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                return
-                            
-                            ai_result = await ai_resp.text()
-                            ai_result = ai_result.strip()
-                            
-                            # 解析AI结果
-                            try:
-                                ai_lines = ai_result.split('\n')
-                                if len(ai_lines) < 1:
-                                    # 结果格式异常，进行拦截
-                                    logger.warning(f"AI审核结果格式异常：{ai_result}")
-                                    yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                    return
-                                
-                                # 提取安全状态
-                                safety_status = ai_lines[0].strip().lower()
-                                
-                                # 提取拦截原因（如果存在）
-                                intercept_reason = ""
-                                if len(ai_lines) > 1:
-                                    intercept_reason = ai_lines[1].strip()
-                                
-                                # 提取违规分数（如果存在）
-                                violation_score = 0
-                                if len(ai_lines) > 2:
-                                    try:
-                                        violation_score = int(ai_lines[2].strip())
-                                    except ValueError:
-                                        violation_score = 0
-                                
-                                # 计算违规程度
-                                if violation_score >= 7:
-                                    severity = "非常恶劣"
-                                elif violation_score >= 4:
-                                    severity = "中度恶劣"
-                                elif violation_score >= 1:
-                                    severity = "轻度恶劣"
-                                else:
-                                    severity = "无"
-                                
-                                # 检查AI审核结果
-                                if safety_status == "false":
-                                    # 内容违规，返回违规提示
-                                    if intercept_reason:
-                                        response = f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规内容含：{intercept_reason}\n违规程度：{violation_score}分<{severity}>"
-                                    else:
-                                        response = f"您提供的密文解析后遭到QQ安全中心检测系统拦截，不予放行!!!\n\n违规程度：{violation_score}分<{severity}>"
-                                    
-                                    # 记录违规分数到日志
-                                    logger.warning(f"AES解密内容违规，原因：{intercept_reason}，违规分数：{violation_score}，违规程度：{severity}")
-                                    
-                                    yield message.plain_result(response).use_t2i(False)
-                                    return
-                                elif safety_status == "true":
-                                    # 内容安全，返回解密结果
-                                    response = f"解密成功！\n\n内容：{plaintext}"
-                                    yield message.plain_result(response).use_t2i(False)
-                                    return
-                                else:
-                                    # 结果格式异常，进行拦截
-                                    logger.warning(f"AI审核结果格式异常：{ai_result}")
-                                    yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                    return
-                            except Exception as parse_e:
-                                # 解析AI结果失败，进行拦截
-                                logger.error(f"解析AI审核结果时发生错误：{parse_e}")
-                                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                                return
-                    except Exception as ai_e:
-                        # AI审核过程中发生异常，进行拦截
-                        logger.error(f"AI审核过程中发生错误：{ai_e}")
-                        yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
-                        return
-                    
-                    # 返回解密结果
-                    response = f"解密成功！\n\n内容：{plaintext}"
-                    yield message.plain_result(response).use_t2i(False)
-                    return
-                        
+            result = await self.upstream.fetch("AES解密", data=payload, deadline=deadline)
+            
+            # 提取解密结果
+            plaintext = result.get("plaintext", "")
+            
+            if plaintext is None or plaintext == "":
+                yield message.plain_result("AES解密失败：返回结果为空").use_t2i(False)
+                return
+            
+            # 内容审核：本地预审核和结论缓存都未命中时才请求AI审核
+            verdict = await self.moderation.moderate(plaintext, timeout=deadline.remaining())
+            if verdict is None:
+                # AI审核失败或超出预算，进行拦截
+                yield message.plain_result("QQ安全中心未响应，重新申请").use_t2i(False)
+                return
+
+            if not verdict["safe"]:
+                # 内容违规，返回违规提示并记录违规分数到日志
+                logger.warning(f"AES解密内容违规，原因：{verdict['reason']}，违规分数：{verdict['score']}，违规程度：{moderation_severity(verdict['score'])}，来源：{verdict['source']}，审核耗时：{verdict['latency_ms']}ms")
+                yield message.plain_result(self.format_moderation_block(verdict)).use_t2i(False)
+                return
+
+            # 返回解密结果
+            response = f"解密成功！\n\n内容：{plaintext}"
+            yield message.plain_result(response).use_t2i(False)
+            return
+                
+        except UpstreamError as e:
+            yield message.plain_result(f"AES解密失败：{e}").use_t2i(False)
+            return
         except aiohttp.ClientError as e:
             logger.error(f"网络连接错误：{e}")
             yield message.plain_result(f"无法连接到AES解密服务器：{str(e)}").use_t2i(False)
             return
+        except DeadlineExceeded:
+            yield message.plain_result("AES解密超时，请稍后重试").use_t2i(False)
+            return
         except asyncio.TimeoutError:
             logger.error("请求超时")
             yield message.plain_result("请求超时，请稍后重试").use_t2i(False)
@@ -4349,7 +5128,213 @@ class Main(Star):
             yield message.plain_result(f"请求AES解密时发生错误：{str(e)}").use_t2i(False)
             return
     
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("渲染基准")
+    @instrumented("渲染基准")
+    async def render_benchmark(self, message: AstrMessageEvent):
+        """对比卡片渲染方式的耗时和图片大小（管理员）"""
+        args = message.message_str.replace("渲染基准", "").split()
+        compare_profiles = bool(args) and args[0] == "档位"
+        if compare_profiles:
+            args = args[1:]
+        rounds = max(1, min(int(args[0]), 20)) if args and args[0].isdigit() else 3
+        templates = {
+            "mcs": (self.templates.get("mc_server"), "mc_server"),
+            "油价查询": (self.templates.get("oil_price"), "oil_price"),
+            "星座运势": (self.templates.get("constellation_fortune"), "constellation"),
+        }
+        
+        if compare_profiles:
+            lines = [f"输出档位基准（每种参数 {rounds} 次）"]
+        else:
+            lines = [f"渲染基准（每种引擎 {rounds} 次）"]
+        try:
+            for command, (template, profile) in templates.items():
+                template_data = CARD_BENCHMARK_SAMPLES[command]
+                html_content = fill_template(template, template_data)
+                lines.append(f"\n【{command}】")
+                
+                if compare_profiles:
+                    # 旧的统一参数与自适应档位各渲染到本地文件，比较耗时和图片大小
+                    adaptive_html, adaptive_options = render_output_options(profile, html_content)
+                    variants = [
+                        ("原参数", html_content, dict(RENDER_LEGACY_OPTIONS)),
+                        (f"档位（{adaptive_options['type']} {adaptive_options.get('quality', '')}）",
+                         adaptive_html, adaptive_options),
+                    ]
+                    for label, variant_html, options in variants:
+                        sizes = []
+                        
+                        async def render_once():
+                            path = await self.html_render(variant_html, {}, False, options)
+                            sizes.append(os.path.getsize(path))
+                        
+                        stats = await self.benchmark_render(render_once, rounds)
+                        lines.append(f"{label}：平均 {stats['avg_ms']:.0f}ms，图片 {sizes[-1] / 1024:.0f}KB")
+                    continue
+                
+                # 直接调用html_render，不计入渲染调度器的排队时间
+                stats = await self.benchmark_render(
+                    lambda: self.html_render(html_content, {}, True, dict(RENDER_LEGACY_OPTIONS)), rounds)
+                lines.append(f"html_render：平均 {stats['avg_ms']:.0f}ms，最慢 {stats['max_ms']:.0f}ms")
+                
+                if self.card_renderer.available:
+                    stats = await self.benchmark_render(
+                        lambda: self.card_renderer.render(command, template_data), rounds)
+                    lines.append(f"Pillow：平均 {stats['avg_ms']:.0f}ms，最慢 {stats['max_ms']:.0f}ms")
+                else:
+                    lines.append("Pillow：未安装Pillow或未找到中文字体")
+        except Exception as e:
+            logger.error(f"渲染基准测试时发生错误：{e}")
+            yield message.plain_result(f"渲染基准测试时发生错误：{str(e)}").use_t2i(False)
+            return
+        
+        yield message.plain_result("\n".join(lines)).use_t2i(False)
+
+    def named_caches(self) -> dict:
+        """参与命中率统计的缓存"""
+        return {
+            "上游接口": self.upstream.cache,
+            "内容审核": self.moderation.cache,
+            "天气": self.weather_cache,
+            "城际路线": self.route_cache,
+            "mc状态": self.mc_status_results,
+            "SRV解析": self.mc_status_client.srv_cache,
+        }
+
+    def metrics_text(self) -> str:
+        """Prometheus文本格式的全部指标：指令耗时直方图和错误计数，以及上游、熔断、缓存、渲染队列、对冲和供应商的当前状态"""
+        lines = [self.metrics.render().rstrip("\n")]
+        
+        def add(name, kind, samples):
+            if samples:
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(format_metric_line(name, labels, value) for labels, value in samples)
+        
+        upstream = self.upstream.stats()
+        for field in ("calls", "failures", "cache_hits", "stale_hits", "retries", "short_circuits"):
+            add(f"toolbox_upstream_{field}_total", "counter",
+                [({"endpoint": name}, stats[field]) for name, stats in upstream.items()])
+        add("toolbox_circuit_open", "gauge",
+            [({"host": host}, int(state["state"] != "closed")) for host, state in self.upstream.breaker_states().items()])
+        
+        caches = self.named_caches()
+        add("toolbox_cache_requests_total", "counter",
+            [({"cache": name, "result": "hit"}, cache.hits) for name, cache in caches.items()]
+            + [({"cache": name, "result": "miss"}, cache.misses) for name, cache in caches.items()])
+        add("toolbox_cache_entries", "gauge", [({"cache": name}, len(cache)) for name, cache in caches.items()])
+        
+        render = self.render_scheduler.stats()
+        add("toolbox_render_running", "gauge", [({}, render["running"])])
+        add("toolbox_render_queued", "gauge", [({}, render["queued"])])
+        add("toolbox_render_total", "counter", [({}, render["rendered"])])
+        add("toolbox_render_rejected_total", "counter", [({}, render["rejected"])])
+        
+        hedges = {"upstream": self.upstream.hedge.stats(), "mcs": self.mc_hedge.stats()}
+        add("toolbox_hedges_total", "counter", [({"target": name}, stats["total_hedges"]) for name, stats in hedges.items()])
+        
+        providers = [(query, provider) for query, chain in self.providers.stats().items() for provider in chain]
+        add("toolbox_provider_healthy", "gauge",
+            [({"query": query, "provider": provider["name"]}, int(provider["healthy"])) for query, provider in providers])
+        add("toolbox_provider_latency_ms", "gauge",
+            [({"query": query, "provider": provider["name"]}, provider["latency_ms"])
+             for query, provider in providers if provider["latency_ms"] is not None])
+        return "\n".join(line for line in lines if line) + "\n"
+
+    def status_report(self) -> str:
+        """工具箱状态指令的文字报告"""
+        lines = ["🔧 工具箱状态"]
+        
+        lines.append("\n【指令耗时】（ms，总耗时p50/p95，各阶段p50）")
+        commands = self.metrics.label_values("toolbox_command_seconds", "command")
+        for command in commands:
+            total = self.metrics.merged("toolbox_command_seconds", command=command)
+            phases = []
+            for phase, label in METRICS_PHASES.items():
+                histogram = self.metrics.merged("toolbox_phase_seconds", command=command, phase=phase)
+                if histogram.count:
+                    phases.append(f"{label}{histogram.percentile(0.5)}")
+            lines.append(f"{command}：{total.count}次，{total.percentile(0.5)}/{total.percentile(0.95)}ms"
+                         + (f"（{' '.join(phases)}）" if phases else ""))
+        if not commands:
+            lines.append("暂无数据")
+        
+        hosts = self.metrics.label_values("toolbox_phase_seconds", "host")
+        if hosts:
+            lines.append("\n【上游域名】（单次请求p50/p95）")
+            for host in hosts:
+                histogram = self.metrics.merged("toolbox_phase_seconds", phase="upstream", host=host)
+                lines.append(f"{host}：{histogram.count}次，{histogram.percentile(0.5)}/{histogram.percentile(0.95)}ms")
+        
+        upstream = self.upstream.stats()
+        if upstream:
+            lines.append("\n【上游接口】")
+            for name, stats in upstream.items():
+                lines.append(f"{name}：调用{stats['calls']} 失败{stats['failures']} 缓存{stats['cache_hits']} "
+                             f"过期缓存{stats['stale_hits']} 重试{stats['retries']} 熔断{stats['short_circuits']}")
+        for host, state in self.upstream.breaker_states().items():
+            if state["state"] != "closed":
+                lines.append(f"⚠️ {host} 熔断中（{state['state']}），约 {state['retry_after']} 秒后重试")
+        
+        lines.append("\n【缓存命中率】")
+        for name, cache in self.named_caches().items():
+            lookups = cache.hits + cache.misses
+            rate = f"{cache.hits / lookups:.0%}" if lookups else "-"
+            lines.append(f"{name}：{rate}（命中{cache.hits}/查询{lookups}，{len(cache)}条）")
+        
+        errors = sorted(
+            ((dict(labels), count) for (name, labels), count in self.metrics.counters.items()
+             if name == "toolbox_errors_total"),
+            key=lambda item: item[1], reverse=True,
+        )
+        if errors:
+            lines.append("\n【错误】")
+            for labels, count in errors[:10]:
+                lines.append(f"{labels['command']} / {labels['source']} / {labels['type']}：{count}次")
+        
+        render = self.render_scheduler.stats()
+        lines.append(f"\n【渲染队列】进行中{render['running']} 排队{render['queued']} 最深{render['max_depth']} "
+                     f"已渲染{render['rendered']} 拒绝{render['rejected']} 排队{render['wait_p50_ms']}/{render['wait_p95_ms']}ms")
+        
+        hedges = {"上游": self.upstream.hedge.stats(), "mcs": self.mc_hedge.stats()}
+        lines.append("【对冲】" + " ".join(
+            f"{name}：近期{stats['requests']}次请求补发{stats['hedges']}次，累计{stats['total_hedges']}次"
+            for name, stats in hedges.items()))
+        
+        lines.append("【供应商】")
+        for query, chain in self.providers.stats().items():
+            lines.append(f"{query}：" + " > ".join(
+                f"{provider['name']}{'' if provider['healthy'] else '（不健康）'}"
+                + (f" {provider['latency_ms']}ms" if provider["latency_ms"] is not None else "")
+                for provider in chain))
+        return "\n".join(lines)
+
+    async def start_metrics_server(self, port: int):
+        """在本机指定端口提供 /metrics，供Prometheus抓取"""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+        except OSError as e:
+            logger.error(f"指标端口 {port} 启动失败：{e}")
+            await runner.cleanup()
+            return
+        self.metrics_runner = runner
+        logger.info(f"工具箱指标端口已启动：http://127.0.0.1:{port}/metrics")
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.metrics_text(), content_type="text/plain", charset="utf-8")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("工具箱状态")
+    async def toolbox_status(self, message: AstrMessageEvent):
+        """查看各指令分阶段耗时、上游接口、缓存命中率和错误统计（管理员）"""
+        yield message.plain_result(self.status_report()).use_t2i(False)
+
     @filter.command("工具箱菜单")
+    @instrumented("工具箱菜单")
     async def toolbox_menu(self, message: AstrMessageEvent):
         """显示工具箱插件的所有可用命令"""
         menu_text = """🔧 工具箱插件菜单 🔧
@@ -4359,7 +5344,9 @@ class Main(Star):
 
 【游戏相关】
 🎮 战力查询 <英雄名> - 查询王者荣耀英雄战力，显示四个战区数据
-🌍 mcs <服务器地址> - 查询Minecraft服务器状态
+🌍 mcs <服务器地址> [服务器地址...] - 查询Minecraft服务器状态，多个地址合成状态板
+⭐ mc关注 / mc取消关注 <服务器地址> - 管理本群关注的Minecraft服务器
+📋 mc状态板 - 查看本群关注的所有Minecraft服务器
 
 【生活服务】
 🗺️ 路线查询 <出发地> <目的地> - 查询城际路线
@@ -4393,6 +5380,7 @@ AES加密 mykey Hello World
 AES解密 mykey <密文>
 天气 长沙
 mcs 121.com
+mcs 2b2t.org hypixel.net
 
 💡 所有命令支持群聊和私聊使用"""
         
@@ -4403,4 +5391,10 @@ mcs 121.com
 
     async def terminate(self):
         """插件卸载/重载时调用"""
-        pass
+        for task in list(self.background_tasks):
+            task.cancel()
+        await self.moderation.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        if self.http_session is not None:
+            await self.http_session.close()
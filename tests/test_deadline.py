@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("astrbot")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def test_reserve_keeps_fetch_budget_when_command_budget_is_small():
+    deadline = main.Deadline(6)
+    fetch_deadline = deadline.reserve(8)
+    assert not fetch_deadline.expired
+    assert 2.5 < fetch_deadline.remaining() <= 3
+
+
+def test_reserve_full_amount_when_budget_allows():
+    deadline = main.Deadline(40)
+    fetch_deadline = deadline.reserve(8)
+    assert 31.5 < fetch_deadline.remaining() <= 32
+
+
+class FakeResponse:
+    status = 503
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def text(self):
+        return "{}"
+
+
+class FakeSession:
+    def __init__(self):
+        self.timeouts = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout.total)
+        return FakeResponse()
+
+
+class FakeLog:
+    def log(self, *args, **kwargs):
+        pass
+
+
+def test_deadline_expiring_during_backoff_stops_retry():
+    session = FakeSession()
+    fetcher = main.UpstreamFetcher(lambda: session, FakeLog())
+    deadline = main.Deadline(5)
+
+    def backoff(attempt):
+        # 允许重试，但在退避等待期间让预算用完
+        asyncio.get_running_loop().call_later(0.01, setattr, deadline, "expires_at", 0)
+        return 0.05
+
+    fetcher.backoff = backoff
+    with pytest.raises(main.DeadlineExceeded):
+        asyncio.run(fetcher.fetch("天气", params={"city": "北京"}, deadline=deadline))
+    assert len(session.timeouts) == 1
+    assert all(timeout > 0 for timeout in session.timeouts)
+    assert fetcher.breaker_states()["uapis.cn"]["state"] == "closed"
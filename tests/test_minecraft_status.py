@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("astrbot")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+STATUS = {
+    "version": {"name": "1.20.4", "protocol": 765},
+    "players": {"online": 3, "max": 20},
+    "description": {"text": "§a测试服务器"},
+}
+
+
+async def read_packet(reader):
+    length = await main.read_varint(reader)
+    return await reader.readexactly(length)
+
+
+def make_handler(modern=True, legacy=True, stall=False):
+    """本地假服务器：按配置支持新版状态协议、旧版0xFE01 Ping，或接受连接后不应答"""
+    async def handle(reader, writer):
+        try:
+            if stall:
+                await asyncio.sleep(10)
+                return
+            first = await reader.readexactly(1)
+            if first == b"\xfe":
+                await reader.readexactly(1)
+                if not legacy:
+                    return
+                text = "§1\x00127\x001.6.4\x00旧版服务器\x005\x0010"
+                payload = text.encode("utf-16-be")
+                writer.write(b"\xff" + struct.pack(">H", len(payload) // 2) + payload)
+                await writer.drain()
+                return
+            if not modern:
+                return
+            # 握手包（首字节是长度，已读取）和状态请求包
+            await reader.readexactly(first[0])
+            await read_packet(reader)
+            body = json.dumps(STATUS).encode("utf-8")
+            writer.write(main.pack_mc_packet(0x00, main.encode_varint(len(body)) + body))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+
+async def query(handler, timeout=2):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        started = time.monotonic()
+        result = await main.MinecraftStatusClient(dns_server="127.0.0.1").status(f"127.0.0.1:{port}", timeout)
+        return result, time.monotonic() - started
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_modern_status():
+    result, _ = asyncio.run(query(make_handler()))
+    assert result["online"] is True
+    assert result["players"] == 3
+    assert result["max_players"] == 20
+    assert result["version"] == "1.20.4"
+    assert result["motd"] == "测试服务器"
+
+
+def test_legacy_fallback():
+    result, _ = asyncio.run(query(make_handler(modern=False)))
+    assert result["online"] is True
+    assert result["players"] == 5
+    assert result["max_players"] == 10
+    assert result["version"] == "1.6.4"
+    assert result["motd"] == "旧版服务器"
+
+
+def test_timeout_returns_offline_within_budget():
+    result, elapsed = asyncio.run(query(make_handler(stall=True), timeout=0.5))
+    assert result["online"] is False
+    assert elapsed < 1.0
+
+
+def test_invalid_address():
+    with pytest.raises(ValueError):
+        asyncio.run(main.MinecraftStatusClient(dns_server="127.0.0.1").status("host:abc", 1))